@@ -21,15 +21,15 @@ THE SOFTWARE.
 """
 
 import os, os.path, logging
-from time import sleep
-from sikuli.Sikuli import SCREEN, openApp
 from sikuli.Region import Region
 from sikuli.Key import Key, KEY_ALT
 from sikuliimport.projects import IMG_INSTALLER_WELCOME
 from seagull.window import AnchoredWindow
 from seagull.buttons import Buttons
 from seagull.checkboxes import VerticalCheckboxList
-from seagull.util import Wait
+from seagull.clock import sleep
+from seagull.tracing import traceMethods
+from seagull.util import openApp, RegionWatcher, typeKeys, Wait
 from seagull.images import IMG_BUTTONS, IMG_BUTTONS_DISABLED, IMG_CHECKBOXES
 
 _LOGGER = logging.getLogger(__name__)
@@ -169,7 +169,7 @@ class Installer(AnchoredWindow):
         self._ensure_button('Next')
         self._ensure_button_enabled('Next')
         self.setFocus()
-        SCREEN.type('n', KEY_ALT)
+        typeKeys('n', KEY_ALT)
         sleep(1)
         self.page += 1
         self.buttons_valid = False
@@ -196,7 +196,7 @@ class Installer(AnchoredWindow):
         self._ensure_button('Back')
         self._ensure_button_enabled('Back')
         self.setFocus()
-        SCREEN.type('b', KEY_ALT)
+        typeKeys('b', KEY_ALT)
         sleep(1)
         self.page -= 1
         self.buttons_valid = False
@@ -225,9 +225,9 @@ class Installer(AnchoredWindow):
         self._ensure_button('Cancel')
         self._ensure_button_enabled('Cancel')
         self.setFocus()
-        SCREEN.type(Key.ESC)
+        typeKeys(Key.ESC)
         sleep(1)
-        SCREEN.type('y')
+        typeKeys('y')
         sleep(1)
         self.page = self.cancelled_page
         self.installing = False
@@ -249,7 +249,7 @@ class Installer(AnchoredWindow):
         self._ensure_button('Finish')
         _LOGGER.info('closing installer')
         self.setFocus()
-        SCREEN.type('f', KEY_ALT)
+        typeKeys('f', KEY_ALT)
         sleep(1)
         self.running = False
 
@@ -275,7 +275,7 @@ class Installer(AnchoredWindow):
         self._ensure(running = True)
         self._ensure_button('Install')
         self.setFocus()
-        SCREEN.type('i', KEY_ALT)
+        typeKeys('i', KEY_ALT)
         sleep(1)
         self.page = self.installing_page
         self.installing = True
@@ -365,16 +365,18 @@ class Installer(AnchoredWindow):
 
     def wait_until_finished(self, timeout = INSTALL_TIME_MAX_SECONDS):
         """Waits until the installer finishes installing.
-           Checks every 3 seconds if the Finish button exists.
+           Checks every 3 seconds if the Finish button exists, or whenever the
+           button region has changed if waits are change-driven.
            Raises Exception if the installer is not finished after the
            specified timeout.
         """
         self._ensure(running = True, installing = True)
-        waiting = Wait(timeout, interval = 3,
+        watcher = RegionWatcher(self.button_region)
+        waiting = Wait(timeout, interval = watcher.getPollInterval(3),
                 exception_message = 'installer not finished after %f seconds' %
                 timeout)
         while not self.is_finished():
-            waiting.wait()
+            watcher.waitForChange(waiting)
         _LOGGER.info('finished')
 
     def is_running(self):
@@ -407,3 +409,10 @@ class Installer(AnchoredWindow):
         self.install()
         self.wait_until_finished()
         self.finish()
+
+# record a span for each installer step if tracing is enabled
+traceMethods(Installer, ['run', 'next', 'next_key', 'back', 'back_key',
+        'cancel', 'cancel_key', 'finish', 'finish_key', 'install',
+        'install_key', 'close', 'confirm_cancel', 'configure_desktop_shortcut',
+        'configure_start_menu_shortcut', 'configure_quick_launch_shortcut',
+        'wait_until_finished', 'defaultInstallation'], 'installer')
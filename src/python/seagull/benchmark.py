@@ -0,0 +1,337 @@
+"""
+Copyright (c) 2010 Karl-Michael Schneider
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from __future__ import absolute_import
+import logging, math, optparse, os, random, shutil, sys, tempfile
+from java.awt import Color
+from java.awt.image import BufferedImage
+from java.lang import System
+from sikuli.Region import Region
+from seagull import frame, util
+from seagull.buttons import Buttons
+from seagull.checkboxes import Checkable
+from seagull.jsonformat import toJSON
+from seagull.pixels import loadImage, saveImage
+from seagull.replay import installReplay, uninstallReplay
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_SIZES = [(800, 600), (1280, 1024), (1920, 1080)]
+DEFAULT_TEMPLATE_COUNTS = [1, 4, 16]
+
+def _now():
+    """Returns real time in seconds, even if seagull runs on a virtual
+       clock.
+    """
+    return System.nanoTime() / 1e9
+
+def _percentile(ordered, fraction):
+    """Returns the value at the specified fraction of a sorted list, using
+       the nearest rank.
+    """
+    rank = int(math.ceil(fraction * len(ordered))) - 1
+    return ordered[max(0, min(rank, len(ordered) - 1))]
+
+def summarize(latencies):
+    """Returns a dictionary with the count, mean, minimum, median, 90th and
+       99th percentile and maximum of a list of latencies (in seconds), and
+       the throughput (calls per second).
+    """
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    if total > 0:
+        throughput = len(ordered) / total
+    else:
+        throughput = 0.0
+    return {
+        'count' : len(ordered),
+        'mean' : total / len(ordered),
+        'min' : ordered[0],
+        'p50' : _percentile(ordered, 0.5),
+        'p90' : _percentile(ordered, 0.9),
+        'p99' : _percentile(ordered, 0.99),
+        'max' : ordered[-1],
+        'throughput' : throughput,
+    }
+
+def measure(function, repeat = 20, warmup = 2):
+    """Calls function warmup times, then repeat times, and returns a list of
+       the latencies (in seconds) of the measured calls.
+    """
+    for i in range(warmup):
+        function()
+    latencies = []
+    for i in range(repeat):
+        start = _now()
+        function()
+        latencies.append(_now() - start)
+    return latencies
+
+def _listImages(directory):
+    """Returns the PNG files in a directory, sorted by name."""
+    if not os.path.isdir(directory):
+        return []
+    names = [name for name in os.listdir(directory)
+            if name.lower().endswith('.png')]
+    names.sort()
+    return [os.path.join(directory, name) for name in names]
+
+def _listGroups(directory):
+    """Returns a dictionary that maps each subdirectory name to the PNG files
+       in that subdirectory.
+    """
+    groups = {}
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            images = _listImages(os.path.join(directory, name))
+            if images:
+                groups[name] = images
+    return groups
+
+def _resizeScreen(image, w, h):
+    """Returns the screenshot padded (with the color of its top-left pixel)
+       or cropped to w x h pixels.
+    """
+    canvas = BufferedImage(w, h, BufferedImage.TYPE_INT_RGB)
+    graphics = canvas.createGraphics()
+    try:
+        graphics.setColor(Color(image.getRGB(0, 0)))
+        graphics.fillRect(0, 0, w, h)
+        graphics.drawImage(image, 0, 0, None)
+    finally:
+        graphics.dispose()
+    return canvas
+
+def _repeatTo(images, count):
+    """Returns a list of count images, repeating images if necessary."""
+    return [images[i % len(images)] for i in range(count)]
+
+def _randomRegions(count, w, h, seed = 1):
+    """Returns count random small regions in a w x h screen."""
+    generator = random.Random(seed)
+    regions = []
+    for i in range(count):
+        rw, rh = generator.randint(10, 60), generator.randint(10, 30)
+        regions.append(Region(generator.randint(0, w - rw),
+                generator.randint(0, h - rh), rw, rh))
+    # add duplicates for getUniqueRegions
+    regions.extend(regions[:count / 4])
+    return regions
+
+class Benchmark:
+    """Measures the latency distribution and throughput of seagull's search
+       primitives on a corpus of recorded screenshots. The benchmarks run on
+       the replay backend (see seagull.replay), so they need no live desktop.
+       The corpus is a directory with one subdirectory per case:
+
+       <case>/screen.png                     the screenshot
+       <case>/templates/*.png                images for find, findAny,
+                                             getAllMatches and bestMatches
+       <case>/buttons/<name>/*.png           images of enabled buttons
+                                             (optional)
+       <case>/buttons-disabled/<name>/*.png  images of disabled buttons
+                                             (optional)
+       <case>/checked/*.png                  images of checked elements
+                                             (optional)
+       <case>/unchecked/*.png                images of unchecked elements
+                                             (optional)
+
+       Each case runs at several screen sizes (the screenshot is padded or
+       cropped) and template counts (the templates are repeated or
+       truncated).
+
+       sample/benchmark contains a small corpus built from the images in
+       sample/installerimages.sikuli, with a screenshot of the installer's
+       welcome page. To run it, put sikuli-script.jar on the class path and
+       run from the src/python directory:
+
+       jython -m seagull.benchmark sample/benchmark results.json
+    """
+
+    def __init__(self, corpus, sizes = None, template_counts = None,
+            repeat = 20, warmup = 2):
+        self.corpus = corpus
+        if sizes is None:
+            sizes = DEFAULT_SIZES
+        self.sizes = sizes
+        if template_counts is None:
+            template_counts = DEFAULT_TEMPLATE_COUNTS
+        self.template_counts = template_counts
+        self.repeat = repeat
+        self.warmup = warmup
+        self.results = []
+        self.failures = []
+
+    def run(self):
+        """Runs all benchmarks and returns a dictionary with the settings,
+           the results and the failures, which toJSON() converts to the
+           output format.
+        """
+        cases = [name for name in os.listdir(self.corpus)
+                if os.path.isfile(os.path.join(self.corpus, name,
+                'screen.png'))]
+        cases.sort()
+        for case in cases:
+            for w, h in self.sizes:
+                self._runCase(case, w, h)
+        return {
+            'corpus' : self.corpus,
+            'repeat' : self.repeat,
+            'warmup' : self.warmup,
+            'settings' : {
+                'single_capture' : util.getSingleCapture(),
+                'match_workers' : util.getMatchWorkers(),
+                'frame_cache_ttl' : frame.getFrameCacheTTL(),
+                'default_matcher' : frame.isDefaultMatcher(),
+                'position_hints' : util.getPositionHints(),
+                'hash_prefilter' : util.getHashPrefilter(),
+            },
+            'results' : self.results,
+            'failures' : self.failures,
+        }
+
+    def _runCase(self, case, w, h):
+        directory = os.path.join(self.corpus, case)
+        screenshots = tempfile.mkdtemp(prefix = 'seagull-benchmark-')
+        try:
+            screen = _resizeScreen(loadImage(os.path.join(directory,
+                    'screen.png')), w, h)
+            saveImage(screen, os.path.join(screenshots, '0.png'))
+            installReplay(screenshots)
+            try:
+                self._runPrimitives(case, directory, w, h)
+            finally:
+                uninstallReplay()
+        finally:
+            shutil.rmtree(screenshots, True)
+
+    def _record(self, case, w, h, count, primitive, function):
+        _LOGGER.info('%s %dx%d %d templates: %s', case, w, h, count,
+                primitive)
+        key = { 'case' : case, 'screen' : [w, h], 'templates' : count,
+                'primitive' : primitive }
+        try:
+            latencies = measure(function, self.repeat, self.warmup)
+        except Exception, e:
+            _LOGGER.exception('%s failed', primitive)
+            failure = dict(key)
+            failure['error'] = str(e)
+            self.failures.append(failure)
+            return
+        result = dict(key)
+        result.update(summarize(latencies))
+        self.results.append(result)
+
+    def _runPrimitives(self, case, directory, w, h):
+        region = Region(0, 0, w, h)
+        templates = _listImages(os.path.join(directory, 'templates'))
+        for count in self.template_counts:
+            if templates:
+                images = _repeatTo(templates, count)
+                self._record(case, w, h, count, 'find', lambda: util.find(
+                        images[0], region = region, timeout = 0,
+                        exception = False))
+                self._record(case, w, h, count, 'findAny',
+                        lambda: util.findAny(images, region = region,
+                        timeout = 0, exception = False))
+                self._record(case, w, h, count, 'getAllMatches',
+                        lambda: util.getAllMatches(images, region = region,
+                        timeout = 0))
+                self._record(case, w, h, count, 'bestMatches',
+                        lambda: util.bestMatches(images, region = region))
+            regions = _randomRegions(count * 10, w, h)
+            self._record(case, w, h, count, 'getUniqueRegions',
+                    lambda: util.getUniqueRegions(regions))
+            self._record(case, w, h, count, 'sortRegions',
+                    lambda: util.sortRegions(list(regions)))
+        self._runButtons(case, directory, w, h, region)
+        self._runCheckable(case, directory, w, h, region)
+
+    def _runButtons(self, case, directory, w, h, region):
+        buttons = _listGroups(os.path.join(directory, 'buttons'))
+        if not buttons:
+            return
+        disabled = _listGroups(os.path.join(directory, 'buttons-disabled'))
+        count = sum([len(images) for images in buttons.values()]) + \
+                sum([len(images) for images in disabled.values()])
+        name = min(buttons.keys())
+        states = buttons[name] + disabled.get(name, [])
+        self._record(case, w, h, len(states), 'bestMatch',
+                lambda: util.bestMatch(states, region = region))
+        button_set = Buttons(buttons, disabled, region = region)
+        self._record(case, w, h, count, 'Buttons.find_buttons',
+                button_set.find_buttons)
+        self._record(case, w, h, count, 'Buttons.update_buttons',
+                button_set.update_buttons)
+
+    def _runCheckable(self, case, directory, w, h, region):
+        checked = _listImages(os.path.join(directory, 'checked'))
+        unchecked = _listImages(os.path.join(directory, 'unchecked'))
+        if not checked or not unchecked:
+            return
+        count = len(checked) + len(unchecked)
+        elements = Checkable({ 'checked' : checked, 'unchecked' : unchecked },
+                region = region)
+        self._record(case, w, h, count, 'Checkable.find_elements',
+                elements.find_elements)
+        self._record(case, w, h, count, 'Checkable.update_element',
+                lambda: elements.update_element(0))
+
+def main(args):
+    """Runs the benchmarks with command line arguments and writes the results
+       as JSON to the output file, or to stdout. Run this module with --help
+       for the arguments.
+    """
+    parser = optparse.OptionParser(usage = 'usage: %prog [options] corpus [output]')
+    parser.add_option('--repeat', type = 'int', default = 20,
+            help = 'measured calls per primitive (default 20)')
+    parser.add_option('--warmup', type = 'int', default = 2,
+            help = 'unmeasured calls per primitive (default 2)')
+    parser.add_option('--sizes', default = None,
+            help = 'screen sizes, e.g. 800x600,1920x1080')
+    parser.add_option('--templates', default = None,
+            help = 'template counts, e.g. 1,4,16')
+    options, arguments = parser.parse_args(args)
+    if len(arguments) not in (1, 2):
+        parser.error('corpus directory expected')
+    sizes = None
+    if options.sizes:
+        sizes = [tuple([int(n) for n in size.split('x')])
+                for size in options.sizes.split(',')]
+    counts = None
+    if options.templates:
+        counts = [int(n) for n in options.templates.split(',')]
+    benchmark = Benchmark(arguments[0], sizes, counts, options.repeat,
+            options.warmup)
+    output = toJSON(benchmark.run()) + '\n'
+    if len(arguments) == 2:
+        f = open(arguments[1], 'w')
+        try:
+            f.write(output)
+        finally:
+            f.close()
+    else:
+        sys.stdout.write(output)
+
+if __name__ == '__main__':
+    logging.basicConfig(level = logging.INFO)
+    main(sys.argv[1:])
@@ -23,7 +23,14 @@ THE SOFTWARE.
 import logging
 from sikuli.Sikuli import SCREEN
 from sikuli.Region import Region
-from seagull.util import bestMatches, bestMatch, NO_MODIFIER, Wait
+from seagull.frame import captureFrame
+from seagull import metrics, tracing
+from seagull.imagehash import filterImages
+from seagull.signatures import PixelSignature
+from seagull.util import asyncWaitUntil, bestMatches, bestMatch, click, \
+        countFailure, findInFrames, getHashPrefilter, observeWait, \
+        RegionWatcher, selectBestMatch, selectBestMatches, TimeoutExceeded, \
+        Wait
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -36,7 +43,7 @@ class Buttons:
     """
 
     def __init__(self, buttons, disabled_buttons = None, region = SCREEN,
-            name = None):
+            name = None, use_signatures = False):
         """Creates a new instance.
            Buttons is a dictionary object where each key is a button name and
            the value is a list of images of the specified button.
@@ -48,12 +55,22 @@ class Buttons:
            Each button can exist only once in the region. If the same button is
            found twice, whether enabled or disabled, Exception is raised.
            The name is only used in log messages.
+           If use_signatures is True, a pixel signature (see
+           seagull.signatures) of each button state is recorded when a button
+           is found in that state. Updating a button then compares the pixels
+           at the button's location with the recorded signatures, and only
+           searches the button images if they do not match exactly one state.
         """
         self._buttons = buttons
         self._disabled_buttons = disabled_buttons
         self._region = region
         self._name = name
         self._button_matches = None
+        self._use_signatures = use_signatures
+        # _signatures[name][disabled] is a tuple (signature, i) where i is the
+        # index in _button_images of the image that was found when the
+        # signature was recorded
+        self._signatures = {}
         if name is not None:
             self._debugprefix = '[%s] ' % name
         else:
@@ -97,9 +114,28 @@ class Buttons:
     def find_buttons(self):
         """Finds all buttons in the region.
         """
+        span = tracing.begin('find_buttons', 'search',
+                {'images' : len(self._button_images)})
+        try:
+            self._find_buttons()
+        finally:
+            tracing.end(span)
+
+    def _find_buttons(self):
+        """Implements find_buttons().
+        """
         # list of (i, match) tuples where match is a match of _button_images[i]
-        matches = bestMatches(self._button_images, region = self._region,
-                minOverlap = 0.5)
+        if self._use_signatures:
+            # signatures must be taken from the pixels the buttons were found
+            # in, so all images are searched in one capture
+            frame = captureFrame(self._region)
+            matches = selectBestMatches(findInFrames(
+                    [(image, frame) for image in self._button_images]),
+                    minOverlap = 0.5,
+                    exception = self._region.getThrowException())
+        else:
+            matches = bestMatches(self._button_images, region = self._region,
+                    minOverlap = 0.5)
         _LOGGER.info('%sfound %d buttons', self._debugprefix, len(matches))
 
         # index matches by name
@@ -119,6 +155,9 @@ class Buttons:
         if len(duplicate_names) > 0:
             raise Exception("found duplicate buttons: %s" %
                     (', '.join(duplicate_names)))
+        if self._use_signatures:
+            for name in self._button_matches:
+                self._record_signature(name, frame)
 
     def button_count(self):
         """Returns the number of buttons that were found in the region.
@@ -164,15 +203,111 @@ class Buttons:
         """
         _LOGGER.debug("%sgetting current state of '%s' button",
                 self._debugprefix, name)
+        if not self._use_signatures:
+            i_best, m_best = bestMatch(self._button_state_images(name),
+                    region = self._button_search_region(name),
+                    minOverlap = 0.5)
+            self._set_button_state(name, i_best, m_best)
+            return
+        frame = captureFrame(self._button_search_region(name))
+        if self._classify_button(name, frame):
+            return
+        images = self._button_state_images(name)
+        candidates = self._candidate_states(name, frame)
+        found = findInFrames([(images[i], frame) for i in candidates])
+        matches = [None] * len(images)
+        for i, match in zip(candidates, found):
+            matches[i] = match
+        i_best, m_best = selectBestMatch(matches, minOverlap = 0.5)
+        self._set_button_state(name, i_best, m_best)
+        self._record_signature(name, frame)
+
+    def _classify_button(self, name, frame):
+        """Sets the state of the specified button by comparing the pixels at
+           its known location in the frame with the recorded signatures.
+           Returns True if the pixels match the signature of exactly one state,
+           else returns False and leaves the button unchanged.
+        """
+        known = self._signatures.get(name)
+        if not known:
+            return False
         i, match = self._button_matches[name]
-        button_region = Region(match).nearby(15)
+        subframe = frame.crop(match.getX(), match.getY(), match.getW(),
+                match.getH())
+        if subframe is None:
+            return False
+        signature = PixelSignature(subframe.getImage())
+        states = [disabled for disabled, (known_signature, i_known)
+                in known.iteritems() if signature.matches(known_signature)]
+        if len(states) != 1:
+            return False
+        i_known = known[states[0]][1]
+        self._button_matches[name] = (i_known, match)
+        if states[0]:
+            state = 'disabled'
+        else:
+            state = 'enabled'
+        _LOGGER.info("'%s' button is %s (signature)", name, state)
+        return True
+
+    def _candidate_states(self, name, frame):
+        """Returns the indexes in _button_state_images(name) of the images
+           that are searched to update the specified button. If the hash
+           prefilter is enabled (see seagull.util.setHashPrefilter), images
+           whose hash does not match the pixels at the button's known location
+           in the frame are left out, unless that would leave out all images.
+        """
+        images = self._button_state_images(name)
+        maxdistance = getHashPrefilter()
+        if maxdistance is None:
+            return range(len(images))
+        i, match = self._button_matches[name]
+        subframe = frame.crop(match.getX(), match.getY(), match.getW(),
+                match.getH())
+        if subframe is None:
+            return range(len(images))
+        candidates = filterImages(images, subframe.getImage(), maxdistance)
+        if len(candidates) == 0:
+            return range(len(images))
+        return candidates
+
+    def _record_signature(self, name, frame):
+        """Records the signature of the current state of the specified button
+           from the pixels of its match in the frame.
+        """
+        i, match = self._button_matches[name]
+        subframe = frame.crop(match.getX(), match.getY(), match.getW(),
+                match.getH())
+        if subframe is None:
+            return
+        signature = PixelSignature(subframe.getImage())
+        self._signatures.setdefault(name, {})[self._button_disabled[i]] = \
+                (signature, i)
+        _LOGGER.debug("%s'%s' button: %s", self._debugprefix, name,
+                str(signature))
+
+    def _button_search_region(self, name):
+        """Returns the region in which the images of the specified button are
+           searched to update its state.
+        """
+        i, match = self._button_matches[name]
+        return Region(match).nearby(15)
+
+    def _button_state_images(self, name):
+        """Returns a list of the images of the enabled button, followed by the
+           images of the disabled button.
+        """
         images = []
         images.extend(self._buttons[name])
         if self._disabled_buttons is not None and \
                 name in self._disabled_buttons:
             images.extend(self._disabled_buttons[name])
-        i_best, m_best = bestMatch(images, region = button_region,
-                minOverlap = 0.5)
+        return images
+
+    def _set_button_state(self, name, i_best, m_best):
+        """Sets the state of the specified button from the best match of its
+           images, where i_best is an index in _button_state_images(name).
+        """
         disabled = i_best >= len(self._buttons[name])
         if disabled:
             _LOGGER.info("'%s' button (image %d) is disabled",
@@ -187,9 +322,50 @@ class Buttons:
 
     def update_buttons(self):
         """Updates all buttons.
+           The union of the regions around all buttons is captured once, and
+           the images of all buttons are searched in that capture (all at once
+           if there is more than one match worker, see
+           seagull.util.setMatchWorkers).
         """
-        for name in self.button_names():
-            self.update_button(name)
+        names = self.button_names()
+        if len(names) == 0:
+            return
+        _LOGGER.debug('%sgetting current state of all buttons',
+                self._debugprefix)
+        rects = {}
+        for name in names:
+            region = self._button_search_region(name)
+            rects[name] = (region.getX(), region.getY(), region.getW(),
+                    region.getH())
+        x0 = min([x for x, y, w, h in rects.values()])
+        y0 = min([y for x, y, w, h in rects.values()])
+        x1 = max([x + w for x, y, w, h in rects.values()])
+        y1 = max([y + h for x, y, w, h in rects.values()])
+        frame = captureFrame(Region(x0, y0, x1 - x0, y1 - y0))
+        if self._use_signatures:
+            names = [name for name in names
+                    if not self._classify_button(name, frame)]
+        searches = []
+        candidates = {}
+        for name in names:
+            x, y, w, h = rects[name]
+            subframe = frame.crop(x, y, w, h)
+            images = self._button_state_images(name)
+            candidates[name] = self._candidate_states(name, frame)
+            for i in candidates[name]:
+                searches.append((images[i], subframe))
+        found = findInFrames(searches)
+        start = 0
+        for name in names:
+            end = start + len(candidates[name])
+            matches = [None] * len(self._button_state_images(name))
+            for i, match in zip(candidates[name], found[start:end]):
+                matches[i] = match
+            i_best, m_best = selectBestMatch(matches, minOverlap = 0.5)
+            self._set_button_state(name, i_best, m_best)
+            if self._use_signatures:
+                self._record_signature(name, frame)
+            start = end
 
     def waitUntilButtonIsEnabled(self, name, timeout):
         """Waits until the specified button is no longer disabled.
@@ -202,13 +378,27 @@ class Buttons:
         else:
             _LOGGER.info("%swaiting for '%s' button to be enabled, timeout set to %f seconds",
                     self._debugprefix, name, timeout)
-        waiting = Wait(timeout,
+        start = metrics.now()
+        span = tracing.begin("waitUntilButtonIsEnabled '%s'" % name, 'wait')
+        i, match = self._button_matches[name]
+        watcher = RegionWatcher(Region(match).nearby(15))
+        waiting = Wait(timeout, interval = watcher.getPollInterval(1),
                 exception_message =
                 "'%s' button still disabled after %f seconds" %
                 (name, timeout))
-        while not self.is_button_enabled(name):
-            waiting.wait()
+        try:
+            # the watcher only sees changes after its first capture, so the
+            # cached state must not be older than that capture
             self.update_button(name)
+            while not self.is_button_enabled(name):
+                watcher.waitForChange(waiting)
+                self.update_button(name)
+        except TimeoutExceeded:
+            countFailure('TimeoutExceeded', 'waitUntilButtonIsEnabled')
+            raise
+        finally:
+            observeWait('waitUntilButtonIsEnabled', start)
+            tracing.end(span)
 
     def waitUntilAllButtonsEnabled(self, timeout):
         """Waits until none of the buttons is disabled.
@@ -221,16 +411,56 @@ class Buttons:
         else:
             _LOGGER.info('%swaiting until all buttons are enabled, timeout set to %f seconds',
                     self._debugprefix, timeout)
-        waiting = Wait(timeout,
+        start = metrics.now()
+        span = tracing.begin('waitUntilAllButtonsEnabled', 'wait')
+        watcher = RegionWatcher(self._region)
+        waiting = Wait(timeout, interval = watcher.getPollInterval(1),
                 exception_message =
                 'some button still disabled after %f seconds' % timeout)
-        while not self.all_buttons_enabled():
-            waiting.wait()
+        try:
             self.update_buttons()
+            while not self.all_buttons_enabled():
+                watcher.waitForChange(waiting)
+                self.update_buttons()
+        except TimeoutExceeded:
+            countFailure('TimeoutExceeded', 'waitUntilAllButtonsEnabled')
+            raise
+        finally:
+            observeWait('waitUntilAllButtonsEnabled', start)
+            tracing.end(span)
+
+    def asyncWaitUntilButtonIsEnabled(self, name, timeout):
+        """Waits in the background until the specified button is no longer
+           disabled, and returns a seagull.scheduler.AsyncResult.
+           AsyncResult.get() raises Exception if the button is still disabled
+           after the specified timeout.
+        """
+        _LOGGER.info("%swaiting in the background for '%s' button to be enabled",
+                self._debugprefix, name)
+        i, match = self._button_matches[name]
+        return asyncWaitUntil(lambda: self.is_button_enabled(name),
+                Region(match).nearby(15), timeout, exception_message =
+                "'%s' button still disabled after %s seconds" %
+                (name, str(timeout)),
+                update = lambda: self.update_button(name),
+                update_first = True)
+
+    def asyncWaitUntilAllButtonsEnabled(self, timeout):
+        """Waits in the background until none of the buttons is disabled,
+           and returns a seagull.scheduler.AsyncResult.
+           AsyncResult.get() raises Exception if some button is still disabled
+           after the specified timeout.
+        """
+        _LOGGER.info('%swaiting in the background until all buttons are enabled',
+                self._debugprefix)
+        return asyncWaitUntil(self.all_buttons_enabled, self._region, timeout,
+                exception_message =
+                'some button still disabled after %s seconds' % str(timeout),
+                update = self.update_buttons, update_first = True)
 
     def click(self, name):
         """Clicks the specified button.
         """
         i, match = self._button_matches[name]
         _LOGGER.info("%sclick '%s': %s", self._debugprefix, name, str(match))
-        SCREEN.click(match, NO_MODIFIER)
+        click(match, region = SCREEN)
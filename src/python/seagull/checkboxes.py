@@ -23,8 +23,16 @@ THE SOFTWARE.
 import operator, logging
 from sikuli.Sikuli import SCREEN, FindFailed
 from sikuli.Region import Region
-from seagull.util import bestMatch, click, extendRegion, getUniqueRegions, \
-        REGION_SORT_HORIZONTAL, sameRegion, setTimeout, sortRegions, Wait
+from seagull import metrics, tracing
+from seagull.frame import captureFrame
+from seagull.matchers import getTemplate
+from seagull.regionindex import regionRect, RegionIndex
+from seagull.signatures import StateProbe
+from seagull.templates import loadTemplate
+from seagull.util import asyncWaitUntil, bestMatch, click, countFailure, \
+        extendRegion, findInFrames, getAllMatchLists, getUniqueRegions, \
+        observeWait, REGION_SORT_HORIZONTAL, RegionWatcher, sortRegions, \
+        TimeoutExceeded, Wait
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -38,7 +46,7 @@ class Checkable:
     """
 
     def __init__(self, images, region = SCREEN, orientation = 0,
-            radio = False, auto_verify = False, timeout = 3):
+            radio = False, auto_verify = False, timeout = 3, probe = False):
         """Creates a new list of checkboxes or radio buttons.
            Images must be a dictionary with two keys, 'checked' and
            'unchecked'. The value for 'checked' must be a list of images of
@@ -54,6 +62,11 @@ class Checkable:
            it will wait until the element is actually checked. If the element
            is still not changed after the timeout, the method will raise an
            Exception.
+           If probe is True, find_elements() learns which pixels discriminate
+           checked from unchecked elements (see seagull.signatures.StateProbe),
+           and updating an element decides its state by sampling those pixels
+           at the element's location. The images are only searched if the
+           pixels do not clearly indicate one state.
            Images are not actually searched when the list is created.
            You must call find_elements() to search the elements in the region.
         """
@@ -63,6 +76,8 @@ class Checkable:
         self.radio = radio
         self.auto_verify = auto_verify
         self.timeout = timeout
+        self.probe = probe
+        self._probe = None
         if self.radio:
             self.element_type = 'radio button'
             self.element_types = 'radio buttons'
@@ -75,7 +90,8 @@ class Checkable:
 
     def find_elements(self, timeout = 0):
         """Finds the elements of this list in the region.
-           Each image is searched for no more than timeout seconds.
+           Images that are not found are searched again until timeout seconds
+           have passed.
            If timeout is None, the default wait time of the region is used.
            Raises FindFailed if no elements can be found.
         """
@@ -101,21 +117,17 @@ class Checkable:
         self.element_regions = []
         checked_region_scores = {}
         unchecked_region_scores = {}
-        if timeout is not None:
-            t = setTimeout(self.region, timeout)
-        for state in ['checked', 'unchecked']:
-            for image in self.images[state]:
-                try:
-                    matches = self.region.findAll(image)
-                    if matches is not None:
-                        for match in getUniqueRegions(matches):
-                            self._add_match(match, state, self.element_regions,
-                                    checked_region_scores,
-                                    unchecked_region_scores)
-                except FindFailed:
-                    pass
-        if timeout is not None:
-            setTimeout(self.region, t)
+        images = list(self.images['checked']) + list(self.images['unchecked'])
+        states = ['checked'] * len(self.images['checked']) + \
+                ['unchecked'] * len(self.images['unchecked'])
+        matchlists = getAllMatchLists(images, region = self.region,
+                timeout = timeout)
+        # index of element_regions, ids are list indexes
+        index = RegionIndex()
+        for state, matches in zip(states, matchlists):
+            for match in getUniqueRegions(matches):
+                self._add_match(match, state, self.element_regions, index,
+                        checked_region_scores, unchecked_region_scores)
         if len(self.element_regions) == 0:
             raise FindFailed('no %s were found' % self.element_types)
         sortRegions(self.element_regions, self.orientation)
@@ -126,23 +138,25 @@ class Checkable:
                 for region in self.element_regions]
         _LOGGER.info('found %d %s, %s checked', self.length(),
                 self.element_types, str(self.checked_elements()))
+        if self.probe:
+            self._learn_probe()
         if self.radio:
             if len(self.checked_elements()) > 1:
                 raise Exception('found %d checked elements, violates radio=True parameter')
 
-    def _add_match(self, match, state, regions, checked_region_scores,
+    def _add_match(self, match, state, regions, index, checked_region_scores,
             unchecked_region_scores):
         """Find the region in regions that is similar to the match. Update the
            score for that region. If there is no similar region, create a new
            region from the match.
+           index is a RegionIndex of regions.
         """
-        match_region = None
-        for region in regions:
-            if sameRegion(region, match, 0.5):
-                match_region = region
-                break
-        if match_region is None:
+        i_region = index.findSame(regionRect(match), 0.5)
+        if i_region is not None:
+            match_region = regions[i_region]
+        else:
             match_region = Region(match)
+            index.add(regionRect(match_region))
             regions.append(match_region)
         region_id = self._region_id(match_region)
         if region_id not in checked_region_scores:
@@ -156,6 +170,71 @@ class Checkable:
             if match.getScore() > unchecked_region_scores[region_id]:
                 unchecked_region_scores[region_id] = match.getScore()
 
+    def _learn_probe(self):
+        """Learns the pixels that discriminate checked from unchecked
+           elements from the images and from the elements that were found.
+           If no such pixels are found, elements are updated by searching the
+           images.
+        """
+        checked = [loadTemplate(getTemplate(image)[0]).image
+                for image in self.images['checked']]
+        unchecked = [loadTemplate(getTemplate(image)[0]).image
+                for image in self.images['unchecked']]
+        frame = captureFrame(self.region)
+        for element_index, region in enumerate(self.element_regions):
+            subframe = frame.crop(region.getX(), region.getY(), region.getW(),
+                    region.getH())
+            if subframe is None:
+                continue
+            # the state found by find_elements may come from an earlier
+            # capture, so the element is labeled with its state in this frame
+            is_checked = self._frame_state(element_index, frame)
+            if is_checked is None:
+                continue
+            if is_checked:
+                checked.append(subframe.getImage())
+            else:
+                unchecked.append(subframe.getImage())
+        probe = StateProbe(checked, unchecked)
+        if probe.isUsable():
+            self._probe = probe
+            _LOGGER.debug('learned %s for %s', str(probe), self.element_types)
+        else:
+            self._probe = None
+            _LOGGER.debug('no discriminating pixels found for %s',
+                    self.element_types)
+
+    def _frame_state(self, element_index, frame):
+        """Searches the images of the specified element in the frame and
+           returns True if it is checked, False if it is unchecked, or None if
+           neither state has a better match.
+        """
+        search = self._element_search_region(element_index)
+        subframe = frame.crop(search.getX(), search.getY(), search.getW(),
+                search.getH())
+        if subframe is None:
+            return None
+        images = list(self.images['checked']) + list(self.images['unchecked'])
+        matches = findInFrames([(image, subframe) for image in images])
+        ncheckedimages = len(self.images['checked'])
+        scores = [0, 0]
+        for i, match in enumerate(matches):
+            if match is not None:
+                state = int(i < ncheckedimages)
+                scores[state] = max(scores[state], match.getScore())
+        if scores[0] == scores[1]:
+            return None
+        return scores[1] > scores[0]
+
+    def _probe_element(self, element_index):
+        """Returns True if the probe finds that the specified element is
+           checked, False if it is unchecked, or None if the probe cannot
+           decide.
+        """
+        region = self.element_regions[element_index]
+        frame = captureFrame(region)
+        return self._probe.classify(frame.getImage())
+
     def _region_id(self, region):
         """Returns the region's position as a string, to be used as a
            dictionary key.
@@ -327,8 +406,9 @@ class Checkable:
                 changed += 1
         return changed
 
-    def update_element(self, element_index):
-        """Updates the specified element with its true state.
+    def _element_search_region(self, element_index):
+        """Returns the region in which the images of the specified element are
+           searched to determine its state.
         """
         region = Region(self.element_regions[element_index])
         # add some space since images may have slightly different size
@@ -336,6 +416,20 @@ class Checkable:
         marginy = int(region.getH() * 0.2)
         extendRegion(region, left = marginx, right = marginx, top = marginy,
                 bottom = marginy)
+        return region
+
+    def update_element(self, element_index):
+        """Updates the specified element with its true state.
+        """
+        if self._probe is not None:
+            state = self._probe_element(element_index)
+            if state is not None:
+                if state != self.is_checked(element_index):
+                    self._toggle_state(element_index)
+                return
+            _LOGGER.debug('probe cannot decide state of %s %d',
+                    self.element_type, element_index)
+        region = self._element_search_region(element_index)
         best_checked_score = 0
         best_unchecked_score = 0
         try:
@@ -382,13 +476,51 @@ class Checkable:
         else:
             _LOGGER.info('waiting for %s %d to become %s, timeout set to %f seconds',
                     self.element_type, element_index, newstate, timeout)
-        self.update_element(element_index)
+        start = metrics.now()
+        span = tracing.begin('wait %s %d %s' % (self.element_type,
+                element_index, newstate), 'wait')
+        watcher = RegionWatcher(self._element_search_region(element_index))
         message = '%s %d still %s after %f seconds' % (
                 self.element_type, element_index, oldstate, timeout)
-        waiting = Wait(timeout, exception_message = message)
-        while bool(self.is_checked(element_index)) != bool(checked):
-            waiting.wait()
+        waiting = Wait(timeout, interval = watcher.getPollInterval(1),
+                exception_message = message)
+        try:
             self.update_element(element_index)
+            while bool(self.is_checked(element_index)) != bool(checked):
+                watcher.waitForChange(waiting)
+                self.update_element(element_index)
+        except TimeoutExceeded:
+            countFailure('TimeoutExceeded', 'Checkable.wait')
+            raise
+        finally:
+            observeWait('Checkable.wait', start)
+            tracing.end(span)
+
+    def async_wait(self, element_index, checked, timeout = None):
+        """Waits in the background until the specified element is in the
+           specified state, and returns a seagull.scheduler.AsyncResult.
+           AsyncResult.get() raises Exception if the element is not in the
+           specified state after the timeout.
+           If no timeout is specified, uses the default timeout of this list.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        if checked:
+            oldstate = 'unchecked'
+            newstate = 'checked'
+        else:
+            oldstate = 'checked'
+            newstate = 'unchecked'
+        _LOGGER.info('waiting in the background for %s %d to become %s',
+                self.element_type, element_index, newstate)
+        message = '%s %d still %s after %s seconds' % (
+                self.element_type, element_index, oldstate, str(timeout))
+        return asyncWaitUntil(
+                lambda: bool(self.is_checked(element_index)) == bool(checked),
+                self._element_search_region(element_index), timeout,
+                exception_message = message,
+                update = lambda: self.update_element(element_index),
+                update_first = True)
 
     def set_element_state(self, element_index, checked):
         """Sets the stored state of the specified element in this list, without
@@ -410,56 +542,58 @@ class Checkboxes(Checkable):
     """A row or column of checkboxes."""
 
     def __init__(self, images, region = SCREEN, orientation = 0,
-            auto_verify = False, timeout = 3):
+            auto_verify = False, timeout = 3, probe = False):
         """Creates a new row or column of checkboxes."""
         Checkable.__init__(self, images = images, region = region,
                 orientation = orientation, radio = False,
-                auto_verify = auto_verify, timeout = timeout)
+                auto_verify = auto_verify, timeout = timeout, probe = probe)
 
 class RadioButtons(Checkable):
     """A row or column of radio buttons."""
 
     def __init__(self, images, region = SCREEN, orientation = 0,
-            auto_verify = False, timeout = 3):
+            auto_verify = False, timeout = 3, probe = False):
         """Creates a new row or column of radio buttons."""
         Checkable.__init__(self, images = images, region = region,
                 orientation = orientation, radio = True,
-                auto_verify = auto_verify, timeout = timeout)
+                auto_verify = auto_verify, timeout = timeout, probe = probe)
 
 class VerticalCheckboxList(Checkboxes):
     """A vertical column of checkboxes."""
 
     def __init__(self, images, region = SCREEN, auto_verify = False,
-            timeout = 3):
+            timeout = 3, probe = False):
         """Creates a new column of checkboxes."""
         Checkboxes.__init__(self, images = images, region = region,
-                orientation = 0, auto_verify = auto_verify, timeout = timeout)
+                orientation = 0, auto_verify = auto_verify, timeout = timeout,
+                probe = probe)
 
 class HorizontalCheckboxList(Checkboxes):
     """A horizontal row of checkboxes."""
 
     def __init__(self, images, region = SCREEN, auto_verify = False,
-            timeout = 3):
+            timeout = 3, probe = False):
         """Creates a new row of checkboxes."""
         Checkboxes.__init__(self, images = images, region = region,
                 orientation = REGION_SORT_HORIZONTAL,
-                auto_verify = auto_verify, timeout = timeout)
+                auto_verify = auto_verify, timeout = timeout, probe = probe)
 
 class VerticalRadioButtonList(RadioButtons):
     """A vertical column of radio buttons."""
 
     def __init__(self, images, region = SCREEN, auto_verify = False,
-            timeout = 3):
+            timeout = 3, probe = False):
         """Creates a new column of radio buttons."""
         RadioButtons.__init__(self, images = images, region = region,
-                orientation = 0, auto_verify = auto_verify, timeout = timeout)
+                orientation = 0, auto_verify = auto_verify, timeout = timeout,
+                probe = probe)
 
 class HorizontalRadioButtonList(RadioButtons):
     """A horizontal row of radio buttons."""
 
     def __init__(self, images, region = SCREEN, auto_verify = False,
-            timeout = 3):
+            timeout = 3, probe = False):
         """Creates a new row of radio buttons."""
         RadioButtons.__init__(self, images = images, region = region,
                 orientation = REGION_SORT_HORIZONTAL,
-                auto_verify = auto_verify, timeout = timeout)
+                auto_verify = auto_verify, timeout = timeout, probe = probe)
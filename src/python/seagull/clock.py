@@ -0,0 +1,83 @@
+"""
+Copyright (c) 2010 Karl-Michael Schneider
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import time
+from java.lang import System
+
+class SystemClock:
+    """The real clock. Its time is monotonic, i.e. it never goes backwards,
+       even if the system time is changed.
+    """
+
+    def now(self):
+        """Returns the current time in seconds since an arbitrary point in
+           time.
+        """
+        return System.nanoTime() / 1e9
+
+    def sleep(self, seconds):
+        """Sleeps for the specified number of seconds."""
+        time.sleep(seconds)
+
+    def wait(self, condition, seconds):
+        """Waits on a threading.Condition, which the caller has acquired,
+           until it is notified or the specified number of seconds has
+           passed.
+        """
+        condition.wait(seconds)
+
+_clock = SystemClock()
+
+def setClock(clock):
+    """Sets the clock that seagull uses to measure time and to sleep.
+       A clock must have the methods now() and sleep(seconds), and may have
+       a method wait(condition, seconds) (see SystemClock.wait).
+       If clock is None, the system clock is used.
+    """
+    global _clock
+    if clock is None:
+        _clock = SystemClock()
+    else:
+        _clock = clock
+
+def getClock():
+    """Returns the clock that seagull uses."""
+    return _clock
+
+def now():
+    """Returns the current time of seagull's clock in seconds."""
+    return _clock.now()
+
+def sleep(seconds):
+    """Sleeps for the specified number of seconds on seagull's clock."""
+    _clock.sleep(seconds)
+
+def wait(condition, seconds):
+    """Waits on a threading.Condition, which the caller has acquired, until
+       it is notified or the specified number of seconds has passed on
+       seagull's clock.
+    """
+    clockwait = getattr(_clock, 'wait', None)
+    if clockwait is None:
+        condition.wait(seconds)
+    else:
+        clockwait(condition, seconds)
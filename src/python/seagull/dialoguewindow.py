@@ -21,10 +21,10 @@ THE SOFTWARE.
 """
 
 import logging
-from time import sleep
-from sikuli.Sikuli import SCREEN
 from sikuli.Key import Key
-from seagull.util import clickAny
+from seagull import metrics, tracing
+from seagull.clock import sleep
+from seagull.util import click, clickAny, typeKeys
 from seagull.window import Window
 
 _LOGGER = logging.getLogger(__name__)
@@ -86,6 +86,14 @@ class DialogueWindow:
         """
         return self._is_open
 
+    def _metricName(self):
+        """Returns the name of this dialogue window in traces and metrics: its
+           name, or the name of its class if it has no name.
+        """
+        if self.name is None:
+            return self.__class__.__name__
+        return self.name
+
     def open(self, *args, **kwds):
         """Opens this dialogue window. If this dialogue window is already open,
            calling open() does nothing. If this dialogue window has a parent
@@ -96,14 +104,21 @@ class DialogueWindow:
         """
         if self.is_open():
             return
-        if self.parent_window is not None:
-            self.parent_window.open()
-        self.opening(*args, **kwds)
-        if self.name is not None:
-            _LOGGER.debug('open %s' % self.name)
-        self._open(self.parent_window, *args, **kwds)
-        self._is_open = True
-        self.opened(*args, **kwds)
+        span = tracing.begin('open %s' % self._metricName(), 'dialogue')
+        try:
+            if self.parent_window is not None:
+                self.parent_window.open()
+            self.opening(*args, **kwds)
+            if self.name is not None:
+                _LOGGER.debug('open %s' % self.name)
+            start = metrics.now()
+            self._open(self.parent_window, *args, **kwds)
+            metrics.observeSince('seagull_dialogue_open_seconds', start,
+                    (('window', self._metricName()),))
+            self._is_open = True
+            self.opened(*args, **kwds)
+        finally:
+            tracing.end(span)
 
     def close(self, *args, **kwds):
         """Closes this dialogue window. If this dialogue window is not open,
@@ -112,16 +127,23 @@ class DialogueWindow:
            All optional arguments are passed to closing(), _close() and
            closed().
         """
-        for window in self.child_windows:
-            window.close()
-        if not self.is_open():
-            return
-        self.closing(*args, **kwds)
-        if self.name is not None:
-            _LOGGER.debug('close %s' % self.name)
-        self._close(*args, **kwds)
-        self._is_open = False
-        self.closed(*args, **kwds)
+        span = tracing.begin('close %s' % self._metricName(), 'dialogue')
+        try:
+            for window in self.child_windows:
+                window.close()
+            if not self.is_open():
+                return
+            self.closing(*args, **kwds)
+            if self.name is not None:
+                _LOGGER.debug('close %s' % self.name)
+            start = metrics.now()
+            self._close(*args, **kwds)
+            metrics.observeSince('seagull_dialogue_close_seconds', start,
+                    (('window', self._metricName()),))
+            self._is_open = False
+            self.closed(*args, **kwds)
+        finally:
+            tracing.end(span)
 
     def _open(self, parent_window, *args, **kwds):
         """The default method to open the actual dialogue window on the screen.
@@ -226,12 +248,12 @@ class Confirm(DialogueWindow):
             raise Exception("confirm dialogue '%s' does not contain a button with id %s" %
                     (self.name, button_id))
         if self.keys is not None:
-            SCREEN.type(self.keys[button_id])
+            typeKeys(self.keys[button_id])
             sleep(1)
         else:
             button = self.buttons[button_id]
             if isinstance(button, list):
                 clickAny(button)
             else:
-                SCREEN.click(button)
+                click(button)
             sleep(1)
@@ -0,0 +1,305 @@
+"""
+Copyright (c) 2010 Karl-Michael Schneider
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from java.awt import Rectangle
+from java.util import Arrays
+from sikuli.Sikuli import SCREEN, ScreenImage
+from sikuli.Region import Region
+from seagull import clock, instrumentation, metrics
+from seagull.matchers import SikuliMatcher
+from seagull.pixels import getRGBPixels, scaleImage
+
+_DEFAULT_MATCHER = SikuliMatcher()
+_matcher = _DEFAULT_MATCHER
+_frame_ttl = 0
+# the maximum number of frames cached per screen
+MAX_CACHED_FRAMES = 16
+# maps screen to a dictionary that maps (x, y, w, h) to (capture time, frame)
+_frame_cache = {}
+_screen_backend = None
+
+def setMatcher(matcher):
+    """Sets the matcher that searches images in frames (see
+       seagull.matchers). If matcher is None, Sikuli's own matcher is used,
+       which is the default.
+    """
+    global _matcher
+    if matcher is None:
+        _matcher = _DEFAULT_MATCHER
+    else:
+        _matcher = matcher
+
+def setScreenBackend(backend):
+    """Sets a screen backend that provides the pixels of the screen instead
+       of the real screen, such as seagull.replay.ReplayBackend. A backend
+       must have a method getBounds() that returns the rectangle (x, y, w, h)
+       of its screen, a method capture(x, y, w, h) that returns a ScreenImage
+       of a rectangle inside these bounds, and methods click(x, y,
+       modifiers), type(keys, modifiers) and openApp(path), which
+       seagull.util calls instead of acting on the real screen. Regions that
+       extend past the bounds are clipped to them when they are captured.
+       If backend is None, the real screen is used.
+    """
+    global _screen_backend
+    _screen_backend = backend
+    invalidateFrames()
+
+def getScreenBackend():
+    """Returns the screen backend, or None if the real screen is used."""
+    return _screen_backend
+
+def setFrameCacheTTL(ttl):
+    """Sets the time (in seconds) during which a frame that was captured from
+       a region is reused when the same region of the same screen is captured
+       again. A typical value is 0.05 to 0.2 seconds.
+       Cached frames are discarded when invalidateFrames() is called, which
+       seagull does after every click and every key that it types.
+       If ttl is 0 (the default), frames are not reused.
+    """
+    global _frame_ttl
+    if ttl < 0:
+        raise ValueError('frame cache TTL must not be negative')
+    _frame_ttl = ttl
+    invalidateFrames()
+
+def getFrameCacheTTL():
+    """Returns the time (in seconds) during which captured frames are reused.
+    """
+    return _frame_ttl
+
+def invalidateFrames():
+    """Discards all cached frames, so that the next capture of any region
+       captures the screen again. Call this after an action that changes the
+       screen, such as a click.
+    """
+    _frame_cache.clear()
+
+def getMatcher():
+    """Returns the matcher that searches images in frames.
+    """
+    return _matcher
+
+def isDefaultMatcher():
+    """Returns True if images are searched with Sikuli's own matcher.
+    """
+    return _matcher is _DEFAULT_MATCHER
+
+class Frame:
+    """A frame is a single capture of a region of the screen. Any number of
+       images can be searched for in a frame without capturing the screen
+       again, so all searches in a frame see the same screen state.
+    """
+
+    def __init__(self, region, screenimage):
+        """Creates a new frame for the specified region from a screen image
+           that was captured from the region.
+        """
+        self.region = Region(region.getX(), region.getY(), region.getW(),
+                region.getH())
+        self.screenimage = screenimage
+        self._cache = {}
+
+    def getX(self):
+        """Returns the x coordinate of the captured region."""
+        return self.region.getX()
+
+    def getY(self):
+        """Returns the y coordinate of the captured region."""
+        return self.region.getY()
+
+    def getW(self):
+        """Returns the width of the captured region."""
+        return self.region.getW()
+
+    def getH(self):
+        """Returns the height of the captured region."""
+        return self.region.getH()
+
+    def getImage(self):
+        """Returns the captured image (a java.awt.image.BufferedImage)."""
+        return self.screenimage.getImage()
+
+    def getCached(self, key, function):
+        """Returns the value stored in this frame under the specified key.
+           If there is no such value, calls function with this frame as the
+           argument and stores the result under the key first.
+           Matchers use this to compute data about a frame only once, no
+           matter how many images are searched in the frame.
+        """
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = function(self)
+            self._cache[key] = value
+            return value
+
+    def getSignature(self):
+        """Returns a hash of the pixels of this frame. Two frames of the same
+           region with the same signature almost certainly show the same
+           pixels.
+        """
+        return self.getCached('signature',
+                lambda f: Arrays.hashCode(getRGBPixels(f.getImage())))
+
+    def crop(self, x, y, w, h):
+        """Returns a frame of the specified region (in screen coordinates)
+           that is taken from this frame without capturing the screen again.
+           The region is clipped to this frame. Returns None if the region
+           does not overlap with this frame.
+        """
+        x0 = max(x, self.getX())
+        y0 = max(y, self.getY())
+        x1 = min(x + w, self.getX() + self.getW())
+        y1 = min(y + h, self.getY() + self.getH())
+        if x1 <= x0 or y1 <= y0:
+            return None
+        image = self.getImage().getSubimage(x0 - self.getX(),
+                y0 - self.getY(), x1 - x0, y1 - y0)
+        return imageFrame(image, x0, y0)
+
+    def scale(self, factor):
+        """Returns a copy of this frame scaled by the specified factor.
+           The region of the scaled frame has its top-left corner at (0, 0).
+        """
+        return imageFrame(scaleImage(self.getImage(), factor))
+
+    def find(self, arg):
+        """Returns the best match of arg (an image or a pattern) in this frame,
+           or None if arg is not found.
+        """
+        if not instrumentation.isEnabled():
+            return _matcher.find(self, arg)
+        start = instrumentation.now()
+        match = _matcher.find(self, arg)
+        instrumentation.addMatchTime(arg, instrumentation.now() - start,
+                match)
+        return match
+
+    def findAll(self, arg):
+        """Returns a list of all matches of arg (an image or a pattern) in this
+           frame. The list is empty if arg is not found.
+        """
+        return _matcher.findAll(self, arg)
+
+def getScreen(region):
+    """Returns the screen that contains the specified region.
+    """
+    try:
+        screen = region.getScreen()
+    except AttributeError:
+        screen = None
+    if screen is None:
+        return SCREEN
+    return screen
+
+def imageFrame(image, x = 0, y = 0):
+    """Returns a frame for the specified image (a BufferedImage) whose
+       top-left corner is at the specified screen coordinates.
+    """
+    w, h = image.getWidth(), image.getHeight()
+    return Frame(Region(x, y, w, h), ScreenImage(Rectangle(x, y, w, h), image))
+
+def _screenKey(screen):
+    try:
+        return screen.getID()
+    except AttributeError:
+        return id(screen)
+
+def _getCachedFrame(screen, rect, now):
+    """Returns a frame of the region rect (x, y, w, h) of the screen from the
+       frame cache, or None if no fresh frame of the screen contains the
+       region.
+    """
+    frames = _frame_cache.get(screen)
+    if not frames:
+        return None
+    try:
+        captured, frame = frames[rect]
+        if now - captured <= _frame_ttl:
+            return frame
+    except KeyError:
+        pass
+    x, y, w, h = rect
+    for (cx, cy, cw, ch), (captured, frame) in frames.items():
+        if now - captured <= _frame_ttl and cx <= x and cy <= y and \
+                x + w <= cx + cw and y + h <= cy + ch:
+            return frame.crop(x, y, w, h)
+    return None
+
+def _cacheFrame(screen, rect, now, frame):
+    """Stores a frame of the region rect of the screen in the frame cache.
+       Frames that are older than the TTL are discarded, and the oldest
+       frames if the screen has more than MAX_CACHED_FRAMES.
+    """
+    frames = _frame_cache.setdefault(screen, {})
+    for oldrect, (oldcaptured, oldframe) in frames.items():
+        if now - oldcaptured > _frame_ttl:
+            frames.pop(oldrect, None)
+    frames[rect] = (now, frame)
+    if len(frames) > MAX_CACHED_FRAMES:
+        entries = [(captured, oldrect) for oldrect, (captured, oldframe)
+                in frames.items()]
+        entries.sort()
+        for captured, oldrect in entries[:len(frames) - MAX_CACHED_FRAMES]:
+            frames.pop(oldrect, None)
+
+def _captureBackend(x, y, w, h):
+    """Captures the rectangle, clipped to the bounds of the screen backend,
+       and returns a frame of the clipped rectangle.
+    """
+    bx, by, bw, bh = _screen_backend.getBounds()
+    x0, y0 = max(x, bx), max(y, by)
+    x1, y1 = min(x + w, bx + bw), min(y + h, by + bh)
+    if x1 <= x0 or y1 <= y0:
+        raise ValueError('region (%d,%d %dx%d) is outside the screen' %
+                (x, y, w, h))
+    return Frame(Region(x0, y0, x1 - x0, y1 - y0),
+            _screen_backend.capture(x0, y0, x1 - x0, y1 - y0))
+
+def captureFrame(region):
+    """Captures the specified region of the screen and returns it as a frame.
+       If the frame cache is enabled (see setFrameCacheTTL) and the same
+       region of the same screen, or a region that contains it, was captured
+       less than the TTL ago, returns that frame (cropped to the region)
+       instead.
+       If a screen backend is set (see setScreenBackend), the region is
+       captured from the backend.
+    """
+    screen = getScreen(region)
+    x, y, w, h = region.getX(), region.getY(), region.getW(), region.getH()
+    if _frame_ttl > 0:
+        screenkey = _screenKey(screen)
+        now = clock.now()
+        frame = _getCachedFrame(screenkey, (x, y, w, h), now)
+        if frame is not None:
+            return frame
+    start = metrics.now()
+    if _screen_backend is not None:
+        frame = _captureBackend(x, y, w, h)
+    else:
+        frame = Frame(region, screen.capture(x, y, w, h))
+    elapsed = metrics.now() - start
+    metrics.observe('seagull_capture_seconds', elapsed)
+    instrumentation.addCaptureTime(elapsed)
+    if _frame_ttl > 0:
+        _cacheFrame(screenkey, (x, y, w, h), now, frame)
+    return frame
@@ -0,0 +1,169 @@
+"""
+Copyright (c) 2010 Karl-Michael Schneider
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import math
+from seagull.matchers import getTemplate
+from seagull.pixels import grayPlane, resizeImage
+from seagull.templates import loadTemplate, OBJECT_BYTES
+
+def dHash(image):
+    """Returns the 64-bit difference hash of a BufferedImage: the image is
+       scaled down to 9x8 gray pixels, and each bit is set if a pixel is
+       brighter than its right neighbour.
+    """
+    gray = grayPlane(resizeImage(image, 9, 8))
+    value = 0L
+    for y in range(8):
+        for x in range(8):
+            value <<= 1
+            if gray[y * 9 + x] > gray[y * 9 + x + 1]:
+                value |= 1
+    return value
+
+# cosines for the 8 lowest frequencies of a 32-point DCT
+_DCT_COSINES = [[math.cos((2 * x + 1) * u * math.pi / 64) for x in range(32)]
+        for u in range(8)]
+
+def pHash(image):
+    """Returns the 64-bit perceptual hash of a BufferedImage: the image is
+       scaled down to 32x32 gray pixels, and each bit is set if one of the 8x8
+       lowest frequency coefficients of its discrete cosine transform is
+       greater than their median.
+    """
+    gray = grayPlane(resizeImage(image, 32, 32))
+    # transform rows, then columns, keeping only the lowest frequencies
+    rows = [[sum([gray[y * 32 + x] * _DCT_COSINES[u][x] for x in range(32)])
+            for u in range(8)] for y in range(32)]
+    coefficients = [sum([rows[y][u] * _DCT_COSINES[v][y] for y in range(32)])
+            for v in range(8) for u in range(8)]
+    # the DC coefficient is left out of the median
+    ordered = sorted(coefficients[1:])
+    median = (ordered[31] + ordered[32]) / 2
+    value = 0L
+    for coefficient in coefficients:
+        value <<= 1
+        if coefficient > median:
+            value |= 1
+    return value
+
+def hammingDistance(hash1, hash2):
+    """Returns the number of bits in which two hashes differ."""
+    bits = hash1 ^ hash2
+    count = 0
+    while bits:
+        bits &= bits - 1
+        count += 1
+    return count
+
+def templateHashes(arg):
+    """Returns a tuple (dhash, phash) of the hashes of an image file or a
+       pattern. The hashes are computed only once and kept with the template
+       in the template store.
+    """
+    filename, similarity = getTemplate(arg)
+    return loadTemplate(filename).getVariant('hashes',
+            lambda t: ((dHash(t.image), pHash(t.image)), 3 * OBJECT_BYTES))
+
+def filterImages(images, patch, maxdistance = 12):
+    """Returns the indexes of the images (filenames or patterns) whose
+       difference hash differs from that of patch (a BufferedImage) in no more
+       than maxdistance bits. These are the images that can possibly match
+       the patch.
+    """
+    patchhash = dHash(patch)
+    return [i for i, image in enumerate(images)
+            if hammingDistance(templateHashes(image)[0], patchhash) <=
+            maxdistance]
+
+class TemplateHashIndex:
+    """An index of the perceptual hashes of a set of images. Each image has a
+       label that identifies the element it shows, e.g. ('button', 'next',
+       'enabled').
+       The index can tell which known element a patch of the screen shows,
+       which images can possibly match a patch, and which images are near
+       duplicates of each other.
+    """
+
+    def __init__(self):
+        # list of tuples (filename, label, dhash, phash)
+        self._entries = []
+
+    def add(self, image, label = None):
+        """Adds an image file or a pattern with the specified label."""
+        dhash, phash = templateHashes(image)
+        self._entries.append((image, label, dhash, phash))
+
+    def addImages(self, images, label = ()):
+        """Adds images from a list, or from a dictionary whose values are
+           images or lists of images (such as IMG_BUTTONS). The label of each
+           image is the specified label (a tuple) extended by the dictionary
+           keys on the way to the image.
+        """
+        if isinstance(images, dict):
+            for key, value in images.iteritems():
+                self.addImages(value, label + (key,))
+        elif isinstance(images, (list, tuple)):
+            for image in images:
+                self.addImages(image, label)
+        else:
+            self.add(images, label)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def candidates(self, patch, maxdistance = 12):
+        """Returns a list of the images whose difference hash differs from
+           that of patch (a BufferedImage) in no more than maxdistance bits.
+        """
+        patchhash = dHash(patch)
+        return [image for image, label, dhash, phash in self._entries
+                if hammingDistance(dhash, patchhash) <= maxdistance]
+
+    def lookup(self, patch, maxdistance = 12):
+        """Returns a tuple (label, image, distance) for the image that is most
+           similar to patch (a BufferedImage), where distance is the number of
+           bits in which the perceptual hashes differ. Returns None if no
+           image differs in no more than maxdistance bits.
+        """
+        patchhash = pHash(patch)
+        best = None
+        for image, label, dhash, phash in self._entries:
+            distance = hammingDistance(phash, patchhash)
+            if distance <= maxdistance and (best is None or
+                    distance < best[2]):
+                best = (label, image, distance)
+        return best
+
+    def duplicates(self, maxdistance = 2):
+        """Returns a list of tuples (image1, image2, distance) for all pairs of
+           images whose difference hashes and perceptual hashes each differ in
+           no more than maxdistance bits. distance is the larger of the two
+           differences.
+        """
+        pairs = []
+        for i, (image1, label1, dhash1, phash1) in enumerate(self._entries):
+            for image2, label2, dhash2, phash2 in self._entries[i + 1:]:
+                distance = max(hammingDistance(dhash1, dhash2),
+                        hammingDistance(phash1, phash2))
+                if distance <= maxdistance:
+                    pairs.append((image1, image2, distance))
+        return pairs
@@ -20,33 +20,102 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
+
+import sys, threading
 import sikuliimport.projects
 
-IMG_BUTTONS = {}
-IMG_BUTTONS_DISABLED = {}
-IMG_CHECKBOXES = { 'checked' : [], 'unchecked' : [] }
-IMG_RADIOBUTTONS = { 'checked' : [], 'unchecked' : [] }
-
-for symbol in dir(sikuliimport.projects):
-    if symbol.startswith('IMG_'):
-        value = eval('sikuliimport.projects.%s' % symbol)
-        if symbol.startswith('IMG_BUTTON_'):
-            buttonname = symbol.split('_')[2].lower()
-            try:
-                IMG_BUTTONS[buttonname].append(value)
-            except KeyError:
-                IMG_BUTTONS[buttonname] = [value]
-        elif symbol.startswith('IMG_DISABLED_BUTTON_'):
-            buttonname = symbol.split('_')[3].lower()
-            try:
-                IMG_BUTTONS_DISABLED[buttonname].append(value)
-            except KeyError:
-                IMG_BUTTONS_DISABLED[buttonname] = [value]
-        elif symbol.startswith('IMG_CHECKED_BOX'):
-            IMG_CHECKBOXES['checked'].append(value)
-        elif symbol.startswith('IMG_UNCHECKED_BOX'):
-            IMG_CHECKBOXES['unchecked'].append(value)
-        elif symbol.startswith('IMG_CHECKED_RADIOBUTTON'):
-            IMG_RADIOBUTTONS['checked'].append(value)
-        elif symbol.startswith('IMG_UNCHECKED_RADIOBUTTON'):
-            IMG_RADIOBUTTONS['unchecked'].append(value)
+__all__ = ['IMG_BUTTONS', 'IMG_BUTTONS_DISABLED', 'IMG_CHECKBOXES',
+        'IMG_RADIOBUTTONS', 'getTemplateHashIndex']
+
+# maps the name of a table to a list of (prefix, key) tuples: images whose
+# symbol starts with prefix are added to the table under key, or under the
+# lower-case part of the symbol at index key (if key is an int) when the
+# symbol is split at underscores
+_TABLES = {
+    'IMG_BUTTONS' : [('IMG_BUTTON_', 2)],
+    'IMG_BUTTONS_DISABLED' : [('IMG_DISABLED_BUTTON_', 3)],
+    'IMG_CHECKBOXES' : [('IMG_CHECKED_BOX', 'checked'),
+            ('IMG_UNCHECKED_BOX', 'unchecked')],
+    'IMG_RADIOBUTTONS' : [('IMG_CHECKED_RADIOBUTTON', 'checked'),
+            ('IMG_UNCHECKED_RADIOBUTTON', 'unchecked')],
+}
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+def _buildTable(name):
+    """Returns a new table of the images whose symbols match the prefixes of
+       the named table. Only the Sikuli projects that define those symbols
+       are imported.
+    """
+    rules = _TABLES[name]
+    table = {}
+    for prefix, key in rules:
+        if not isinstance(key, int):
+            table[key] = []
+    for symbol in sikuliimport.projects.symbols():
+        for prefix, key in rules:
+            if symbol.startswith(prefix):
+                if isinstance(key, int):
+                    key = symbol.split('_')[key].lower()
+                value = getattr(sikuliimport.projects, symbol)
+                table.setdefault(key, []).append(value)
+                break
+    return table
+
+def getTable(name):
+    """Returns the named table (e.g. 'IMG_BUTTONS'). The table is built when
+       it is first requested.
+    """
+    _tables_lock.acquire()
+    try:
+        table = _tables.get(name)
+        if table is None:
+            table = _buildTable(name)
+            _tables[name] = table
+    finally:
+        _tables_lock.release()
+    return table
+
+_template_hash_index = None
+
+def getTemplateHashIndex():
+    """Returns a seagull.imagehash.TemplateHashIndex of all button, checkbox
+       and radio button images. Images are labeled ('button', name),
+       ('disabled button', name), ('checkbox', state) and ('radio button',
+       state). The index is built when this function is first called.
+    """
+    global _template_hash_index
+    if _template_hash_index is None:
+        from seagull.imagehash import TemplateHashIndex
+        index = TemplateHashIndex()
+        index.addImages(getTable('IMG_BUTTONS'), ('button',))
+        index.addImages(getTable('IMG_BUTTONS_DISABLED'),
+                ('disabled button',))
+        index.addImages(getTable('IMG_CHECKBOXES'), ('checkbox',))
+        index.addImages(getTable('IMG_RADIOBUTTONS'), ('radio button',))
+        _template_hash_index = index
+    return _template_hash_index
+
+class LazyImages:
+    """Replaces this module in sys.modules, so that the tables IMG_BUTTONS,
+       IMG_BUTTONS_DISABLED, IMG_CHECKBOXES and IMG_RADIOBUTTONS are built
+       when they are first accessed. Building a table imports only the Sikuli
+       projects that define its images (see sikuliimport.projects), so
+       importing this module imports no project at all.
+    """
+
+    def __init__(self, module):
+        self.__dict__['_module'] = module
+
+    def __getattr__(self, name):
+        if name in _TABLES:
+            return getTable(name)
+        return getattr(self._module, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._module, name, value)
+
+# the module stays referenced by the LazyImages instance, so that its
+# globals are not cleared
+sys.modules[__name__] = LazyImages(sys.modules[__name__])
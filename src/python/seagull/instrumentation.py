@@ -0,0 +1,328 @@
+"""
+Copyright (c) 2010 Karl-Michael Schneider
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import bisect, threading
+from java.lang import System
+
+# upper bounds (in seconds) of the latency buckets: 0.5 ms to about 16 s
+LATENCY_BOUNDS = [0.0005 * 2 ** i for i in range(16)]
+# upper bounds of the score buckets
+SCORE_BOUNDS = [0.05 * i for i in range(1, 21)]
+
+_enabled = False
+_lock = threading.Lock()
+# maps (function, template, region width, region height) to SearchStats;
+# template is None for the statistics of entire calls
+_stats = {}
+_local = threading.local()
+
+def now():
+    """Returns the real time in seconds, which is used to measure calls even
+       if seagull runs on a virtual clock (see seagull.clock).
+    """
+    return System.nanoTime() / 1e9
+
+class Histogram:
+    """Counts values in fixed buckets. Adding a value takes constant memory
+       and only a binary search, so histograms can be kept for every call.
+    """
+
+    def __init__(self, bounds):
+        """Creates a histogram whose buckets have the specified upper bounds
+           (in increasing order). Values above the last bound are counted in
+           an extra bucket.
+        """
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        """Adds a value."""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def getMean(self):
+        """Returns the mean of the values, or None if there are none."""
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    def getPercentile(self, fraction):
+        """Returns an estimate of the value at the specified fraction (e.g.
+           0.9) of the values: the upper bound of the bucket that contains it,
+           but no more than the largest value. Returns None if there are no
+           values.
+        """
+        if self.count == 0:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n > 0:
+                if i < len(self.bounds):
+                    return min(self.bounds[i], self.max)
+                return self.max
+        return self.max
+
+    def toDict(self):
+        """Returns the histogram as a dictionary."""
+        return {
+            'count' : self.count,
+            'total' : self.total,
+            'min' : self.min,
+            'max' : self.max,
+            'mean' : self.getMean(),
+            'p50' : self.getPercentile(0.5),
+            'p90' : self.getPercentile(0.9),
+            'p99' : self.getPercentile(0.99),
+            'bounds' : self.bounds,
+            'counts' : self.counts,
+        }
+
+    def copy(self):
+        """Returns a copy of this histogram."""
+        histogram = Histogram(self.bounds)
+        histogram.counts = list(self.counts)
+        histogram.count = self.count
+        histogram.total = self.total
+        histogram.min = self.min
+        histogram.max = self.max
+        return histogram
+
+class SearchStats:
+    """Statistics of the searches of one template (or of entire calls) by one
+       function in regions of one size.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.hits = 0
+        self.misses = 0
+        self.total_time = Histogram(LATENCY_BOUNDS)
+        self.capture_time = Histogram(LATENCY_BOUNDS)
+        self.match_time = Histogram(LATENCY_BOUNDS)
+        self.scores = Histogram(SCORE_BOUNDS)
+
+    def toDict(self):
+        """Returns the statistics as a dictionary."""
+        return {
+            'calls' : self.calls,
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'total_time' : self.total_time.toDict(),
+            'capture_time' : self.capture_time.toDict(),
+            'match_time' : self.match_time.toDict(),
+            'scores' : self.scores.toDict(),
+        }
+
+class _Call:
+    """Collects the capture and match times of one instrumented call, which
+       may come from several threads.
+    """
+
+    def __init__(self, function, region):
+        self.function = function
+        self.size = (region.getW(), region.getH())
+        self.start = now()
+        self.capture_time = 0.0
+        # maps template to [match time, best score or None]
+        self.templates = {}
+        self.lock = threading.Lock()
+
+def setEnabled(flag):
+    """Turns instrumentation on or off."""
+    global _enabled
+    _enabled = flag
+
+def isEnabled():
+    """Returns True if searches are instrumented."""
+    return _enabled
+
+def templateName(arg):
+    """Returns the name under which the statistics of arg (an image file, a
+       pattern or a region) are kept.
+    """
+    if isinstance(arg, basestring):
+        return arg
+    if hasattr(arg, 'getX'):
+        return '<region>'
+    return str(arg)
+
+def begin(function, region):
+    """Starts recording an instrumented call of the named function in the
+       region. Returns a token for end(), which is None if instrumentation is
+       disabled or another instrumented call is already being recorded in
+       this thread (the outermost call gets the times of nested calls).
+    """
+    if not _enabled or getattr(_local, 'call', None) is not None:
+        return None
+    call = _Call(function, region)
+    _local.call = call
+    return call
+
+def end(call, templates, matches):
+    """Finishes recording the call, where templates is a list of the
+       searched templates and matches a list of their matches (None if a
+       template was not found).
+    """
+    if call is None:
+        return
+    _local.call = None
+    elapsed = now() - call.start
+    _lock.acquire()
+    try:
+        stats = _getStats(call.function, None, call.size)
+        stats.calls += 1
+        stats.total_time.add(elapsed)
+        stats.capture_time.add(call.capture_time)
+        found = False
+        for template, match in zip(templates, matches):
+            stats = _getStats(call.function, templateName(template),
+                    call.size)
+            stats.calls += 1
+            if match is not None:
+                stats.hits += 1
+                found = True
+            else:
+                stats.misses += 1
+            timing = call.templates.get(templateName(template))
+            if timing is not None:
+                stats.match_time.add(timing[0])
+                if timing[1] is not None:
+                    stats.scores.add(timing[1])
+        stats = _getStats(call.function, None, call.size)
+        if found:
+            stats.hits += 1
+        else:
+            stats.misses += 1
+    finally:
+        _lock.release()
+
+def current():
+    """Returns the call that is being recorded in this thread, or None."""
+    return getattr(_local, 'call', None)
+
+def runIn(call, function, arg):
+    """Calls function(arg) so that its capture and match times are recorded
+       in the specified call (e.g. in a worker thread).
+    """
+    if call is None:
+        return function(arg)
+    previous = getattr(_local, 'call', None)
+    _local.call = call
+    try:
+        return function(arg)
+    finally:
+        _local.call = previous
+
+def addCaptureTime(seconds):
+    """Adds capture time to the call that is being recorded in this thread.
+    """
+    call = getattr(_local, 'call', None)
+    if call is None:
+        return
+    call.lock.acquire()
+    try:
+        call.capture_time += seconds
+    finally:
+        call.lock.release()
+
+def addMatchTime(template, seconds, match):
+    """Adds the time spent searching a template to the call that is being
+       recorded in this thread, and records the score of the match (if it is
+       not None).
+    """
+    call = getattr(_local, 'call', None)
+    if call is None:
+        return
+    name = templateName(template)
+    call.lock.acquire()
+    try:
+        timing = call.templates.setdefault(name, [0.0, None])
+        timing[0] += seconds
+        if match is not None and hasattr(match, 'getScore'):
+            timing[1] = max(timing[1], match.getScore())
+    finally:
+        call.lock.release()
+
+def _getStats(function, template, size):
+    key = (function, template, size[0], size[1])
+    stats = _stats.get(key)
+    if stats is None:
+        stats = SearchStats()
+        _stats[key] = stats
+    return stats
+
+def getStats():
+    """Returns a list of tuples (function, template, width, height, stats)
+       where stats is a dictionary (see SearchStats.toDict). Template is None
+       for the statistics of entire calls.
+    """
+    _lock.acquire()
+    try:
+        return [key + (stats.toDict(),) for key, stats in _stats.items()]
+    finally:
+        _lock.release()
+
+def resetStats():
+    """Discards all statistics."""
+    _lock.acquire()
+    try:
+        _stats.clear()
+    finally:
+        _lock.release()
+
+def formatStats(limit = None):
+    """Returns the statistics of templates as a text table, with the
+       templates that took the most time searching first. If limit is not
+       None, returns only that many rows.
+    """
+    rows = [row for row in getStats() if row[1] is not None]
+    rows.sort(lambda a, b: cmp(b[4]['match_time']['total'],
+            a[4]['match_time']['total']))
+    if limit is not None:
+        rows = rows[:limit]
+    lines = ['%-16s %-11s %6s %6s %6s %9s %9s %9s %6s  %s' % ('function',
+            'region', 'calls', 'hits', 'misses', 'match', 'mean', 'p90',
+            'score', 'template')]
+    for function, template, w, h, stats in rows:
+        match_time = stats['match_time']
+        score = stats['scores']['mean']
+        if score is None:
+            score = '-'
+        else:
+            score = '%.3f' % score
+        lines.append('%-16s %-11s %6d %6d %6d %9.4f %9.4f %9.4f %6s  %s' % (
+                function, '%dx%d' % (w, h), stats['calls'], stats['hits'],
+                stats['misses'], match_time['total'],
+                match_time['mean'] or 0.0, match_time['p90'] or 0.0,
+                score, template))
+    return '\n'.join(lines)
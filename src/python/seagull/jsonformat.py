@@ -0,0 +1,68 @@
+"""
+Copyright (c) 2010 Karl-Michael Schneider
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+def toJSON(value, pretty = True, indent = 0):
+    """Returns value (a dictionary, list, tuple, string, number, boolean or
+       None) as a JSON string. Dictionary keys are sorted.
+       If pretty is True, nested values are put on separate lines and
+       indented, starting at the specified indentation. Otherwise the string
+       is on one line.
+    """
+    if value is None:
+        return 'null'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if isinstance(value, (int, long)):
+        return str(value)
+    if isinstance(value, float):
+        # NaN and infinity have no JSON representation
+        if value != value or value - value != 0:
+            return 'null'
+        return repr(value)
+    if isinstance(value, basestring):
+        escaped = value.replace('\\', '\\\\').replace('"', '\\"')
+        escaped = escaped.replace('\n', '\\n').replace('\r', '\\r')
+        escaped = escaped.replace('\t', '\\t')
+        return '"%s"' % escaped
+    if isinstance(value, dict):
+        if len(value) == 0:
+            return '{}'
+        keys = value.keys()
+        keys.sort()
+        items = ['%s: %s' % (toJSON(str(key)),
+                toJSON(value[key], pretty, indent + 2)) for key in keys]
+        return _join('{', items, '}', pretty, indent)
+    if isinstance(value, (list, tuple)):
+        if len(value) == 0:
+            return '[]'
+        items = [toJSON(item, pretty, indent + 2) for item in value]
+        return _join('[', items, ']', pretty, indent)
+    raise ValueError('cannot convert %s to JSON' % repr(value))
+
+def _join(start, items, end, pretty, indent):
+    if not pretty:
+        return '%s%s%s' % (start, ', '.join(items), end)
+    inner = ' ' * (indent + 2)
+    return '%s\n%s%s\n%s%s' % (start, inner, (',\n' + inner).join(items),
+            ' ' * indent, end)
@@ -0,0 +1,265 @@
+"""
+Copyright (c) 2010 Karl-Michael Schneider
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from __future__ import absolute_import
+import atexit, logging, os, shutil, tempfile, threading
+from java.lang import Thread
+from sikuli.Sikuli import Finder, Pattern
+from seagull.pixels import loadImage, saveImage, scaleImage
+from seagull.templates import loadTemplate, OBJECT_BYTES
+
+_LOGGER = logging.getLogger(__name__)
+
+# the minimum similarity Sikuli uses for images that are not patterns
+DEFAULT_SIMILARITY = 0.7
+
+# directory of the scaled images of the pyramid matcher, which is removed
+# when the program exits
+_scaled_template_dir = None
+_scaled_template_count = 0
+_lock = threading.Lock()
+
+def getTemplate(arg):
+    """Returns the filename and the minimum similarity of arg, which is an
+       image filename or a pattern.
+    """
+    if isinstance(arg, basestring):
+        return arg, DEFAULT_SIMILARITY
+    return arg.getFilename(), arg.getSimilarity()
+
+def _compareScores(match1, match2):
+    """Sorts matches by descending score."""
+    return -cmp(match1.getScore(), match2.getScore())
+
+class Matcher:
+    """Base class of matchers. A matcher searches images in frames (see
+       seagull.frame). Subclasses must define the methods find(frame, arg) and
+       findAll(frame, arg).
+    """
+
+    def find(self, frame, arg):
+        """Returns the best match of arg (an image or a pattern) in the frame,
+           or None if arg is not found.
+        """
+        raise Exception('a subclass must override this method')
+
+    def findAll(self, frame, arg):
+        """Returns a list of all matches of arg (an image or a pattern) in the
+           frame. The list is empty if arg is not found.
+        """
+        raise Exception('a subclass must override this method')
+
+def _getFinder(frame):
+    """Returns a Sikuli Finder of the frame for the current thread. Creating
+       a Finder converts the captured image for OpenCV, so the Finder is
+       kept with the frame and reused for every image that is searched in
+       the frame. A Finder holds the results of its last search, so threads
+       that search the same frame (e.g. match workers) use their own.
+       Sikuli releases the native memory of a Finder when it is garbage
+       collected, together with the frame.
+    """
+    return frame.getCached(('finder', Thread.currentThread().getId()),
+            lambda f: Finder(f.screenimage, f.region))
+
+class SikuliMatcher(Matcher):
+    """Searches images exhaustively at full resolution with Sikuli's Finder.
+       This is the default matcher.
+       The Finder of Sikuli X only accepts image filenames and patterns,
+       which are filenames too, and reads the image file in native code on
+       every search. Decoded templates from the template store (see
+       seagull.templates) therefore cannot be passed to it; they are used by
+       matchers that preprocess images in Jython (e.g. PyramidMatcher).
+    """
+
+    def find(self, frame, arg):
+        """Specified in Matcher."""
+        finder = _getFinder(frame)
+        finder.find(arg)
+        if finder.hasNext():
+            return finder.next()
+        return None
+
+    def findAll(self, frame, arg):
+        """Specified in Matcher."""
+        finder = _getFinder(frame)
+        finder.findAll(arg)
+        matches = []
+        while finder.hasNext():
+            matches.append(finder.next())
+        return matches
+
+class PyramidMatcher(Matcher):
+    """Searches images coarse-to-fine. The frame and the image are scaled
+       down, and the image is searched in the scaled frame. Only the regions
+       around the best matches in the scaled frame (the candidates) are then
+       searched at full resolution. This is much faster than an exhaustive
+       search in large frames, such as the entire screen.
+       Frames that are smaller than a minimum area are searched exhaustively.
+       findAll() always searches exhaustively, because all occurrences of the
+       image must be found.
+    """
+
+    def __init__(self, scale = 0.5, candidates = 3, coarse_similarity = 0.8,
+            margin = 4, min_area = 1000000, fallback = True, verify = False):
+        """Creates a new pyramid matcher.
+           The arguments trade accuracy for speed:
+           scale is the factor by which the frame and the images are scaled
+           down. A smaller scale is faster but less accurate.
+           candidates is the number of matches in the scaled frame that are
+           searched at full resolution. More candidates are more accurate but
+           slower.
+           coarse_similarity is the fraction of the image's minimum similarity
+           that a match in the scaled frame must have to become a candidate.
+           A lower fraction is more accurate but slower.
+           margin is the number of pixels (at full resolution) that is added
+           around each candidate before it is searched at full resolution.
+           Frames with fewer than min_area pixels are searched exhaustively.
+           If fallback is True, the frame is searched exhaustively when no
+           candidate matches at full resolution, so an image is never missed.
+           This makes searching for images that do not exist slower.
+           If verify is True, each frame is also searched exhaustively, a
+           warning is logged if the results are different, and the result of
+           the exhaustive search is returned. Use this to check the settings
+           while a script runs; compareMatchers() checks them on sample
+           screenshots.
+        """
+        if not 0 < scale < 1:
+            raise ValueError('scale must be between 0 and 1')
+        if candidates < 1:
+            raise ValueError('number of candidates must be at least 1')
+        self.scale = scale
+        self.candidates = candidates
+        self.coarse_similarity = coarse_similarity
+        self.margin = margin
+        self.min_area = min_area
+        self.fallback = fallback
+        self.verify = verify
+        self.fullmatcher = SikuliMatcher()
+
+    def _getScaledTemplate(self, filename):
+        """Returns the filename of the scaled image of the specified image.
+           Sikuli only searches image files, so scaled images are written to
+           a temporary directory that is removed when the program exits. The
+           filename is kept as a variant of the image's template in the
+           template store.
+        """
+        return loadTemplate(filename).getVariant(('pyramid', self.scale),
+                lambda t: _saveScaledTemplate(t, self.scale))
+
+    def _getScaledFrame(self, frame):
+        return frame.getCached(('pyramid', self.scale),
+                lambda f: f.scale(self.scale))
+
+    def _findCoarseToFine(self, frame, arg):
+        filename, similarity = getTemplate(arg)
+        pattern = Pattern(self._getScaledTemplate(filename)).similar(
+                similarity * self.coarse_similarity)
+        candidates = self.fullmatcher.findAll(self._getScaledFrame(frame),
+                pattern)
+        candidates.sort(_compareScores)
+        best = None
+        for candidate in candidates[:self.candidates]:
+            x = frame.getX() + int(candidate.getX() / self.scale) - self.margin
+            y = frame.getY() + int(candidate.getY() / self.scale) - self.margin
+            w = int(candidate.getW() / self.scale) + 2 * self.margin + 1
+            h = int(candidate.getH() / self.scale) + 2 * self.margin + 1
+            subframe = frame.crop(x, y, w, h)
+            if subframe is None:
+                continue
+            match = self.fullmatcher.find(subframe, arg)
+            if match is not None and (best is None or
+                    match.getScore() > best.getScore()):
+                best = match
+        return best
+
+    def find(self, frame, arg):
+        """Specified in Matcher."""
+        if frame.getW() * frame.getH() < self.min_area:
+            return self.fullmatcher.find(frame, arg)
+        match = self._findCoarseToFine(frame, arg)
+        if self.verify:
+            exhaustive_match = self.fullmatcher.find(frame, arg)
+            if not _sameMatch(match, exhaustive_match):
+                _LOGGER.warn('pyramid search for %s found %s, exhaustive search found %s',
+                        str(arg), str(match), str(exhaustive_match))
+            return exhaustive_match
+        if match is None and self.fallback:
+            return self.fullmatcher.find(frame, arg)
+        return match
+
+    def findAll(self, frame, arg):
+        """Specified in Matcher."""
+        return self.fullmatcher.findAll(frame, arg)
+
+def _saveScaledTemplate(template, scale):
+    """Writes the template scaled by the specified factor to a new file in
+       the directory of scaled images, and returns a tuple (filename, size of
+       the filename), which is a template variant.
+    """
+    global _scaled_template_dir, _scaled_template_count
+    _lock.acquire()
+    try:
+        if _scaled_template_dir is None:
+            _scaled_template_dir = tempfile.mkdtemp(prefix = 'seagull')
+            atexit.register(_removeScaledTemplates)
+        _scaled_template_count += 1
+        filename = os.path.join(_scaled_template_dir,
+                '%d.png' % _scaled_template_count)
+    finally:
+        _lock.release()
+    saveImage(scaleImage(template.image, scale), filename)
+    return filename, 2 * len(filename) + OBJECT_BYTES
+
+def _removeScaledTemplates():
+    if _scaled_template_dir is not None:
+        shutil.rmtree(_scaled_template_dir, True)
+
+def compareMatchers(matcher, screenshots, images, reference = None):
+    """Searches each image (an image filename or a pattern) in each
+       screenshot (an image filename) with matcher and with the reference
+       matcher (a SikuliMatcher if reference is None), and returns a list of
+       tuples (screenshot, image, match, expected match) for each search
+       where the matches have different regions. The list is empty if the
+       matcher finds the same matches as the reference matcher, e.g. when a
+       PyramidMatcher's settings are checked against the exhaustive search.
+    """
+    # seagull.frame imports this module
+    from seagull.frame import imageFrame
+    if reference is None:
+        reference = SikuliMatcher()
+    differences = []
+    for screenshot in screenshots:
+        frame = imageFrame(loadImage(screenshot))
+        expectedframe = imageFrame(frame.getImage())
+        for image in images:
+            match = matcher.find(frame, image)
+            expected = reference.find(expectedframe, image)
+            if not _sameMatch(match, expected):
+                differences.append((screenshot, image, match, expected))
+    return differences
+
+def _sameMatch(match1, match2):
+    """Returns True if both matches are None or have the same region."""
+    if match1 is None or match2 is None:
+        return match1 is match2
+    return (match1.getX(), match1.getY(), match1.getW(), match1.getH()) == \
+            (match2.getX(), match2.getY(), match2.getW(), match2.getH())
@@ -0,0 +1,374 @@
+"""
+Copyright (c) 2010 Karl-Michael Schneider
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from __future__ import absolute_import
+import logging, os, socket, threading
+from seagull.instrumentation import Histogram, now
+
+_LOGGER = logging.getLogger(__name__)
+
+# upper bounds (in seconds) of the buckets of latency histograms
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+        1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0]
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+
+# the metrics that seagull records: name -> (type, help text)
+METRICS = {
+    'seagull_search_seconds' : (HISTOGRAM,
+            'Time spent in search functions, by function.'),
+    'seagull_capture_seconds' : (HISTOGRAM,
+            'Time spent capturing regions of the screen.'),
+    'seagull_wait_seconds' : (HISTOGRAM,
+            'Duration of waits for a screen state, by wait.'),
+    'seagull_timeouts_total' : (COUNTER,
+            'Searches and waits that failed, by exception and function.'),
+    'seagull_clicks_total' : (COUNTER, 'Clicks performed.'),
+    'seagull_dialogue_open_seconds' : (HISTOGRAM,
+            'Time spent opening dialogue windows, by window.'),
+    'seagull_dialogue_close_seconds' : (HISTOGRAM,
+            'Time spent closing dialogue windows, by window.'),
+}
+
+class Counter:
+    """A value that only increases."""
+
+    def __init__(self):
+        self.value = 0
+
+    def add(self, value):
+        self.value += value
+
+class Registry:
+    """Keeps the counters and histograms (seagull.instrumentation.Histogram
+       with LATENCY_BUCKETS) of all metrics, per combination of label values,
+       and passes every recorded value on to the sinks (such as
+       StatsDExporter).
+       Labels are given as a tuple of (name, value) pairs, e.g.
+       (('function', 'find'),), so that recording a value costs no more than
+       a dictionary lookup and a binary search.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # maps (name, labels) to Counter or Histogram
+        self._metrics = {}
+        self._sinks = []
+
+    def increment(self, name, value = 1, labels = ()):
+        """Adds value to a counter."""
+        self._lock.acquire()
+        try:
+            key = (name, labels)
+            counter = self._metrics.get(key)
+            if counter is None:
+                counter = Counter()
+                self._metrics[key] = counter
+            counter.add(value)
+            sinks = self._sinks
+        finally:
+            self._lock.release()
+        for sink in sinks:
+            sink.record(COUNTER, name, value, labels)
+
+    def observe(self, name, value, labels = ()):
+        """Adds a value to a histogram."""
+        self._lock.acquire()
+        try:
+            key = (name, labels)
+            histogram = self._metrics.get(key)
+            if histogram is None:
+                histogram = Histogram(LATENCY_BUCKETS)
+                self._metrics[key] = histogram
+            histogram.add(value)
+            sinks = self._sinks
+        finally:
+            self._lock.release()
+        for sink in sinks:
+            sink.record(HISTOGRAM, name, value, labels)
+
+    def addSink(self, sink):
+        """Passes every value that is recorded from now on to sink.record(type,
+           name, value, labels).
+        """
+        self._lock.acquire()
+        try:
+            self._sinks = self._sinks + [sink]
+        finally:
+            self._lock.release()
+
+    def removeSink(self, sink):
+        """Stops passing values to the sink."""
+        self._lock.acquire()
+        try:
+            self._sinks = [s for s in self._sinks if s is not sink]
+        finally:
+            self._lock.release()
+
+    def getMetrics(self):
+        """Returns a sorted list of tuples (name, labels, metric) with copies
+           of the current counters and histograms.
+        """
+        self._lock.acquire()
+        try:
+            metrics = []
+            for (name, labels), metric in self._metrics.items():
+                if isinstance(metric, Counter):
+                    copy = Counter()
+                    copy.value = metric.value
+                else:
+                    copy = metric.copy()
+                metrics.append((name, labels, copy))
+        finally:
+            self._lock.release()
+        metrics.sort(lambda a, b: cmp(a[:2], b[:2]))
+        return metrics
+
+    def reset(self):
+        """Discards all recorded values."""
+        self._lock.acquire()
+        try:
+            self._metrics.clear()
+        finally:
+            self._lock.release()
+
+_registry = Registry()
+_enabled = False
+
+def setEnabled(flag):
+    """Turns recording metrics in seagull's registry on or off."""
+    global _enabled
+    _enabled = flag
+
+def isEnabled():
+    """Returns True if seagull records metrics in its registry."""
+    return _enabled
+
+def getRegistry():
+    """Returns the registry that seagull records its metrics in."""
+    return _registry
+
+def increment(name, value = 1, labels = ()):
+    """Adds value to a counter in seagull's registry, if metrics are
+       enabled.
+    """
+    if _enabled:
+        _registry.increment(name, value, labels)
+
+def observe(name, value, labels = ()):
+    """Adds a value to a histogram in seagull's registry, if metrics are
+       enabled.
+    """
+    if _enabled:
+        _registry.observe(name, value, labels)
+
+def observeSince(name, start, labels = ()):
+    """Adds the time since start (as returned by now()) to a histogram in
+       seagull's registry, if metrics are enabled.
+    """
+    if _enabled:
+        _registry.observe(name, now() - start, labels)
+
+def _formatLabels(labels, extra = ()):
+    labels = labels + extra
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(['%s="%s"' % (name, str(value).replace('\\',
+            '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for name, value in labels])
+
+def formatPrometheus(registry = None):
+    """Returns the metrics in a registry (seagull's registry if registry is
+       None) in the Prometheus text format.
+    """
+    if registry is None:
+        registry = _registry
+    lines = []
+    described = {}
+    for name, labels, metric in registry.getMetrics():
+        if name not in described:
+            described[name] = True
+            if name in METRICS:
+                lines.append('# HELP %s %s' % (name, METRICS[name][1]))
+            if isinstance(metric, Counter):
+                lines.append('# TYPE %s counter' % name)
+            else:
+                lines.append('# TYPE %s histogram' % name)
+        if isinstance(metric, Counter):
+            lines.append('%s%s %s' % (name, _formatLabels(labels),
+                    repr(float(metric.value))))
+            continue
+        cumulative = 0
+        for bound, count in zip(metric.bounds, metric.counts):
+            cumulative += count
+            lines.append('%s_bucket%s %d' % (name, _formatLabels(labels,
+                    (('le', repr(bound)),)), cumulative))
+        lines.append('%s_bucket%s %d' % (name, _formatLabels(labels,
+                (('le', '+Inf'),)), metric.count))
+        lines.append('%s_sum%s %s' % (name, _formatLabels(labels),
+                repr(metric.total)))
+        lines.append('%s_count%s %d' % (name, _formatLabels(labels),
+                metric.count))
+    return '\n'.join(lines) + '\n'
+
+class PrometheusTextfileExporter:
+    """Writes the metrics to a file in the Prometheus text format, e.g. for
+       the textfile collector of the node exporter.
+    """
+
+    def __init__(self, path, registry = None):
+        self.path = path
+        self.registry = registry
+
+    def export(self):
+        """Writes the current metrics. The file is replaced atomically where
+           the platform allows it, so a collector never reads a partial file.
+        """
+        temporary = self.path + '.tmp'
+        f = open(temporary, 'w')
+        try:
+            f.write(formatPrometheus(self.registry))
+        finally:
+            f.close()
+        try:
+            os.rename(temporary, self.path)
+        except OSError:
+            # Windows cannot rename onto an existing file
+            os.remove(self.path)
+            os.rename(temporary, self.path)
+
+class StatsDExporter:
+    """Sends the recorded values to a StatsD server over UDP. Counters are
+       sent as counts, histogram values as timings in milliseconds. Values are
+       buffered and sent in batches by flush(), so recording a value does not
+       wait for the network. The label values are appended to the metric
+       name, e.g. seagull_search_seconds.find.
+       At most maxbuffer values are buffered; values recorded while the
+       buffer is full are dropped, so an exporter that is never flushed does
+       not use more and more memory.
+    """
+
+    def __init__(self, host = '127.0.0.1', port = 8125, prefix = None,
+            registry = None, maxpacket = 512, maxbuffer = 10000):
+        """Creates an exporter and adds it to the sinks of the registry
+           (seagull's registry if registry is None).
+        """
+        self.address = (host, port)
+        self.prefix = prefix
+        self.maxpacket = maxpacket
+        self.maxbuffer = maxbuffer
+        # number of values dropped because the buffer was full
+        self.dropped = 0
+        if registry is None:
+            registry = _registry
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._thread = None
+        self._interval = None
+        self._stopping = None
+        registry.addSink(self)
+
+    def record(self, type, name, value, labels):
+        """Buffers a value. Called by the registry."""
+        self._lock.acquire()
+        try:
+            if len(self._buffer) < self.maxbuffer:
+                self._buffer.append((type, name, value, labels))
+            else:
+                self.dropped += 1
+        finally:
+            self._lock.release()
+
+    def _format(self, type, name, value, labels):
+        if self.prefix is not None:
+            name = '%s.%s' % (self.prefix, name)
+        for label, labelvalue in labels:
+            name = '%s.%s' % (name, str(labelvalue).replace('.', '_').replace(
+                    ':', '_').replace('|', '_').replace(' ', '_'))
+        if type == COUNTER:
+            return '%s:%d|c' % (name, value)
+        return '%s:%.3f|ms' % (name, value * 1000)
+
+    def flush(self):
+        """Sends the buffered values, several per packet."""
+        self._lock.acquire()
+        try:
+            values = self._buffer
+            self._buffer = []
+            dropped = self.dropped
+            self.dropped = 0
+        finally:
+            self._lock.release()
+        if dropped:
+            _LOGGER.warning('dropped %d metric values because the buffer was full',
+                    dropped)
+        packet = ''
+        for value in values:
+            line = self._format(*value)
+            if packet and len(packet) + 1 + len(line) > self.maxpacket:
+                self._send(packet)
+                packet = ''
+            if packet:
+                packet += '\n'
+            packet += line
+        if packet:
+            self._send(packet)
+
+    def _send(self, packet):
+        try:
+            self._socket.sendto(packet, self.address)
+        except socket.error, e:
+            _LOGGER.warning('cannot send metrics to %s:%d: %s',
+                    self.address[0], self.address[1], str(e))
+
+    def start(self, interval = 10):
+        """Flushes the buffer every interval seconds in a daemon thread."""
+        self._interval = interval
+        if self._thread is None:
+            self._stopping = threading.Event()
+            self._thread = threading.Thread(target = self._run,
+                    args = (self._stopping,), name = 'seagull-statsd')
+            self._thread.setDaemon(True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops flushing in the background and waits for the thread to
+           finish, flushes the buffer, and removes this exporter from the
+           sinks of the registry.
+        """
+        thread = self._thread
+        if thread is not None:
+            self._stopping.set()
+            thread.join()
+            self._thread = None
+        self.registry.removeSink(self)
+        self.flush()
+
+    def _run(self, stopping):
+        while True:
+            stopping.wait(self._interval)
+            if stopping.isSet():
+                return
+            self.flush()
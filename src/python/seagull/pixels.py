@@ -0,0 +1,87 @@
+"""
+Copyright (c) 2010 Karl-Michael Schneider
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from __future__ import absolute_import
+import os, tempfile
+from java.awt import RenderingHints
+from java.awt.image import BufferedImage
+from java.io import File
+from javax.imageio import ImageIO
+
+def loadImage(filename):
+    """Reads the specified image file and returns it as a
+       java.awt.image.BufferedImage.
+       Raises IOError if the file cannot be read.
+    """
+    image = ImageIO.read(File(filename))
+    if image is None:
+        raise IOError('cannot read image %s' % filename)
+    return image
+
+def saveImage(image, filename = None):
+    """Writes the specified image to a PNG file and returns the filename.
+       If filename is None, the image is written to a new temporary file.
+    """
+    if filename is None:
+        fd, filename = tempfile.mkstemp(suffix = '.png')
+        os.close(fd)
+    ImageIO.write(image, 'png', File(filename))
+    return filename
+
+def scaleImage(image, factor):
+    """Returns a copy of the image scaled by the specified factor, using
+       bilinear interpolation. The scaled image is at least 1x1 pixels.
+    """
+    w = max(1, int(round(image.getWidth() * factor)))
+    h = max(1, int(round(image.getHeight() * factor)))
+    return resizeImage(image, w, h)
+
+def resizeImage(image, w, h):
+    """Returns a copy of the image scaled to w x h pixels, using bilinear
+       interpolation.
+    """
+    scaled = BufferedImage(w, h, BufferedImage.TYPE_INT_RGB)
+    graphics = scaled.createGraphics()
+    try:
+        graphics.setRenderingHint(RenderingHints.KEY_INTERPOLATION,
+                RenderingHints.VALUE_INTERPOLATION_BILINEAR)
+        graphics.drawImage(image, 0, 0, w, h, None)
+    finally:
+        graphics.dispose()
+    return scaled
+
+def getRGBPixels(image):
+    """Returns the pixels of the image as a Java array of packed RGB integers
+       in row-major order.
+    """
+    w, h = image.getWidth(), image.getHeight()
+    return image.getRGB(0, 0, w, h, None, 0, w)
+
+def grayPlane(image):
+    """Returns the gray values (0-255) of the image's pixels as a list of
+       floats in row-major order.
+    """
+    gray = []
+    for rgb in getRGBPixels(image):
+        gray.append(((rgb >> 16) & 0xff) * 0.299 + ((rgb >> 8) & 0xff) * 0.587
+                + (rgb & 0xff) * 0.114)
+    return gray
@@ -0,0 +1,186 @@
+"""
+Copyright (c) 2010 Karl-Michael Schneider
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import random
+
+# Regions are handled as (x, y, w, h) tuples here, which is much faster in
+# Jython than calling the getters of Java regions over and over.
+
+def regionRect(region):
+    """Returns the rectangle (x, y, w, h) of a region or match."""
+    return region.getX(), region.getY(), region.getW(), region.getH()
+
+def rectOverlap(rect1, rect2):
+    """Returns the overlap of two rectangles as a fraction of the first
+       rectangle. Same as seagull.util.getOverlap, but for rectangles.
+    """
+    x1, y1, w1, h1 = rect1
+    x2, y2, w2, h2 = rect2
+    overlap_w = min(x1 + w1, x2 + w2) - max(x1, x2)
+    if overlap_w <= 0:
+        return 0
+    overlap_h = min(y1 + h1, y2 + h2) - max(y1, y2)
+    if overlap_h <= 0:
+        return 0
+    return float(overlap_w * overlap_h) / (w1 * h1)
+
+def sameRect(rect1, rect2, minOverlap = 0.9):
+    """Returns True if the two rectangles are almost the same. Same as
+       seagull.util.sameRegion, but for rectangles.
+    """
+    return rectOverlap(rect1, rect2) >= minOverlap and \
+            rectOverlap(rect2, rect1) >= minOverlap
+
+class RegionIndex:
+    """A spatial index of rectangles. The screen is divided into a grid of
+       square cells, and each cell lists the rectangles that overlap with it.
+       This finds the rectangles that overlap with a given rectangle without
+       comparing it with every rectangle in the index.
+       Each rectangle in the index has an id. Ids are assigned in the order
+       the rectangles are added, starting with 0.
+    """
+
+    def __init__(self, cellsize = 64):
+        self.cellsize = cellsize
+        # _rects[id] is the rectangle with that id, or None if it was removed
+        self._rects = []
+        # maps (column, row) to a list of ids
+        self._cells = {}
+
+    def _cellsOf(self, rect):
+        x, y, w, h = rect
+        c = self.cellsize
+        # floor division also works for negative coordinates
+        for column in range(x // c, (x + max(w, 1) - 1) // c + 1):
+            for row in range(y // c, (y + max(h, 1) - 1) // c + 1):
+                yield column, row
+
+    def add(self, rect):
+        """Adds a rectangle to the index and returns its id."""
+        rectid = len(self._rects)
+        self._rects.append(rect)
+        for cell in self._cellsOf(rect):
+            self._cells.setdefault(cell, []).append(rectid)
+        return rectid
+
+    def remove(self, rectid):
+        """Removes the rectangle with the specified id from the index."""
+        rect = self._rects[rectid]
+        if rect is None:
+            return
+        for cell in self._cellsOf(rect):
+            self._cells[cell].remove(rectid)
+        self._rects[rectid] = None
+
+    def replace(self, rectid, rect):
+        """Replaces the rectangle with the specified id, keeping the id."""
+        self.remove(rectid)
+        self._rects[rectid] = rect
+        for cell in self._cellsOf(rect):
+            self._cells.setdefault(cell, []).append(rectid)
+
+    def get(self, rectid):
+        """Returns the rectangle with the specified id."""
+        return self._rects[rectid]
+
+    def overlapping(self, rect):
+        """Returns the ids of all rectangles that overlap with the specified
+           rectangle, in ascending order.
+        """
+        ids = {}
+        for cell in self._cellsOf(rect):
+            for rectid in self._cells.get(cell, ()):
+                ids[rectid] = True
+        result = [rectid for rectid in ids
+                if rectOverlap(rect, self._rects[rectid]) > 0]
+        result.sort()
+        return result
+
+    def findSame(self, rect, minOverlap = 0.9):
+        """Returns the lowest id of a rectangle that is almost the same as the
+           specified rectangle (see sameRect), or None if there is none.
+           This gives the same result as comparing the rectangle with all
+           rectangles in the order they were added.
+        """
+        if minOverlap <= 0:
+            # every rectangle is the same, even if it does not overlap
+            for rectid, other in enumerate(self._rects):
+                if other is not None:
+                    return rectid
+            return None
+        for rectid in self.overlapping(rect):
+            if sameRect(self._rects[rectid], rect, minOverlap):
+                return rectid
+        return None
+
+def _linearFindSame(rects, rect, minOverlap):
+    """Returns the index of the first rectangle in rects that is almost the
+       same as rect, or None. This is the pairwise scan that RegionIndex
+       replaces.
+    """
+    for i, other in enumerate(rects):
+        if sameRect(other, rect, minOverlap):
+            return i
+    return None
+
+def compareWithLinearScan(trials = 200, count = 60, seed = None,
+        overlaps = (0, 0.5, 0.9, 1.0)):
+    """Deduplicates random rectangles the way bestMatches does, once with a
+       RegionIndex and once by comparing each rectangle with all rectangles
+       kept so far, and returns a list of tuples (trial, minOverlap, rect,
+       expected, actual) for each rectangle where findSame() returned a
+       different id than the pairwise scan. The list is empty if the index
+       always keeps the lowest id, as the pairwise scan does.
+       Each trial deduplicates count rectangles, including zero-size ones,
+       that are clustered so that many of them are almost the same, and
+       randomly replaces kept rectangles as a better match would.
+    """
+    generator = random.Random(seed)
+    differences = []
+    for trial in range(trials):
+        minOverlap = overlaps[trial % len(overlaps)]
+        cellsize = generator.choice([8, 32, 64, 256])
+        index = RegionIndex(cellsize)
+        kept = []
+        basew = generator.choice([1, 10, 20, 40, 80])
+        baseh = generator.choice([1, 10, 20, 40])
+        for n in range(count):
+            x = generator.randint(-basew, 3 * basew)
+            y = generator.randint(-baseh, 3 * baseh)
+            if generator.random() < 0.1:
+                w, h = generator.choice([(0, baseh), (basew, 0), (0, 0)])
+            else:
+                w = max(1, basew + generator.randint(-2, 2))
+                h = max(1, baseh + generator.randint(-2, 2))
+            rect = (x, y, w, h)
+            expected = _linearFindSame(kept, rect, minOverlap)
+            actual = index.findSame(rect, minOverlap)
+            if expected != actual:
+                differences.append((trial, minOverlap, rect, expected,
+                        actual))
+            if expected is None:
+                kept.append(rect)
+                index.add(rect)
+            elif generator.random() < 0.5:
+                kept[expected] = rect
+                index.replace(expected, rect)
+    return differences
@@ -0,0 +1,213 @@
+"""
+Copyright (c) 2010 Karl-Michael Schneider
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from __future__ import absolute_import
+import logging, os, re, threading, zipfile
+from java.awt import Rectangle
+from java.io import ByteArrayInputStream
+from javax.imageio import ImageIO
+from sikuli.Sikuli import ScreenImage
+from seagull import clock
+from seagull.frame import setScreenBackend
+from seagull.pixels import loadImage
+
+_LOGGER = logging.getLogger(__name__)
+
+# recorded screenshots are named by the time (in milliseconds since the start
+# of the recording) at which they were taken, e.g. 001500.png or
+# shot-1500.png
+_SCREENSHOT_NAME = re.compile(r'(\d+)\.png$', re.IGNORECASE)
+
+class VirtualClock:
+    """A clock whose time only advances when seagull sleeps on it, so that
+       replaying a recording does not take real time and is reproducible.
+    """
+
+    def __init__(self, start = 0.0):
+        self.time = start
+        self._lock = threading.Lock()
+
+    def now(self):
+        """Specified in seagull.clock.SystemClock."""
+        return self.time
+
+    def sleep(self, seconds):
+        """Advances the time by the specified number of seconds without
+           sleeping.
+        """
+        self.advance(seconds)
+
+    def wait(self, condition, seconds):
+        """Advances the time by the specified number of seconds instead of
+           waiting on the condition, like sleep().
+        """
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        """Advances the time by the specified number of seconds."""
+        if seconds <= 0:
+            return
+        self._lock.acquire()
+        try:
+            self.time += seconds
+        finally:
+            self._lock.release()
+
+class ReplayBackend:
+    """A screen backend (see seagull.frame.setScreenBackend) that serves
+       recorded screenshots instead of the real screen. The screenshots are
+       PNG files in a directory or a zip archive, named by the time in
+       milliseconds since the start of the recording at which they were taken.
+       At any time on seagull's clock, the backend shows the latest screenshot
+       that was taken no later than that time since the backend was created.
+       Clicks, typed keys and started applications are logged and recorded
+       as events instead of being performed.
+    """
+
+    def __init__(self, source):
+        """Creates a backend that replays the screenshots in source, which is
+           a directory or a zip file.
+           Raises IOError if source contains no screenshots.
+        """
+        self.source = source
+        # list of tuples (time in seconds, name), sorted by time
+        self.screenshots = []
+        if os.path.isdir(source):
+            self._archive = None
+            names = os.listdir(source)
+        else:
+            self._archive = zipfile.ZipFile(source)
+            names = self._archive.namelist()
+        for name in names:
+            m = _SCREENSHOT_NAME.search(name)
+            if m is not None:
+                self.screenshots.append((int(m.group(1)) / 1000.0, name))
+        if len(self.screenshots) == 0:
+            raise IOError('no screenshots found in %s' % source)
+        self.screenshots.sort()
+        # list of tuples (time, action, arguments)
+        self.events = []
+        self.start = clock.now()
+        self._current = None
+        self._image = None
+        self._lock = threading.Lock()
+
+    def getTime(self):
+        """Returns the time in seconds since the start of the recording."""
+        return clock.now() - self.start
+
+    def getScreenshot(self):
+        """Returns the name of the screenshot that is shown at the current
+           time.
+        """
+        t = self.getTime()
+        current = self.screenshots[0][1]
+        for time, name in self.screenshots:
+            if time > t:
+                break
+            current = name
+        return current
+
+    def getImage(self):
+        """Returns the screenshot that is shown at the current time as a
+           BufferedImage.
+        """
+        name = self.getScreenshot()
+        self._lock.acquire()
+        try:
+            if name != self._current:
+                if self._archive is None:
+                    self._image = loadImage(os.path.join(self.source, name))
+                else:
+                    self._image = ImageIO.read(ByteArrayInputStream(
+                            self._archive.read(name)))
+                    if self._image is None:
+                        raise IOError('cannot read image %s in %s' %
+                                (name, self.source))
+                self._current = name
+                _LOGGER.debug('replaying %s at %f seconds', name,
+                        self.getTime())
+            return self._image
+        finally:
+            self._lock.release()
+
+    def getBounds(self):
+        """Returns the rectangle (x, y, w, h) of the current screenshot,
+           which starts at (0, 0).
+        """
+        image = self.getImage()
+        return 0, 0, image.getWidth(), image.getHeight()
+
+    def capture(self, x, y, w, h):
+        """Returns the specified rectangle of the current screenshot as a
+           ScreenImage. Raises ValueError if the rectangle is not inside the
+           screenshot (see getBounds).
+        """
+        image = self.getImage()
+        if x < 0 or y < 0 or w <= 0 or h <= 0 or \
+                x + w > image.getWidth() or y + h > image.getHeight():
+            raise ValueError('region (%d,%d %dx%d) is not inside the screenshot' %
+                    (x, y, w, h))
+        return ScreenImage(Rectangle(x, y, w, h),
+                image.getSubimage(x, y, w, h))
+
+    def click(self, x, y, modifiers):
+        """Records a click at the specified screen coordinates."""
+        self._record('click', (x, y, modifiers))
+        return 1
+
+    def type(self, keys, modifiers):
+        """Records typed keys."""
+        self._record('type', (keys, modifiers))
+        return 1
+
+    def openApp(self, path):
+        """Records that an application was started."""
+        self._record('openApp', (path,))
+
+    def getEvents(self, action = None):
+        """Returns a list of the recorded events as tuples (time, action,
+           arguments), where time is the time since the start of the
+           recording. If action is not None, returns only events of that
+           action ('click', 'type' or 'openApp').
+        """
+        return [event for event in self.events
+                if action is None or event[1] == action]
+
+    def _record(self, action, arguments):
+        t = self.getTime()
+        _LOGGER.info('replay %s%s at %f seconds', action, str(arguments), t)
+        self.events.append((t, action, arguments))
+
+def installReplay(source):
+    """Makes seagull replay the screenshots in source (a directory or a zip
+       file, see ReplayBackend) on a virtual clock, and returns the backend.
+    """
+    clock.setClock(VirtualClock())
+    backend = ReplayBackend(source)
+    setScreenBackend(backend)
+    return backend
+
+def uninstallReplay():
+    """Makes seagull use the real screen and the system clock again."""
+    setScreenBackend(None)
+    clock.setClock(None)
@@ -0,0 +1,342 @@
+"""
+Copyright (c) 2010 Karl-Michael Schneider
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import heapq, logging, sys, threading
+from java.lang import Runnable, Thread
+from java.util.concurrent import Executors, ThreadFactory
+from seagull import clock
+
+_LOGGER = logging.getLogger(__name__)
+
+class DaemonThreadFactory(ThreadFactory):
+    """Creates daemon threads with the specified name, so that idle worker
+       threads do not keep the JVM from exiting.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def newThread(self, runnable):
+        thread = Thread(runnable, self.name)
+        thread.setDaemon(True)
+        return thread
+
+class NotDone(Exception):
+    """Raised by AsyncResult.get() if the result is not available within the
+       specified time.
+    """
+
+    def __init__(self, message):
+        Exception.__init__(self, message)
+
+class Cancelled(Exception):
+    """Raised by AsyncResult.get() if the operation was cancelled."""
+
+    def __init__(self, message):
+        Exception.__init__(self, message)
+
+class AsyncResult:
+    """The result of an operation that runs in the background, such as a
+       search or a wait that is driven by a Scheduler.
+    """
+
+    def __init__(self, name = None):
+        self.name = name
+        self._condition = threading.Condition()
+        self._done = False
+        self._cancelled = False
+        self._value = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def done(self):
+        """Returns True if the operation has finished, failed or was
+           cancelled.
+        """
+        return self._done
+
+    def cancelled(self):
+        """Returns True if the operation was cancelled."""
+        return self._cancelled
+
+    def cancel(self):
+        """Cancels the operation. Returns False if the operation has already
+           finished, else True.
+        """
+        return self._finish(None, (Cancelled, Cancelled('%s was cancelled' %
+                self._describe()), None), True)
+
+    def get(self, timeout = None):
+        """Waits until the operation has finished and returns its value, or
+           raises the exception that the operation raised.
+           Raises NotDone if the operation has not finished within timeout
+           seconds. If timeout is None, waits forever.
+        """
+        self._condition.acquire()
+        try:
+            if timeout is None:
+                while not self._done:
+                    self._condition.wait()
+            elif not self._done:
+                deadline = clock.now() + timeout
+                while not self._done and clock.now() < deadline:
+                    self._condition.wait(deadline - clock.now())
+        finally:
+            self._condition.release()
+        if not self._done:
+            raise NotDone('%s not done after %f seconds' %
+                    (self._describe(), timeout))
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._value
+
+    def addCallback(self, function):
+        """Calls function with this instance as the argument when the
+           operation has finished. If it has already finished, calls function
+           immediately.
+        """
+        self._condition.acquire()
+        try:
+            if not self._done:
+                self._callbacks.append(function)
+                return
+        finally:
+            self._condition.release()
+        function(self)
+
+    def setResult(self, value):
+        """Finishes the operation with the specified value. Returns False if
+           the operation has already finished.
+        """
+        return self._finish(value, None, False)
+
+    def setException(self, exc_info):
+        """Finishes the operation with an exception, where exc_info is a tuple
+           as returned by sys.exc_info(). Returns False if the operation has
+           already finished.
+        """
+        return self._finish(None, exc_info, False)
+
+    def _finish(self, value, exc_info, cancelled):
+        self._condition.acquire()
+        try:
+            if self._done:
+                return False
+            self._value = value
+            self._exc_info = exc_info
+            self._cancelled = cancelled
+            self._done = True
+            callbacks = self._callbacks
+            self._callbacks = []
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+        for function in callbacks:
+            try:
+                function(self)
+            except:
+                _LOGGER.exception('callback of %s failed', self._describe())
+        return True
+
+    def _describe(self):
+        if self.name is None:
+            return 'operation'
+        return self.name
+
+class _Job(Runnable):
+    """Calls a function without arguments in a worker thread."""
+
+    def __init__(self, function):
+        self.function = function
+
+    def run(self):
+        try:
+            self.function()
+        except:
+            _LOGGER.exception('scheduled job failed')
+
+class Scheduler:
+    """Drives many background operations, such as waits, with one timer
+       thread and a small pool of worker threads. The timer thread only
+       decides when each operation polls next. Polls, which search images,
+       run in the worker threads, so a slow search does not delay the other
+       operations.
+       Many waits can therefore run concurrently (several windows, watchdogs,
+       timeouts) without a thread per wait.
+    """
+
+    def __init__(self, workers = 2):
+        if workers < 1:
+            raise ValueError('number of workers must be at least 1')
+        self.workers = workers
+        self._condition = threading.Condition()
+        # heap of tuples (due time, sequence number, function)
+        self._queue = []
+        self._sequence = 0
+        self._thread = None
+        self._executor = None
+        self._shutdown = False
+
+    def call(self, function, *args):
+        """Calls function with the specified arguments in a worker thread and
+           returns an AsyncResult of its return value.
+        """
+        result = AsyncResult(getattr(function, '__name__', None))
+        def job():
+            if result.done():
+                return
+            try:
+                result.setResult(function(*args))
+            except:
+                result.setException(sys.exc_info())
+        self._submit(job)
+        return result
+
+    def poll(self, probe, timeout, interval = 1, exception = None,
+            policy = None, name = None):
+        """Calls probe in a worker thread until it returns a tuple (True,
+           value), and returns an AsyncResult of value. Probe returns (False,
+           None) to be called again. The time between calls is decided by
+           policy (see seagull.util.FixedPolling), or is interval seconds if
+           policy is None.
+           If timeout is not None and probe has not returned True after
+           timeout seconds, the result is the exception if it is not None,
+           else None.
+           If probe raises an exception, the result is that exception.
+        """
+        result = AsyncResult(name)
+        start = clock.now()
+        state = { 'polls' : 0 }
+        def job():
+            if result.done():
+                return
+            try:
+                finished, value = probe()
+            except:
+                result.setException(sys.exc_info())
+                return
+            if finished:
+                result.setResult(value)
+                return
+            now = clock.now()
+            elapsed = now - start
+            if timeout is not None and elapsed >= timeout:
+                if exception is None:
+                    result.setResult(None)
+                else:
+                    result.setException((exception.__class__, exception,
+                            None))
+                return
+            if policy is None:
+                delay = interval
+            else:
+                delay = policy.getInterval(interval, state['polls'], elapsed)
+            if timeout is not None:
+                delay = min(delay, start + timeout - now)
+            state['polls'] += 1
+            self._schedule(job, delay)
+        self._submit(job)
+        return result
+
+    def shutdown(self):
+        """Stops the timer thread and the worker threads. Operations that
+           have not finished are not finished.
+        """
+        self._condition.acquire()
+        try:
+            self._shutdown = True
+            self._queue = []
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def _submit(self, job):
+        self._condition.acquire()
+        try:
+            if self._shutdown:
+                raise Exception('scheduler has been shut down')
+            if self._executor is None:
+                self._executor = Executors.newFixedThreadPool(self.workers,
+                        DaemonThreadFactory('seagull-scheduler-worker'))
+        finally:
+            self._condition.release()
+        self._executor.execute(_Job(job))
+
+    def _schedule(self, job, delay):
+        self._condition.acquire()
+        try:
+            if self._shutdown:
+                return
+            self._sequence += 1
+            heapq.heappush(self._queue, (clock.now() + delay, self._sequence,
+                    job))
+            if self._thread is None:
+                self._thread = Thread(_Job(self._run), 'seagull-scheduler')
+                self._thread.setDaemon(True)
+                self._thread.start()
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+
+    def _run(self):
+        """Main loop of the timer thread: submits each job to the workers
+           when it is due.
+        """
+        while True:
+            self._condition.acquire()
+            try:
+                while not self._shutdown and (len(self._queue) == 0 or
+                        self._queue[0][0] > clock.now()):
+                    if len(self._queue) == 0:
+                        self._condition.wait()
+                    else:
+                        # on a virtual clock, this advances the time to
+                        # the next job instead of waiting in real time
+                        clock.wait(self._condition,
+                                self._queue[0][0] - clock.now())
+                if self._shutdown:
+                    return
+                due, sequence, job = heapq.heappop(self._queue)
+            finally:
+                self._condition.release()
+            self._submit(job)
+
+_scheduler = None
+
+def setScheduler(scheduler):
+    """Sets the scheduler that drives the asynchronous functions in seagull
+       (such as seagull.util.asyncFind). If scheduler is None, a scheduler
+       with two workers is created when it is first needed.
+    """
+    global _scheduler
+    _scheduler = scheduler
+
+def getScheduler():
+    """Returns the scheduler that drives the asynchronous functions in
+       seagull.
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler()
+    return _scheduler
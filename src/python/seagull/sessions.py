@@ -0,0 +1,353 @@
+"""
+Copyright (c) 2010 Karl-Michael Schneider
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from __future__ import absolute_import
+import logging, os, pickle, subprocess, sys, threading, time, traceback
+from Queue import Queue, Empty
+
+_LOGGER = logging.getLogger(__name__)
+
+# prefix of the lines that workers write to report results; all other lines
+# written by a worker are logged
+_RESULT_PREFIX = '@@seagull '
+
+def _encode(value):
+    return pickle.dumps(value).encode('base64').replace('\n', '')
+
+def _decode(line):
+    return pickle.loads(line.decode('base64'))
+
+def _resolve(name):
+    """Returns the function named 'module:function'."""
+    modulename, functionname = name.split(':')
+    module = __import__(modulename, {}, {}, [functionname])
+    return getattr(module, functionname)
+
+class ScenarioResult:
+    """The result of running a scenario in a worker process."""
+
+    def __init__(self, scenario, args, worker, display):
+        self.scenario = scenario
+        self.args = args
+        self.worker = worker
+        self.display = display
+        self.ok = False
+        self.value = None
+        # traceback of the exception raised by the scenario, as a string
+        self.error = None
+        self.elapsed = 0
+        # files saved by the worker when the scenario failed
+        self.artifacts = []
+
+    def __str__(self):
+        if self.ok:
+            outcome = 'ok'
+        else:
+            outcome = 'FAILED'
+        return '%s%s on worker %s (%s): %s in %.3f seconds' % (
+                self.scenario, str(self.args), str(self.worker),
+                str(self.display),
+                outcome, self.elapsed)
+
+class SessionReport:
+    """The results of all scenarios run by SessionRunner.run()."""
+
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.elapsed = elapsed
+
+    def getFailures(self):
+        """Returns the results of the scenarios that failed."""
+        return [result for result in self.results if not result.ok]
+
+    def getThroughput(self):
+        """Returns the number of scenarios completed per second."""
+        if self.elapsed <= 0:
+            return 0.0
+        return len(self.results) / self.elapsed
+
+    def getScenarioTime(self):
+        """Returns the total time in seconds spent running scenarios in all
+           workers.
+        """
+        return sum([result.elapsed for result in self.results])
+
+    def __str__(self):
+        return '%d scenarios, %d failed, %.3f seconds, %.2f scenarios/second' % (
+                len(self.results), len(self.getFailures()), self.elapsed,
+                self.getThroughput())
+
+class SessionRunner:
+    """Runs scenarios in parallel in worker processes, each bound to its own
+       display. Since each worker is a separate process, seagull's module
+       settings (such as the debug region) and the screen are not shared
+       between scenarios running at the same time.
+       A scenario is a function without a return value or with a return value
+       that can be pickled. It is identified by a string 'module:function',
+       e.g. 'myscenarios:install', so that workers can import it.
+    """
+
+    def __init__(self, displays, command = None, setup = None,
+            artifacts = None, environment = None):
+        """Creates a runner with one worker per display. Displays is a list of
+           values for the DISPLAY environment variable of the workers (e.g.
+           [':1', ':2']). A display of None leaves DISPLAY unchanged.
+           Command is a list of the program and arguments that start the
+           interpreter of the workers. If command is None, the interpreter
+           that runs this runner is used.
+           If setup is not None, it is the name of a function
+           ('module:function') that each worker calls with its worker index
+           and display before running scenarios, e.g. to configure seagull or
+           to install a simulated screen backend for local tests.
+           If artifacts is not None, it is a directory where workers save a
+           screenshot when a scenario fails.
+           Environment is a dictionary of additional environment variables of
+           the workers.
+        """
+        self.displays = displays
+        if command is None:
+            command = [sys.executable]
+        self.command = command
+        self.setup = setup
+        self.artifacts = artifacts
+        self.environment = environment
+        self._processes = []
+
+    def start(self):
+        """Starts the worker processes. Called by run() if the workers have
+           not been started.
+        """
+        if self._processes:
+            return
+        for i in range(len(self.displays)):
+            self._processes.append(self._startWorker(i))
+
+    def _startWorker(self, i):
+        """Starts the worker process with index i and returns it."""
+        script = os.path.abspath(__file__)
+        if script.endswith('$py.class'):
+            script = script[:-len('$py.class')] + '.py'
+        elif script.endswith('.pyc') or script.endswith('.pyo'):
+            script = script[:-1]
+        display = self.displays[i]
+        env = dict(os.environ)
+        if self.environment is not None:
+            env.update(self.environment)
+        if display is not None:
+            env['DISPLAY'] = display
+        env['SEAGULL_SESSION_PATH'] = os.pathsep.join(sys.path)
+        args = self.command + [script, str(i), str(display),
+                str(self.setup), str(self.artifacts)]
+        _LOGGER.info('starting worker %d on display %s', i, str(display))
+        return subprocess.Popen(args, stdin = subprocess.PIPE,
+                stdout = subprocess.PIPE, stderr = subprocess.STDOUT,
+                env = env)
+
+    def stop(self):
+        """Stops the worker processes."""
+        for process in self._processes:
+            try:
+                process.stdin.close()
+                process.wait()
+            except (IOError, OSError):
+                pass
+        self._processes = []
+
+    def run(self, scenarios, timeout = None):
+        """Runs scenarios in the workers and returns a SessionReport.
+           Scenarios is a list of scenario names ('module:function') or tuples
+           (name, args), where args is a tuple of arguments that can be
+           pickled. Each scenario runs once, in the next worker that is idle.
+           Results are in the order of scenarios.
+           If timeout is not None, a scenario that has not finished after
+           timeout seconds (e.g. because it hangs in a wait) is reported as
+           failed, and its worker is killed and started again.
+        """
+        self.start()
+        tasks = Queue()
+        for i, scenario in enumerate(scenarios):
+            if isinstance(scenario, basestring):
+                scenario = (scenario, ())
+            tasks.put((i, scenario[0], tuple(scenario[1])))
+        results = [None] * len(scenarios)
+        start = time.time()
+        threads = []
+        for i in range(len(self._processes)):
+            thread = threading.Thread(target = self._feed,
+                    args = (i, tasks, results, timeout),
+                    name = 'seagull-session-%d' % i)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        # tasks are left if all workers have exited
+        while True:
+            try:
+                i, scenario, args = tasks.get_nowait()
+            except Empty:
+                break
+            results[i] = ScenarioResult(scenario, args, None, None)
+            results[i].error = 'not run, all workers exited'
+        report = SessionReport(results, time.time() - start)
+        _LOGGER.info('session finished: %s', str(report))
+        return report
+
+    def _feed(self, worker, tasks, results, timeout):
+        """Sends tasks to a worker and collects the results until there are
+           no more tasks or the worker dies. A worker that exceeds the timeout
+           is killed and started again.
+        """
+        process = self._processes[worker]
+        display = self.displays[worker]
+        while True:
+            try:
+                i, scenario, args = tasks.get_nowait()
+            except Empty:
+                return
+            result = ScenarioResult(scenario, args, worker, display)
+            results[i] = result
+            watchdog = None
+            killed = []
+            if timeout is not None:
+                def kill(process = process):
+                    killed.append(True)
+                    _LOGGER.error('worker %d: %s%s timed out after %f seconds, killing the worker',
+                            worker, scenario, str(args), timeout)
+                    try:
+                        process.kill()
+                    except OSError:
+                        pass
+                watchdog = threading.Timer(timeout, kill)
+                watchdog.setDaemon(True)
+            start = time.time()
+            try:
+                process.stdin.write(_encode((scenario, args)) + '\n')
+                process.stdin.flush()
+                if watchdog is not None:
+                    watchdog.start()
+                reply = self._readReply(worker, process)
+            except IOError:
+                reply = None
+            if watchdog is not None:
+                watchdog.cancel()
+            if killed:
+                result.elapsed = time.time() - start
+                result.error = 'timed out after %f seconds' % timeout
+                _LOGGER.error('%s', str(result))
+                try:
+                    process.wait()
+                except OSError:
+                    pass
+                process = self._startWorker(worker)
+                self._processes[worker] = process
+                continue
+            if reply is None:
+                result.error = 'worker %d exited' % worker
+                _LOGGER.error('%s', str(result))
+                # leave the remaining tasks to the other workers
+                return
+            result.ok, result.value, result.error, result.elapsed, \
+                    result.artifacts = reply
+            if result.ok:
+                _LOGGER.info('%s', str(result))
+            else:
+                _LOGGER.error('%s\n%s', str(result), result.error)
+
+    def _readReply(self, worker, process):
+        """Returns the next result reported by the worker, or None if the
+           worker has exited. Logs all other output of the worker.
+        """
+        while True:
+            line = process.stdout.readline()
+            if not line:
+                return None
+            line = line.rstrip('\r\n')
+            if line.startswith(_RESULT_PREFIX):
+                return _decode(line[len(_RESULT_PREFIX):])
+            if line:
+                _LOGGER.debug('[worker %d] %s', worker, line)
+
+def _saveScreenshot(artifacts, worker, number):
+    """Saves a screenshot of the screen into the artifacts directory and
+       returns a list of the saved files.
+    """
+    try:
+        from sikuli.Sikuli import SCREEN
+        from seagull.frame import captureFrame
+        from seagull.pixels import saveImage
+        filename = os.path.join(artifacts, 'worker%d-scenario%d.png' %
+                (worker, number))
+        saveImage(captureFrame(SCREEN).getImage(), filename)
+        return [filename]
+    except:
+        _LOGGER.exception('cannot save screenshot')
+        return []
+
+def _work(worker, display, setup, artifacts):
+    """Main loop of a worker process: reads scenarios from stdin, runs them
+       and writes the results to stdout.
+    """
+    if setup is not None:
+        _resolve(setup)(worker, display)
+    if artifacts is not None and not os.path.isdir(artifacts):
+        os.makedirs(artifacts)
+    number = 0
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            return
+        scenario, args = _decode(line.strip())
+        number += 1
+        start = time.time()
+        saved = []
+        try:
+            value = _resolve(scenario)(*args)
+            reply = (True, value, None)
+        except:
+            reply = (False, None, traceback.format_exc())
+            if artifacts is not None:
+                saved = _saveScreenshot(artifacts, worker, number)
+        elapsed = time.time() - start
+        try:
+            encoded = _encode(reply + (elapsed, saved))
+        except:
+            encoded = _encode((False, None, traceback.format_exc(), elapsed,
+                    saved))
+        # the scenario's output may not end with a newline, and the result
+        # must start a line of its own
+        sys.stdout.write('\n' + _RESULT_PREFIX + encoded + '\n')
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    for directory in os.environ.get('SEAGULL_SESSION_PATH', '').split(
+            os.pathsep):
+        if directory and directory not in sys.path:
+            sys.path.append(directory)
+    worker, display, setup, artifacts = sys.argv[1:5]
+    if display == 'None':
+        display = None
+    if setup == 'None':
+        setup = None
+    if artifacts == 'None':
+        artifacts = None
+    _work(int(worker), display, setup, artifacts)
@@ -0,0 +1,165 @@
+"""
+Copyright (c) 2010 Karl-Michael Schneider
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from seagull.imagehash import hammingDistance
+from seagull.pixels import getRGBPixels, grayPlane, resizeImage
+
+# size of the scaled-down image from which the hash is computed
+HASH_SIZE = 8
+
+class PixelSignature:
+    """A compact description of the pixels of a small image, such as a button:
+       a 64-bit hash of the image scaled down to 8x8 gray pixels (each bit is
+       set if the pixel is brighter than the average), and the mean color and
+       mean saturation of the scaled-down pixels.
+       Signatures are used to decide cheaply whether an image at a known
+       location still looks the same, without searching images.
+    """
+
+    def __init__(self, image):
+        """Computes the signature of the specified BufferedImage. The image is
+           scaled down once, so the cost does not depend on its size.
+        """
+        gray = []
+        red = green = blue = saturation = 0.0
+        for rgb in getRGBPixels(resizeImage(image, HASH_SIZE, HASH_SIZE)):
+            r, g, b = (rgb >> 16) & 0xff, (rgb >> 8) & 0xff, rgb & 0xff
+            gray.append(r * 0.299 + g * 0.587 + b * 0.114)
+            red += r
+            green += g
+            blue += b
+            brightest = max(r, g, b)
+            if brightest > 0:
+                saturation += float(brightest - min(r, g, b)) / brightest
+        n = len(gray)
+        mean = sum(gray) / n
+        self.hash = 0L
+        for value in gray:
+            self.hash <<= 1
+            if value > mean:
+                self.hash |= 1
+        self.color = (red / n, green / n, blue / n)
+        self.saturation = saturation / n
+
+    def hashDistance(self, other):
+        """Returns the number of bits in which the hashes of the two signatures
+           differ.
+        """
+        return hammingDistance(self.hash, other.hash)
+
+    def colorDistance(self, other):
+        """Returns the largest difference (0-255) between the mean colors of
+           the two signatures in any channel.
+        """
+        return max([abs(a - b) for a, b in zip(self.color, other.color)])
+
+    def matches(self, other, maxbits = 4, maxcolor = 12, maxsaturation = 0.05):
+        """Returns True if the two signatures describe almost the same pixels,
+           i.e. the hashes differ in no more than maxbits bits, no channel of
+           the mean colors differs by more than maxcolor, and the mean
+           saturations differ by no more than maxsaturation.
+        """
+        return self.hashDistance(other) <= maxbits and \
+                self.colorDistance(other) <= maxcolor and \
+                abs(self.saturation - other.saturation) <= maxsaturation
+
+    def __str__(self):
+        return 'PixelSignature[hash=%016x color=(%d,%d,%d) saturation=%.2f]' % (
+                self.hash, self.color[0], self.color[1], self.color[2],
+                self.saturation)
+
+# size of the scaled-down image from which a StateProbe reads pixels
+PROBE_SIZE = 16
+
+def probePixels(image):
+    """Returns the gray values of the specified BufferedImage scaled down to
+       PROBE_SIZE x PROBE_SIZE pixels.
+    """
+    return grayPlane(resizeImage(image, PROBE_SIZE, PROBE_SIZE))
+
+class StateProbe:
+    """Decides whether an element that can be checked or unchecked (such as a
+       checkbox) is checked by sampling a few pixels, without searching images.
+       The probe learns which pixels of the scaled-down element discriminate
+       checked from unchecked elements: a pixel is used if its gray value in
+       all checked samples differs from its gray value in all unchecked
+       samples by at least margin.
+    """
+
+    def __init__(self, checked, unchecked, margin = 32, maxpixels = 24):
+        """Learns the discriminating pixels from a list of BufferedImages of
+           checked elements and a list of BufferedImages of unchecked
+           elements. At most maxpixels pixels are used (those with the
+           largest gap between checked and unchecked values).
+        """
+        # pixels is a list of tuples (i, threshold, brighter) where i is the
+        # index of a pixel in probePixels(), threshold is the gray value that
+        # separates checked and unchecked samples, and brighter is True if the
+        # pixel is brighter in checked samples
+        self.pixels = []
+        if len(checked) == 0 or len(unchecked) == 0:
+            return
+        checked = [probePixels(image) for image in checked]
+        unchecked = [probePixels(image) for image in unchecked]
+        candidates = []
+        for i in range(PROBE_SIZE * PROBE_SIZE):
+            checked_values = [sample[i] for sample in checked]
+            unchecked_values = [sample[i] for sample in unchecked]
+            gap = min(checked_values) - max(unchecked_values)
+            if gap >= margin:
+                candidates.append((gap, i,
+                        max(unchecked_values) + gap / 2, True))
+            gap = min(unchecked_values) - max(checked_values)
+            if gap >= margin:
+                candidates.append((gap, i,
+                        max(checked_values) + gap / 2, False))
+        candidates.sort()
+        candidates.reverse()
+        self.pixels = [(i, threshold, brighter)
+                for gap, i, threshold, brighter in candidates[:maxpixels]]
+
+    def isUsable(self, minpixels = 4):
+        """Returns True if at least minpixels discriminating pixels were
+           found.
+        """
+        return len(self.pixels) >= minpixels
+
+    def classify(self, image, confidence = 0.9):
+        """Returns True if the element in the specified BufferedImage is
+           checked, False if it is unchecked, or None if less than the
+           specified fraction of the discriminating pixels agree.
+        """
+        if len(self.pixels) == 0:
+            return None
+        gray = probePixels(image)
+        votes = 0
+        for i, threshold, brighter in self.pixels:
+            if (gray[i] > threshold) == brighter:
+                votes += 1
+        if votes >= confidence * len(self.pixels):
+            return True
+        if len(self.pixels) - votes >= confidence * len(self.pixels):
+            return False
+        return None
+
+    def __str__(self):
+        return 'StateProbe[%d pixels]' % len(self.pixels)
@@ -0,0 +1,218 @@
+"""
+Copyright (c) 2010 Karl-Michael Schneider
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import sys, threading
+from array import array
+from seagull.pixels import grayPlane, loadImage
+
+# estimated size in bytes of a small object in Jython, such as a tuple, a
+# string or a long with the Java objects behind it
+OBJECT_BYTES = 96
+
+class Template:
+    """A decoded image file, together with preprocessed variants of it (e.g.
+       gray values, scaled copies) that matchers compute from it.
+       Templates are obtained from a TemplateStore, which keeps them in memory
+       so that each image file is decoded and preprocessed only once.
+    """
+
+    def __init__(self, filename, store):
+        self.filename = filename
+        self.image = loadImage(filename)
+        self.w = self.image.getWidth()
+        self.h = self.image.getHeight()
+        # 4 bytes per pixel in the decoded image
+        self.size = self.w * self.h * 4 + OBJECT_BYTES
+        self._store = store
+        self._variants = {}
+
+    def getVariant(self, key, function):
+        """Returns the variant of this template that is stored under the
+           specified key. If there is no such variant, calls function with
+           this template as the argument, which must return a tuple (value,
+           nbytes) where nbytes is the (estimated) size of the value in bytes,
+           and stores the value under the key first.
+           The estimate must include the overhead of Jython objects: every
+           element of a list is a reference to a boxed object (see
+           OBJECT_BYTES). Large variants should be Java primitive arrays
+           (e.g. array('d')), whose size is close to the size of their values.
+        """
+        try:
+            return self._variants[key]
+        except KeyError:
+            pass
+        value, nbytes = function(self)
+        self._store._lock.acquire()
+        try:
+            if key in self._variants:
+                # computed by another thread in the meantime
+                return self._variants[key]
+            self._variants[key] = value
+            self.size += nbytes
+            self._store._grow(self, nbytes)
+        finally:
+            self._store._lock.release()
+        return value
+
+    def getGray(self):
+        """Returns the gray values of this template's pixels as an
+           array('d') in row-major order.
+        """
+        return self.getVariant('gray',
+                lambda t: (array('d', grayPlane(t.image)),
+                    t.w * t.h * 8 + OBJECT_BYTES))
+
+class TemplateStore:
+    """Keeps decoded templates in memory, up to a budget of bytes. When the
+       budget is exceeded, the least recently used templates are evicted.
+       A store is safe to use from several threads.
+    """
+
+    def __init__(self, budget = 64 * 1024 * 1024):
+        """Creates a new store that keeps templates of no more than budget
+           bytes in total (not counting the template that was used last).
+        """
+        self.budget = budget
+        self._lock = threading.RLock()
+        # maps filenames to [template, last use]
+        self._entries = {}
+        self._clock = 0
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, filename):
+        """Returns the template of the specified image file, decoding the file
+           if it is not in the store.
+           Raises IOError if the file cannot be read.
+        """
+        self._lock.acquire()
+        try:
+            self._clock += 1
+            entry = self._entries.get(filename)
+            if entry is not None:
+                self.hits += 1
+                entry[1] = self._clock
+                return entry[0]
+            self.misses += 1
+            template = Template(filename, self)
+            self._entries[filename] = [template, self._clock]
+            self._grow(template, template.size)
+            return template
+        finally:
+            self._lock.release()
+
+    def peek(self, filename):
+        """Returns the template of the specified image file if it is in the
+           store, else None. Unlike get, does not decode the file and does not
+           count as a use of the template.
+        """
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(filename)
+            if entry is None:
+                return None
+            return entry[0]
+        finally:
+            self._lock.release()
+
+    def _grow(self, template, nbytes):
+        """Adds nbytes to the size of the store and evicts templates if the
+           budget is exceeded.
+        """
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(template.filename)
+            if entry is None or entry[0] is not template:
+                # the template was already evicted
+                return
+            self._bytes += nbytes
+            while self._bytes > self.budget and len(self._entries) > 1:
+                lru = None
+                for filename, (t, lastuse) in self._entries.iteritems():
+                    if t is not template and (lru is None or
+                            lastuse < self._entries[lru][1]):
+                        lru = filename
+                self._bytes -= self._entries.pop(lru)[0].size
+                self.evictions += 1
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """Removes all templates from the store.
+        """
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+            self._bytes = 0
+        finally:
+            self._lock.release()
+
+    def getStats(self):
+        """Returns a dictionary with the number of hits, misses and evictions,
+           the number of templates in the store and their total size in bytes.
+        """
+        self._lock.acquire()
+        try:
+            return { 'hits' : self.hits, 'misses' : self.misses,
+                     'evictions' : self.evictions,
+                     'templates' : len(self._entries), 'bytes' : self._bytes }
+        finally:
+            self._lock.release()
+
+_store = TemplateStore()
+
+def setTemplateStore(store):
+    """Sets the store that seagull's matchers load templates from.
+    """
+    global _store
+    _store = store
+
+def getTemplateStore():
+    """Returns the store that seagull's matchers load templates from.
+    """
+    return _store
+
+def loadTemplate(filename):
+    """Returns the template of the specified image file from the current
+       template store.
+    """
+    return _store.get(filename)
+
+def templateSize(filename):
+    """Returns a tuple (width, height) of the specified image file. If the
+       template is not in the current template store, the size is taken from
+       the manifest of the Sikuli project that contains the image (see
+       sikuliimport.manifest), so that the image need not be decoded. The
+       template is loaded only if the image is in no manifest.
+    """
+    template = _store.peek(filename)
+    if template is None:
+        # only use the projects if they have been imported already
+        projects = sys.modules.get('sikuliimport.projects')
+        if projects is not None and hasattr(projects, 'image_info'):
+            info = projects.image_info(filename)
+            if info is not None:
+                return info[0], info[1]
+        template = _store.get(filename)
+    return template.w, template.h
@@ -0,0 +1,207 @@
+"""
+Copyright (c) 2010 Karl-Michael Schneider
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import atexit, logging, threading
+from java.lang import Thread
+from seagull.instrumentation import now
+from seagull.jsonformat import toJSON
+
+_LOGGER = logging.getLogger(__name__)
+
+# the default maximum number of spans that are kept in memory; later spans
+# are counted but dropped
+MAX_SPANS = 50000
+
+_enabled = False
+_max_spans = MAX_SPANS
+_lock = threading.Lock()
+# list of (name, category, start, duration, thread id, args) tuples
+_spans = []
+_dropped = 0
+# maps thread id to thread name
+_threads = {}
+_origin = now()
+_filename = None
+_registered = False
+
+class _Span:
+    """A span that has begun but not ended."""
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = now()
+
+def setEnabled(flag, filename = None, maxspans = None):
+    """Turns tracing on or off. Spans are kept in memory until they are
+       written with writeTrace(filename, clear = True) or discarded with
+       clearTrace(). If filename is not None, the trace is also written to
+       that file when the program exits. If maxspans is not None, no more
+       than maxspans spans are kept (MAX_SPANS by default); later spans are
+       counted but dropped.
+    """
+    global _enabled, _filename, _registered, _max_spans
+    if maxspans is not None:
+        if maxspans < 1:
+            raise ValueError('maxspans must be positive')
+        _max_spans = maxspans
+    _enabled = flag
+    if filename is not None:
+        _filename = filename
+        if not _registered:
+            atexit.register(_writeAtExit)
+            _registered = True
+
+def isEnabled():
+    """Returns True if spans are recorded."""
+    return _enabled
+
+def begin(name, category = 'seagull', args = None):
+    """Begins a span with the specified name and category in this thread.
+       Args is None or a dictionary that is shown with the span in a trace
+       viewer. Returns a token for end(), which is None if tracing is
+       disabled.
+    """
+    if not _enabled:
+        return None
+    return _Span(name, category, args)
+
+def end(span, args = None):
+    """Ends a span that was returned by begin(). Args is None or a
+       dictionary that is added to the arguments of the span (e.g. the
+       result of the traced operation).
+    """
+    global _dropped
+    if span is None:
+        return
+    finish = now()
+    if args is not None:
+        if span.args is None:
+            span.args = {}
+        span.args.update(args)
+    thread = Thread.currentThread()
+    tid = thread.getId()
+    _lock.acquire()
+    try:
+        if len(_spans) >= _max_spans:
+            _dropped += 1
+            return
+        _spans.append((span.name, span.category, span.start,
+                finish - span.start, tid, span.args))
+        if tid not in _threads:
+            _threads[tid] = thread.getName()
+    finally:
+        _lock.release()
+
+def traceMethods(cls, names, category):
+    """Replaces the named methods of cls with methods that record a span
+       named '<class name>.<method name>' for each call.
+    """
+    for name in names:
+        setattr(cls, name, _tracedMethod(cls.__name__ + '.' + name,
+                category, getattr(cls, name)))
+
+def _tracedMethod(name, category, method):
+    def traced(*args, **kwargs):
+        span = begin(name, category)
+        try:
+            return method(*args, **kwargs)
+        finally:
+            end(span)
+    traced.__name__ = method.__name__
+    traced.__doc__ = method.__doc__
+    return traced
+
+def getSpanCount():
+    """Returns the number of spans that are kept in memory."""
+    return len(_spans)
+
+def _takeSpans(clear):
+    """Returns a tuple (spans, threads, dropped) of the recorded spans, the
+       (thread id, thread name) pairs and the number of dropped spans, and
+       discards them if clear is True.
+    """
+    global _dropped
+    _lock.acquire()
+    try:
+        spans = list(_spans)
+        threads = _threads.items()
+        dropped = _dropped
+        if clear:
+            del _spans[:]
+            _threads.clear()
+            _dropped = 0
+    finally:
+        _lock.release()
+    return spans, threads, dropped
+
+def clearTrace():
+    """Discards all spans."""
+    _takeSpans(True)
+
+def formatTrace(clear = False):
+    """Returns the spans in Chrome trace event format (a JSON string that
+       can be loaded in chrome://tracing or Perfetto). Each span is a
+       complete event with times in microseconds since seagull.tracing was
+       imported. If clear is True, the returned spans are discarded.
+    """
+    spans, threads, dropped = _takeSpans(clear)
+    events = []
+    for tid, name in threads:
+        events.append({'name' : 'thread_name', 'ph' : 'M', 'pid' : 1,
+                'tid' : tid, 'args' : {'name' : name}})
+    if dropped > 0:
+        events.append({'name' : 'dropped_spans', 'ph' : 'M', 'pid' : 1,
+                'tid' : 0, 'args' : {'count' : dropped}})
+    for name, category, start, duration, tid, args in spans:
+        event = {'name' : name, 'cat' : category, 'ph' : 'X', 'pid' : 1,
+                'tid' : tid, 'ts' : int((start - _origin) * 1e6),
+                'dur' : int(duration * 1e6)}
+        if args is not None:
+            event['args'] = args
+        events.append(event)
+    # one event per line keeps large traces readable and cheap to build
+    lines = [toJSON(event, False) for event in events]
+    return '{"displayTimeUnit": "ms", "traceEvents": [\n%s\n]}\n' % (
+            ',\n'.join(lines))
+
+def writeTrace(filename, clear = False):
+    """Writes the spans to the specified file in Chrome trace event format.
+       If clear is True, the written spans are discarded, so that a long
+       session can write its trace in parts without keeping all spans in
+       memory.
+    """
+    trace = formatTrace(clear)
+    output = open(filename, 'w')
+    try:
+        output.write(trace)
+    finally:
+        output.close()
+    _LOGGER.info('wrote trace to %s', filename)
+
+def _writeAtExit():
+    if _filename is not None and len(_spans) > 0:
+        try:
+            writeTrace(_filename)
+        except IOError, e:
+            _LOGGER.error('cannot write trace to %s: %s', _filename, e)
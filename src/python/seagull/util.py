@@ -20,17 +20,44 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-import logging
-from time import sleep
-from sikuli.Sikuli import SCREEN, FindFailed
+import logging, sys, threading
+from java.util.concurrent import Callable, ExecutorCompletionService, \
+        Executors
+from sikuli.Sikuli import SCREEN, FindFailed, Screen
+from sikuli.Sikuli import openApp as _openApp
 from sikuli.Region import Region
+from org.sikuli.script import Settings
+from seagull import clock, instrumentation, metrics, tracing
 from seagull.overlaywindow import OutlineOverlayWindow
+from seagull.regionindex import regionRect, RegionIndex, sameRect
+from seagull.scheduler import AsyncResult, DaemonThreadFactory, getScheduler
+from seagull.frame import captureFrame, getFrameCacheTTL, getScreenBackend, \
+        invalidateFrames, isDefaultMatcher
+from seagull.imagehash import dHash, hammingDistance, templateHashes
+from seagull.matchers import getTemplate
+from seagull.templates import templateSize
 
 logging.basicConfig()
 _LOGGER = logging.getLogger(__name__)
 _debug_region = None
 _show_regions = False
 _overlaywindow = None
+_single_capture = False
+_match_workers = 1
+_match_executor = None
+_screen_executor = None
+_change_poll_interval = None
+_frame_scan_interval = None
+_position_hint_margin = None
+# the maximum number of remembered positions; the least recently used
+# positions are forgotten first
+MAX_POSITION_HINTS = 1000
+# maps (image, region rectangle) to [rectangle of the last match, last use]
+_position_hints = {}
+_position_hint_clock = 0
+_position_hint_stats = { 'hits' : 0, 'misses' : 0, 'unhinted' : 0 }
+_position_hint_lock = threading.Lock()
+_hash_prefilter = None
 
 # click(arg, [modifiers]) requires modifiers if it is called on an instance of
 # edu.mit.csail.uid.Region. To make code more readable, use NO_MODIFIER.
@@ -94,6 +121,233 @@ def getShowRegions():
     """
     return _show_regions
 
+def setSingleCapture(flag):
+    """If flag is True, functions that search for several images in a region
+       (such as findAny and getAllMatches) capture the region only once in
+       each round of searching and search all images in that capture. This is
+       faster than capturing the region for each image, and all images are
+       searched in the same screen state.
+       If flag is False, each image is searched in a new capture of the region.
+    """
+    global _single_capture
+    _single_capture = flag
+
+def getSingleCapture():
+    """Returns True if the region is captured only once per search round.
+    """
+    return _single_capture
+
+def setHashPrefilter(maxdistance):
+    """If maxdistance is not None, bestMatch and bestMatches skip images that
+       cannot match the element shown in the search region. This applies only
+       if the search region is a small neighbourhood of an element (no more
+       than four times the size of an image), such as a region around a known
+       button. An image is skipped if the difference hash of the image and the
+       difference hash of the center of the region differ in more than
+       maxdistance bits. If all images would be skipped, all images are
+       searched.
+       If maxdistance is None, all images are searched.
+    """
+    global _hash_prefilter
+    _hash_prefilter = maxdistance
+
+def getHashPrefilter():
+    """Returns the maximum hash distance of images that are searched by
+       bestMatch and bestMatches, or None if images are not pre-filtered.
+    """
+    return _hash_prefilter
+
+def setMatchWorkers(workers):
+    """Sets the number of threads that search images concurrently in a
+       search round of functions that search for several images (such as
+       findAny, getAllMatches, bestMatch and bestMatches).
+       If workers is greater than 1, the region is captured once per round
+       (regardless of the single capture setting) and the images are searched
+       in that capture concurrently. Results are always returned in the order
+       of the images.
+       The default is 1, which searches one image after the other.
+    """
+    global _match_workers, _match_executor
+    if workers < 1:
+        raise ValueError('number of match workers must be at least 1')
+    if _match_executor is not None:
+        _match_executor.shutdown()
+        _match_executor = None
+    _match_workers = workers
+
+def getMatchWorkers():
+    """Returns the number of threads that search images concurrently.
+    """
+    return _match_workers
+
+def setChangeDrivenWaits(interval):
+    """If interval is not None, functions that wait for something to change on
+       the screen (such as waitWhileFound, Buttons.waitUntilButtonIsEnabled,
+       Checkable.wait) capture the watched region every interval seconds, for
+       example every 0.1 seconds, and only search images again when the pixels
+       in the region have changed. Capturing and comparing a region is much
+       cheaper than searching images, so waits react faster and use less CPU.
+       If interval is None (the default), images are searched again at the
+       wait's own interval.
+    """
+    global _change_poll_interval
+    if interval is not None and interval <= 0:
+        raise ValueError('poll interval must be positive')
+    _change_poll_interval = interval
+
+def getChangeDrivenWaits():
+    """Returns the poll interval of change-driven waits, or None if waits are
+       not change-driven.
+    """
+    return _change_poll_interval
+
+def setFrameScanInterval(interval):
+    """Sets the time (in seconds) between two searches of find() and
+       findAll() while they wait for an image that is searched in captured
+       frames (e.g. because the frame cache is enabled, see
+       seagull.frame.setFrameCacheTTL). If interval is None (the default),
+       frames are searched at Sikuli's scan rate (1 / Settings.WaitScanRate),
+       as region.find() does.
+    """
+    global _frame_scan_interval
+    if interval is not None and interval <= 0:
+        raise ValueError('scan interval must be positive')
+    _frame_scan_interval = interval
+
+def getFrameScanInterval():
+    """Returns the time (in seconds) between two searches of find() and
+       findAll() in captured frames.
+    """
+    if _frame_scan_interval is not None:
+        return _frame_scan_interval
+    return 1.0 / Settings.WaitScanRate
+
+def setPositionHints(margin):
+    """If margin is not None, find() remembers where each image was last found
+       in each region, and the next time the same image is searched in the
+       same region, first searches the neighbourhood of the last match,
+       extended by margin pixels on each side. The entire region is only
+       searched if the image is not found there.
+       Note that if an image exists more than once in a region, this may
+       return a different occurrence than searching the entire region.
+       If margin is None (the default), position hints are not used.
+       At most MAX_POSITION_HINTS positions are remembered.
+    """
+    global _position_hint_margin
+    if margin is not None and margin < 0:
+        raise ValueError('margin must not be negative')
+    _position_hint_margin = margin
+
+def getPositionHints():
+    """Returns the margin of position hints, or None if position hints are not
+       used.
+    """
+    return _position_hint_margin
+
+def getPositionHintStats():
+    """Returns a dictionary with the number of searches where the image was
+       found near its last position ('hits'), where it was not found near its
+       last position ('misses'), and where its position was not known
+       ('unhinted'), and the fraction of hits among all searches ('hitrate').
+    """
+    _position_hint_lock.acquire()
+    try:
+        stats = dict(_position_hint_stats)
+    finally:
+        _position_hint_lock.release()
+    total = stats['hits'] + stats['misses'] + stats['unhinted']
+    if total > 0:
+        stats['hitrate'] = float(stats['hits']) / total
+    else:
+        stats['hitrate'] = 0.0
+    return stats
+
+def resetPositionHints():
+    """Forgets all remembered positions and resets the statistics.
+    """
+    _position_hint_lock.acquire()
+    try:
+        _position_hints.clear()
+        for key in _position_hint_stats:
+            _position_hint_stats[key] = 0
+    finally:
+        _position_hint_lock.release()
+
+def setMetrics(flag):
+    """If flag is True, records metrics of searches, captures, waits,
+       failures, clicks and dialogue windows in seagull's metrics registry,
+       from where exporters send them to monitoring systems (see
+       seagull.metrics). If flag is False (the default), nothing is recorded.
+    """
+    metrics.setEnabled(flag)
+
+def getMetrics():
+    """Returns True if metrics are recorded."""
+    return metrics.isEnabled()
+
+def setInstrumentation(flag):
+    """If flag is True, records statistics of find, findAny, getAllMatches,
+       bestMatch, bestMatches, click and AnchoredRegion.anchor: for each
+       function, template and region size, the number of calls, hits and
+       misses, and histograms of the capture time, match time and match
+       scores (see seagull.instrumentation). If flag is False (the default),
+       no statistics are recorded.
+       Instrumentation does not change how searches run. Capture and match
+       time are recorded separately only for searches in captured frames
+       (see seagull.frame); when images are searched with region.find(),
+       the whole search counts as match time.
+    """
+    instrumentation.setEnabled(flag)
+
+def getInstrumentation():
+    """Returns True if search statistics are recorded."""
+    return instrumentation.isEnabled()
+
+def getSearchStats():
+    """Returns the recorded search statistics as a list of tuples (function,
+       template, width, height, stats), where stats is a dictionary. Template
+       is None for the statistics of entire calls.
+    """
+    return instrumentation.getStats()
+
+def dumpSearchStats(limit = None, out = None):
+    """Writes the recorded search statistics of templates as a table, with
+       the templates that took the most time searching first, to out (a file
+       object), or logs it if out is None. If limit is not None, writes only
+       that many templates.
+    """
+    table = instrumentation.formatStats(limit)
+    if out is None:
+        _LOGGER.info('search statistics:\n%s', table)
+    else:
+        out.write(table + '\n')
+
+def resetSearchStats():
+    """Discards the recorded search statistics."""
+    instrumentation.resetStats()
+
+def setTracing(flag, filename = None, maxspans = None):
+    """If flag is True, records spans of dialogue windows, waits, search
+       rounds and installer steps in memory (see seagull.tracing). If
+       filename is not None, the spans are written to that file in Chrome
+       trace event format when the program exits. If maxspans is not None,
+       no more than maxspans spans are kept in memory (default
+       seagull.tracing.MAX_SPANS). If flag is False (the default), no spans
+       are recorded.
+    """
+    tracing.setEnabled(flag, filename, maxspans)
+
+def getTracing():
+    """Returns True if spans are recorded."""
+    return tracing.isEnabled()
+
+def writeTrace(filename, clear = False):
+    """Writes the recorded spans to the specified file in Chrome trace event
+       format, which can be opened in chrome://tracing or Perfetto. If clear
+       is True, the written spans are discarded.
+    """
+    tracing.writeTrace(filename, clear)
+
 def showRegion(region, duration = 2):
     """Shows the outline and center of the specified region on the current
        screen for the specified duration.
@@ -109,21 +363,206 @@ def _debug(methodname, iarg, arg, region, match):
     _LOGGER.debug('%s: find(%d=%s, region=%s) = %s',
             methodname, iarg, str(arg), str(region), str(match))
 
+class _Task(Callable):
+    """Calls a function with a single argument in a worker thread.
+       Returns a tuple (True, result), or (False, exc_info) if the function
+       raised an exception, so that the exception can be raised again in the
+       calling thread.
+    """
+
+    def __init__(self, function, arg):
+        self.function = function
+        self.arg = arg
+
+    def call(self):
+        try:
+            return True, self.function(self.arg)
+        except:
+            return False, sys.exc_info()
+
+def _getExecutor():
+    global _match_executor
+    if _match_executor is None:
+        _match_executor = Executors.newFixedThreadPool(_match_workers,
+                DaemonThreadFactory('seagull-match-worker'))
+    return _match_executor
+
+def _mapConcurrently(function, args):
+    """Calls function for each element in args using the match worker
+       threads and returns a list of the results in the order of args.
+    """
+    executor = _getExecutor()
+    call = instrumentation.current()
+    futures = [executor.submit(_Task(
+            lambda arg: instrumentation.runIn(call, function, arg), arg))
+            for arg in args]
+    results = []
+    for future in futures:
+        ok, value = future.get()
+        if not ok:
+            raise value[0], value[1], value[2]
+        results.append(value)
+    return results
+
+def _captureRound(region):
+    """Returns a frame in which all images of a search round are searched,
+       or None if each image is searched directly in the region.
+    """
+    if _single_capture or _match_workers > 1 or _findsInFrames():
+        return captureFrame(region)
+    return None
+
+def _findInRound(arg, region, frame):
+    """Searches arg once in the frame of the current search round, or in the
+       region if frame is None. Returns the match or None.
+    """
+    if frame is None:
+        # not find(), whose metrics would count the search a second time in
+        # the calling search function
+        return _findHinted(arg, region, 0, False)
+    if _position_hint_margin is None:
+        return frame.find(arg)
+    key = _hintKey(arg, region)
+    hint = _getHint(key)
+    if hint is not None:
+        x, y, w, h = hint
+        subframe = frame.crop(x, y, w, h)
+        if subframe is not None:
+            match = subframe.find(arg)
+            if match is not None:
+                _countHint('hits')
+                _rememberPosition(key, match)
+                return match
+        _countHint('misses')
+    else:
+        _countHint('unhinted')
+    match = frame.find(arg)
+    if match is not None:
+        _rememberPosition(key, match)
+    return match
+
+def _findAllInRound(arg, region, frame):
+    """Searches all occurrences of arg once in the frame of the current
+       search round, or in the region if frame is None. Returns a list of
+       matches, which is empty if arg is not found.
+    """
+    if frame is None:
+        matches = findAll(arg, region = region, timeout = 0,
+                exception = False)
+        if matches is None:
+            return []
+        return list(matches)
+    return frame.findAll(arg)
+
+def _searchRound(args, region, frame, findfunction = _findInRound):
+    """Searches each element in args once and yields the results in the
+       order of args.
+       If there is more than one match worker, all elements are searched
+       concurrently before the first result is yielded. Otherwise, each
+       element is searched only when its result is requested, so the caller
+       can stop searching after any element.
+    """
+    if _match_workers > 1 and len(args) > 1:
+        for result in _mapConcurrently(
+                lambda arg: findfunction(arg, region, frame), args):
+            yield result
+    else:
+        for arg in args:
+            yield findfunction(arg, region, frame)
+
+def findInFrames(searches):
+    """Searches each image in its frame, where searches is a list of tuples
+       (image, frame), and returns a list of the matches (or None if an image
+       is not found) in the order of searches.
+       The searches are done concurrently if there is more than one match
+       worker (see setMatchWorkers). This is useful to search the images of
+       many small regions in one capture of a larger region (see
+       seagull.frame.Frame.crop).
+    """
+    def search(imageframe):
+        image, frame = imageframe
+        return _findInRound(image, frame.region, frame)
+    if _match_workers > 1 and len(searches) > 1:
+        return _mapConcurrently(search, searches)
+    return [search(imageframe) for imageframe in searches]
+
 class TimeoutExceeded(Exception):
     """Raised by the Wait class when the timeout is exceeded while waiting."""
 
     def __init__(self, message):
         Exception.__init__(self, message)
 
+class FixedPolling:
+    """A polling policy that sleeps for the wait's interval every time."""
+
+    def getInterval(self, interval, polls, elapsed):
+        """Returns the number of seconds to sleep, given the wait's interval,
+           the number of times the wait has already slept, and the time (in
+           seconds) since the wait was created.
+        """
+        return interval
+
+class ExponentialBackoff:
+    """A polling policy that starts with a short sleep and multiplies it by a
+       factor every time, but never sleeps longer than the wait's interval.
+    """
+
+    def __init__(self, initial = 0.1, factor = 2):
+        self.initial = initial
+        self.factor = factor
+
+    def getInterval(self, interval, polls, elapsed):
+        """Specified in FixedPolling."""
+        return min(interval, self.initial * self.factor ** polls)
+
+class FastThenSlow:
+    """A polling policy that sleeps for a short time during the first period
+       seconds of the wait, and for the wait's interval after that.
+    """
+
+    def __init__(self, fast = 0.1, period = 2):
+        self.fast = fast
+        self.period = period
+
+    def getInterval(self, interval, polls, elapsed):
+        """Specified in FixedPolling."""
+        if elapsed < self.period:
+            return min(interval, self.fast)
+        return interval
+
+_polling_policy = FixedPolling()
+
+def setPollingPolicy(policy):
+    """Sets the polling policy of waits that are created without a policy
+       (which includes all waits in seagull). If policy is None, waits sleep
+       for their interval every time (FixedPolling), which is the default.
+    """
+    global _polling_policy
+    if policy is None:
+        _polling_policy = FixedPolling()
+    else:
+        _polling_policy = policy
+
+def getPollingPolicy():
+    """Returns the default polling policy of waits."""
+    return _polling_policy
+
 class Wait:
     """Simple class to sleep in intervals until a timeout is reached. A
        TimeoutExceeded exception is raised when the timeout is reached.
+       The timeout is a deadline on seagull's monotonic clock, so the time
+       spent between calls of wait() (e.g. searching images) counts towards
+       the timeout as well as the time spent sleeping.
+       How long each call of wait() sleeps is decided by a polling policy.
     """
 
     def __init__(self, timeout, interval = 1,
-            exception_message = 'maximum waiting time exceeded'):
+            exception_message = 'maximum waiting time exceeded',
+            policy = None):
         """Creates a new instance with the specified timeout, interval and
            exception message. If the timeout is None, waits forever.
+           If policy is None, uses the default polling policy (see
+           setPollingPolicy).
         """
         # catch bugs where exception message is passed without parameter name
         if not (isinstance(interval, int) or isinstance(interval, float)):
@@ -131,22 +570,62 @@ class Wait:
         self.timeout = timeout
         self.interval = interval
         self.exception_message = exception_message
+        if policy is None:
+            self.policy = _polling_policy
+        else:
+            self.policy = policy
+        self.start = clock.now()
+        if timeout is not None:
+            self.deadline = self.start + timeout
+        else:
+            self.deadline = None
+        self.polls = 0
+        self.sleep_time = 0
+        self.probe_time = 0
+        self._awake_since = self.start
+        # time since this instance was created
         self.waited = 0
 
     def wait(self):
-        """Sleeps for the number of seconds specified in this instance's
-           interval, but no longer than until the timeout is reached.
+        """Sleeps for the number of seconds determined by the polling policy,
+           but no longer than until the timeout is reached.
            Raises TimeoutExceeded if the timeout has been reached before
            sleeping.
         """
-        if self.timeout is not None:
-            if self.waited >= self.timeout:
-                raise TimeoutExceeded(self.exception_message)
-            sec = min(self.interval, self.timeout - self.waited)
-        else:
-            sec = self.interval
-        sleep(sec)
-        self.waited += sec
+        now = clock.now()
+        self.probe_time += now - self._awake_since
+        self._awake_since = now
+        self.waited = now - self.start
+        if self.deadline is not None and now >= self.deadline:
+            _LOGGER.debug('timeout after %f seconds: %f seconds sleeping, %f seconds probing, %d polls',
+                    self.waited, self.sleep_time, self.probe_time, self.polls)
+            raise TimeoutExceeded(self.exception_message)
+        sec = self.policy.getInterval(self.interval, self.polls, self.waited)
+        if self.deadline is not None:
+            sec = min(sec, self.deadline - now)
+        span = tracing.begin('sleep', 'wait', {'poll' : self.polls})
+        try:
+            clock.sleep(sec)
+        finally:
+            tracing.end(span)
+        self.polls += 1
+        self._awake_since = clock.now()
+        self.sleep_time += self._awake_since - now
+        self.waited = self._awake_since - self.start
+
+    def getElapsedTime(self):
+        """Returns the time in seconds since this instance was created."""
+        return clock.now() - self.start
+
+    def getSleepTime(self):
+        """Returns the time in seconds that was spent sleeping in wait()."""
+        return self.sleep_time
+
+    def getProbeTime(self):
+        """Returns the time in seconds that was spent between calls of wait(),
+           i.e. checking whether to stop waiting.
+        """
+        return self.probe_time + clock.now() - self._awake_since
 
     def setExceptionMessage(self, message):
         """Sets the exception message. Can be used to change the exception
@@ -154,39 +633,332 @@ class Wait:
         """
         self.exception_message = message
 
+class RegionWatcher:
+    """Detects whether the pixels in a region have changed. Used by
+       change-driven waits (see setChangeDrivenWaits).
+       If change-driven waits are disabled, a watcher reports every poll as a
+       change, so waits search again after every interval.
+    """
+
+    def __init__(self, region):
+        """Creates a new watcher for the specified region, and records the
+           current pixels in the region if change-driven waits are enabled.
+        """
+        self.region = region
+        self.signature = None
+        self.hasChanged()
+
+    def getPollInterval(self, interval):
+        """Returns the interval at which a wait should poll: the interval of
+           change-driven waits if they are enabled, else the specified
+           interval.
+        """
+        if _change_poll_interval is None:
+            return interval
+        return _change_poll_interval
+
+    def hasChanged(self):
+        """Returns True if the pixels in the region have changed since the
+           last call. Always returns True if change-driven waits are disabled.
+        """
+        if _change_poll_interval is None:
+            return True
+        signature = captureFrame(self.region).getSignature()
+        changed = signature != self.signature
+        self.signature = signature
+        return changed
+
+    def waitForChange(self, waiting):
+        """Calls waiting.wait() until the pixels in the region have changed.
+           If change-driven waits are disabled, calls waiting.wait() once.
+           Raises TimeoutExceeded if the wait's timeout is reached.
+        """
+        waiting.wait()
+        while not self.hasChanged():
+            waiting.wait()
+
+def _hintKey(arg, region):
+    if isinstance(arg, basestring):
+        image = arg
+    else:
+        image = str(arg)
+    return image, (region.getX(), region.getY(), region.getW(),
+            region.getH())
+
+def _getHint(key):
+    """Returns the rectangle (x, y, w, h) in which the image is searched first,
+       or None if the image has not been found in the region before.
+    """
+    global _position_hint_clock
+    _position_hint_lock.acquire()
+    try:
+        entry = _position_hints.get(key)
+        if entry is None:
+            return None
+        _position_hint_clock += 1
+        entry[1] = _position_hint_clock
+        x, y, w, h = entry[0]
+    finally:
+        _position_hint_lock.release()
+    m = _position_hint_margin
+    return x - m, y - m, w + 2 * m, h + 2 * m
+
+def _rememberPosition(key, match):
+    """Remembers the position of match, and forgets the least recently used
+       position if more than MAX_POSITION_HINTS are remembered.
+    """
+    global _position_hint_clock
+    rect = (match.getX(), match.getY(), match.getW(), match.getH())
+    _position_hint_lock.acquire()
+    try:
+        _position_hint_clock += 1
+        _position_hints[key] = [rect, _position_hint_clock]
+        if len(_position_hints) > MAX_POSITION_HINTS:
+            lru = None
+            for oldkey, (oldrect, lastuse) in _position_hints.iteritems():
+                if lru is None or lastuse < _position_hints[lru][1]:
+                    lru = oldkey
+            del _position_hints[lru]
+    finally:
+        _position_hint_lock.release()
+
+def _countHint(outcome):
+    _position_hint_lock.acquire()
+    try:
+        _position_hint_stats[outcome] += 1
+    finally:
+        _position_hint_lock.release()
+
+def _observeSearch(function, start):
+    """Records the time since start in the search metrics of the function."""
+    metrics.observeSince('seagull_search_seconds', start,
+            (('function', function),))
+
+def countFailure(exception, function):
+    """Counts a search or wait of the function that failed with the named
+       exception.
+    """
+    metrics.increment('seagull_timeouts_total',
+            labels = (('exception', exception), ('function', function)))
+
+def observeWait(wait, start):
+    """Records the duration of a wait (named wait) that started at start, as
+       returned by seagull.metrics.now().
+    """
+    metrics.observeSince('seagull_wait_seconds', start, (('wait', wait),))
+
 def find(arg, region = SCREEN, timeout = None, exception = None):
     """Behaves like region.find(arg) except that if timeout and exception are
        not None, the auto wait time and exception of the region are set to the
        specified values before the find method is called, and restored when the
        find method returns.
+       If a matcher other than Sikuli's own matcher is set (see
+       seagull.frame.setMatcher) or the frame cache is enabled (see
+       seagull.frame.setFrameCacheTTL), the region is captured and the capture
+       is searched until the timeout is reached.
+       If position hints are enabled (see setPositionHints), first searches
+       the neighbourhood of the last match of arg in the region.
     """
+    call = instrumentation.begin('find', region)
+    span = tracing.begin('find', 'search',
+            {'template' : instrumentation.templateName(arg)})
+    start = metrics.now()
+    match = None
+    try:
+        try:
+            match = _findHinted(arg, region, timeout, exception)
+        except FindFailed:
+            countFailure('FindFailed', 'find')
+            raise
+    finally:
+        instrumentation.end(call, [arg], [match])
+        _observeSearch('find', start)
+        tracing.end(span, {'found' : match is not None})
+    return match
+
+def _findHinted(arg, region, timeout, exception):
+    """Implements find() with position hints."""
+    if _position_hint_margin is None:
+        return _find(arg, region, timeout, exception)
+    key = _hintKey(arg, region)
+    hint = _getHint(key)
+    if hint is not None:
+        x, y, w, h = hint
+        x0, y0 = max(x, region.getX()), max(y, region.getY())
+        x1 = min(x + w, region.getX() + region.getW())
+        y1 = min(y + h, region.getY() + region.getH())
+        if x1 > x0 and y1 > y0:
+            match = _find(arg, Region(x0, y0, x1 - x0, y1 - y0), 0, False)
+            if match is not None:
+                _countHint('hits')
+                _rememberPosition(key, match)
+                return match
+        _countHint('misses')
+    else:
+        _countHint('unhinted')
+    match = _find(arg, region, timeout, exception)
+    if match is not None:
+        _rememberPosition(key, match)
+    return match
+
+def _find(arg, region, timeout, exception):
+    """Implements find() without position hints."""
+    if _findsInFrames():
+        return _findInFrames(arg, region, timeout, exception)
     if timeout is not None:
         t = setTimeout(region, timeout)
     if exception is not None:
         e = setException(region, exception)
+    # region.find() captures the screen itself, so its capture time cannot
+    # be told apart from the match time; the whole call counts as matching
+    start = instrumentation.now()
+    match = None
     try:
         match = region.find(arg)
     finally:
+        instrumentation.addMatchTime(arg, instrumentation.now() - start,
+                match)
         if timeout is not None:
             setTimeout(region, t)
         if exception is not None:
             setException(region, e)
     return match
 
+def _findsInFrames():
+    """Returns True if find() searches in captured frames instead of calling
+       region.find().
+    """
+    return not isDefaultMatcher() or getFrameCacheTTL() > 0 or \
+            getScreenBackend() is not None
+
+def _findInFrames(arg, region, timeout, exception):
+    """Searches arg in captures of the region until it is found or the
+       timeout is reached, at the scan interval (see setFrameScanInterval).
+    """
+    if timeout is None:
+        timeout = region.getAutoWaitTimeout()
+    if exception is None:
+        exception = region.getThrowException()
+    waiting = Wait(timeout, interval = getFrameScanInterval())
+    while True:
+        span = tracing.begin('find round', 'search')
+        try:
+            match = captureFrame(region).find(arg)
+        finally:
+            tracing.end(span)
+        if match is not None:
+            return match
+        try:
+            waiting.wait()
+        except TimeoutExceeded:
+            break
+    if exception:
+        raise FindFailed('%s not found after %f seconds' % (str(arg), timeout))
+    return None
+
+def findAll(arg, region = SCREEN, timeout = None, exception = None):
+    """Behaves like region.findAll(arg) except that if timeout and exception
+       are not None, the auto wait time and exception of the region are set to
+       the specified values before the findAll method is called, and restored
+       when the findAll method returns.
+       If find() searches in captured frames (see find), the captures of the
+       region are searched until the timeout is reached.
+    """
+    if _findsInFrames():
+        return _findAllInFrames(arg, region, timeout, exception)
+    if timeout is not None:
+        t = setTimeout(region, timeout)
+    if exception is not None:
+        e = setException(region, exception)
+    try:
+        matches = region.findAll(arg)
+    finally:
+        if timeout is not None:
+            setTimeout(region, t)
+        if exception is not None:
+            setException(region, e)
+    return matches
+
+def _findAllInFrames(arg, region, timeout, exception):
+    """Searches all occurrences of arg in captures of the region until it is
+       found or the timeout is reached, at the scan interval (see
+       setFrameScanInterval).
+    """
+    if timeout is None:
+        timeout = region.getAutoWaitTimeout()
+    if exception is None:
+        exception = region.getThrowException()
+    waiting = Wait(timeout, interval = getFrameScanInterval())
+    while True:
+        matches = captureFrame(region).findAll(arg)
+        if len(matches) > 0:
+            return iter(matches)
+        try:
+            waiting.wait()
+        except TimeoutExceeded:
+            break
+    if exception:
+        raise FindFailed('%s not found after %f seconds' % (str(arg), timeout))
+    return None
+
+def _clickBackend(target, modifiers):
+    """Clicks on the center of target (a region, match or location) on the
+       screen backend.
+    """
+    x, y = target.getX(), target.getY()
+    if hasattr(target, 'getW'):
+        x += target.getW() / 2
+        y += target.getH() / 2
+    return getScreenBackend().click(x, y, modifiers)
+
 def click(arg, modifiers = NO_MODIFIER, region = SCREEN,
         timeout = None, exception = None):
     """Behaves like region.click(arg) except that if timeout and exception are
        not None, the auto wait time and exception of the region are set to the
        specified values before the click method is called, and restored when
        the click method returns.
+       If a screen backend is set (see seagull.frame.setScreenBackend), arg
+       is searched with find() and the backend clicks on the match.
     """
+    call = instrumentation.begin('click', region)
+    value = 0
+    try:
+        try:
+            value = _click(arg, modifiers, region, timeout, exception)
+        except FindFailed:
+            countFailure('FindFailed', 'click')
+            raise
+    finally:
+        instrumentation.end(call, [arg], [value or None])
+    if value:
+        metrics.increment('seagull_clicks_total', value)
+    return value
+
+def _click(arg, modifiers, region, timeout, exception):
+    """Implements click()."""
+    if getScreenBackend() is not None:
+        try:
+            if not hasattr(arg, 'getX'):
+                arg = find(arg, region = region, timeout = timeout,
+                        exception = exception)
+                if arg is None:
+                    return 0
+            return _clickBackend(arg, modifiers)
+        finally:
+            invalidateFrames()
     if timeout is not None:
         t = setTimeout(region, timeout)
     if exception is not None:
         e = setException(region, exception)
+    # the search in region.click() yields no match whose score could be
+    # recorded
+    start = instrumentation.now()
     try:
         value = region.click(arg, modifiers)
     finally:
+        instrumentation.addMatchTime(arg, instrumentation.now() - start,
+                None)
+        invalidateFrames()
         if timeout is not None:
             setTimeout(region, t)
         if exception is not None:
@@ -211,6 +983,27 @@ def findAny(args, region = SCREEN, timeout = None, exception = None):
     """
     if not isinstance(args, list):
         raise ValueError('list argument expected')
+    call = instrumentation.begin('findAny', region)
+    span = tracing.begin('findAny', 'search', {'templates' : len(args)})
+    start = metrics.now()
+    result = None
+    try:
+        try:
+            result = _findAny(args, region, timeout, exception)
+        except FindFailed:
+            countFailure('FindFailed', 'findAny')
+            raise
+    finally:
+        matches = [None] * len(args)
+        if result is not None:
+            matches[result[0]] = result[1]
+        instrumentation.end(call, args, matches)
+        _observeSearch('findAny', start)
+        tracing.end(span, {'found' : result is not None})
+    return result
+
+def _findAny(args, region, timeout, exception):
+    """Implements findAny()."""
     if timeout is None:
         timeout = region.getAutoWaitTimeout()
     if exception is None:
@@ -219,14 +1012,19 @@ def findAny(args, region = SCREEN, timeout = None, exception = None):
     match = None
     waiting = Wait(timeout)
     while True:
-        for i, arg in enumerate(args):
-            match = find(arg, region = region, timeout = 0, exception = False)
-            _debug('findAny', i, arg, region, match)
-            if match is not None:
-                if _show_regions:
-                    showRegion(match)
-                argi = i
-                break
+        span = tracing.begin('findAny round', 'search')
+        try:
+            frame = _captureRound(region)
+            for i, match in enumerate(_searchRound(args, region, frame)):
+                arg = args[i]
+                _debug('findAny', i, arg, region, match)
+                if match is not None:
+                    if _show_regions:
+                        showRegion(match)
+                    argi = i
+                    break
+        finally:
+            tracing.end(span)
         if match is not None:
             break
         try:
@@ -292,9 +1090,83 @@ def waitAny(args, region = SCREEN, timeout = None):
     finally:
         setException(region, e)
 
+def getScreens():
+    """Returns a list of all attached screens, in the order of their screen
+       indexes.
+    """
+    return [Screen(i) for i in range(Screen.getNumberScreens())]
+
+def _getScreenExecutor():
+    global _screen_executor
+    if _screen_executor is None:
+        _screen_executor = Executors.newCachedThreadPool(
+                DaemonThreadFactory('seagull-screen-worker'))
+    return _screen_executor
+
+def findOnAllScreens(arg, timeout = None, exception = None, score = None):
+    """Searches arg on all attached screens concurrently, and returns a tuple
+       (i, match) where i is the index of the screen with the best match.
+       If score is not None, returns as soon as a match with at least that
+       score is found on any screen, and cancels the searches on the other
+       screens. Otherwise, waits for the searches on all screens and returns
+       the match with the highest score.
+       If arg is not found on any screen, searches again every second until
+       the timeout is reached.
+       If arg is not found within the timeout, returns None if exception is
+       False, and raises FindFailed if exception is True.
+       If the optional timeout is not specified or is None, uses the current
+       timeout of SCREEN.
+       If the exception argument is not specified or is None, uses the current
+       exception setting of SCREEN.
+    """
+    if timeout is None:
+        timeout = SCREEN.getAutoWaitTimeout()
+    if exception is None:
+        exception = SCREEN.getThrowException()
+    screens = getScreens()
+    def search(i):
+        return i, find(arg, region = screens[i], timeout = 0,
+                exception = False)
+    waiting = Wait(timeout)
+    while True:
+        completion = ExecutorCompletionService(_getScreenExecutor())
+        futures = [completion.submit(_Task(search, i))
+                for i in range(len(screens))]
+        best = None
+        try:
+            for n in range(len(futures)):
+                ok, value = completion.take().get()
+                if not ok:
+                    raise value[0], value[1], value[2]
+                i, match = value
+                _debug('findOnAllScreens', i, arg, screens[i], match)
+                if match is None:
+                    continue
+                if best is None or match.getScore() > best[1].getScore():
+                    best = (i, match)
+                if score is not None and match.getScore() >= score:
+                    break
+        finally:
+            for future in futures:
+                future.cancel(True)
+        if best is not None:
+            if _show_regions:
+                showRegion(best[1])
+            return best
+        try:
+            waiting.wait()
+        except TimeoutExceeded:
+            break
+    if exception:
+        raise FindFailed('%s not found on any screen after %f seconds' %
+                (str(arg), timeout))
+    return None
+
 def waitWhileFound(arg, region = SCREEN, timeout = None, interval = 1):
     """Waits while the specified argument is found in the region.
-       A search is performed every interval seconds (default is 1 second).
+       A search is performed every interval seconds (default is 1 second), or
+       whenever the region has changed if waits are change-driven (see
+       setChangeDrivenWaits).
        Raises Exception if the argument is still found after the timeout.
        If no region is specified, searches the entire screen.
        If the optional timeout is not specified or is None, uses the current
@@ -302,12 +1174,138 @@ def waitWhileFound(arg, region = SCREEN, timeout = None, interval = 1):
     """
     if timeout is None:
         timeout = region.getAutoWaitTimeout()
-    waiting = Wait(timeout, interval = interval,
+    start = metrics.now()
+    span = tracing.begin('waitWhileFound', 'wait',
+            {'template' : instrumentation.templateName(arg)})
+    watcher = RegionWatcher(region)
+    waiting = Wait(timeout, interval = watcher.getPollInterval(interval),
+            exception_message = 'argument still found after %f seconds' %
+            timeout)
+    try:
+        while find(arg, region = region, timeout = 0,
+                exception = False) is not None:
+            watcher.waitForChange(waiting)
+    except TimeoutExceeded:
+        countFailure('TimeoutExceeded', 'waitWhileFound')
+        raise
+    finally:
+        observeWait('waitWhileFound', start)
+        tracing.end(span)
+
+def asyncWaitUntil(condition, region, timeout, interval = 1,
+        exception_message = 'maximum waiting time exceeded', update = None,
+        update_first = False):
+    """Waits in the background until condition() returns True and returns a
+       seagull.scheduler.AsyncResult, whose value is True when the condition
+       is met. Raises TimeoutExceeded in AsyncResult.get() if the condition
+       is still not met after timeout seconds (if timeout is not None).
+       The condition is checked immediately, and after that every interval
+       seconds, or whenever the region has changed if waits are change-driven
+       (see setChangeDrivenWaits). If update is not None, it is called before
+       checking the condition again, e.g. to search images, and also before
+       the first check if update_first is True.
+       The checks run in the worker threads of the scheduler (see
+       seagull.scheduler.getScheduler), so many waits can run at the same
+       time without blocking the calling thread.
+    """
+    watcher = RegionWatcher(region)
+    state = { 'first' : True }
+    def probe():
+        if state['first']:
+            state['first'] = False
+            if update_first and update is not None:
+                update()
+        elif not watcher.hasChanged():
+            return False, None
+        elif update is not None:
+            update()
+        if condition():
+            return True, True
+        return False, None
+    result = getScheduler().poll(probe, timeout,
+            interval = watcher.getPollInterval(interval),
+            exception = TimeoutExceeded(exception_message),
+            policy = _polling_policy, name = exception_message)
+    def done(result):
+        try:
+            result.get()
+        except TimeoutExceeded:
+            countFailure('TimeoutExceeded', 'asyncWaitUntil')
+        except:
+            pass
+    result.addCallback(done)
+    return result
+
+def asyncFind(arg, region = SCREEN, timeout = None, exception = None):
+    """Searches the specified region for arg in the background until it is
+       found, and returns a seagull.scheduler.AsyncResult of the match.
+       If arg is not found within the timeout, AsyncResult.get() raises
+       FindFailed if exception is True, and returns None if exception is
+       False.
+       The optional arguments are the same as in find().
+    """
+    results = asyncFindAny([arg], region = region, timeout = timeout,
+            exception = exception)
+    found = AsyncResult('asyncFind')
+    def done(result):
+        try:
+            value = result.get()
+        except:
+            found.setException(sys.exc_info())
+            return
+        if value is None:
+            found.setResult(None)
+        else:
+            found.setResult(value[1])
+    results.addCallback(done)
+    return found
+
+def asyncFindAny(args, region = SCREEN, timeout = None, exception = None):
+    """Searches the specified region for the elements in args in the
+       background until one is found, and returns a
+       seagull.scheduler.AsyncResult of a tuple (index, match) as returned by
+       findAny().
+       If no element is found within the timeout, AsyncResult.get() raises
+       FindFailed if exception is True, and returns None if exception is
+       False.
+       The optional arguments are the same as in findAny().
+    """
+    if not isinstance(args, list):
+        raise ValueError('list argument expected')
+    if timeout is None:
+        timeout = region.getAutoWaitTimeout()
+    if exception is None:
+        exception = region.getThrowException()
+    def probe():
+        frame = _captureRound(region)
+        for i, match in enumerate(_searchRound(args, region, frame)):
+            _debug('asyncFindAny', i, args[i], region, match)
+            if match is not None:
+                if _show_regions:
+                    showRegion(match)
+                return True, (i, match)
+        return False, None
+    if exception:
+        failed = FindFailed('none of the elements was found after %f seconds'
+                % timeout)
+    else:
+        failed = None
+    return getScheduler().poll(probe, timeout, exception = failed,
+            policy = _polling_policy, name = 'asyncFindAny')
+
+def asyncWaitWhileFound(arg, region = SCREEN, timeout = None, interval = 1):
+    """Waits in the background while the specified argument is found in the
+       region, and returns a seagull.scheduler.AsyncResult whose value is True
+       when the argument is no longer found. AsyncResult.get() raises
+       TimeoutExceeded if the argument is still found after the timeout.
+       The arguments are the same as in waitWhileFound().
+    """
+    if timeout is None:
+        timeout = region.getAutoWaitTimeout()
+    return asyncWaitUntil(lambda: find(arg, region = region, timeout = 0,
+            exception = False) is None, region, timeout, interval = interval,
             exception_message = 'argument still found after %f seconds' %
             timeout)
-    while find(arg, region = region, timeout = 0,
-            exception = False) is not None:
-        waiting.wait()
 
 def getAllMatches(args, region = SCREEN, timeout = None):
     """Searches the specified region for all elements in args and returns a
@@ -321,24 +1319,44 @@ def getAllMatches(args, region = SCREEN, timeout = None):
     """
     if not isinstance(args, list):
         raise ValueError('list argument expected')
+    call = instrumentation.begin('getAllMatches', region)
+    span = tracing.begin('getAllMatches', 'search', {'templates' : len(args)})
+    start = metrics.now()
+    matches = None
+    try:
+        matches = _getAllMatches(args, region, timeout)
+    finally:
+        instrumentation.end(call, args, matches or [None] * len(args))
+        _observeSearch('getAllMatches', start)
+        tracing.end(span)
+    return matches
+
+def _getAllMatches(args, region, timeout):
+    """Implements getAllMatches()."""
     if timeout is None:
         timeout = region.getAutoWaitTimeout()
     matches = [None] * len(args)
     notfound = [(i, arg) for i, arg in enumerate(args)]
     waiting = Wait(timeout)
     while len(notfound) > 0:
-        j = 0 # index in notfound
-        while j < len(notfound):
-            i, arg = notfound[j]
-            match = find(arg, region = region, timeout = 0, exception = False)
+        span = tracing.begin('getAllMatches round', 'search',
+                {'templates' : len(notfound)})
+        try:
+            frame = _captureRound(region)
+            roundmatches = list(_searchRound([arg for i, arg in notfound],
+                    region, frame))
+        finally:
+            tracing.end(span)
+        stillnotfound = []
+        for (i, arg), match in zip(notfound, roundmatches):
             _debug('getAllMatches', i, arg, region, match)
             if match is not None:
                 if _show_regions:
                     showRegion(match)
                 matches[i] = match
-                del notfound[j]
             else:
-                j += 1
+                stillnotfound.append((i, arg))
+        notfound = stillnotfound
         if len(notfound) > 0:
             try:
                 waiting.wait()
@@ -346,6 +1364,42 @@ def getAllMatches(args, region = SCREEN, timeout = None):
                 break
     return matches
 
+def getAllMatchLists(args, region = SCREEN, timeout = None):
+    """Searches the specified region for all occurrences of each element in
+       args and returns a list that contains a list of the matches of each
+       element.
+       Elements that do not exist in the region are searched again repeatedly
+       with one second between each round, until the timeout is reached.
+       If an element is not found within the specified time, the list of its
+       matches is empty.
+       If no region is specified, searches the entire screen.
+       If timeout is not specified, uses the current timeout of the region.
+    """
+    if not isinstance(args, list):
+        raise ValueError('list argument expected')
+    if timeout is None:
+        timeout = region.getAutoWaitTimeout()
+    matchlists = [[] for arg in args]
+    notfound = [(i, arg) for i, arg in enumerate(args)]
+    waiting = Wait(timeout)
+    while len(notfound) > 0:
+        frame = _captureRound(region)
+        roundmatches = _searchRound([arg for i, arg in notfound], region,
+                frame, findfunction = _findAllInRound)
+        stillnotfound = []
+        for (i, arg), matches in zip(notfound, roundmatches):
+            if len(matches) > 0:
+                matchlists[i] = matches
+            else:
+                stillnotfound.append((i, arg))
+        notfound = stillnotfound
+        if len(notfound) > 0:
+            try:
+                waiting.wait()
+            except TimeoutExceeded:
+                break
+    return matchlists
+
 def getAllScores(args, **kwds):
     """Searches the specified region for all elements in args and returns a
        list of the match scores.
@@ -383,7 +1437,16 @@ def clickOffset(image, offsetx = 0, offsety = 0, region = SCREEN,
             target.getW(), target.getH())
     if _show_regions:
         showRegion(newtarget)
-    return region.click(newtarget, NO_MODIFIER)
+    try:
+        if getScreenBackend() is not None:
+            value = _clickBackend(newtarget, NO_MODIFIER)
+        else:
+            value = region.click(newtarget, NO_MODIFIER)
+    finally:
+        invalidateFrames()
+    if value:
+        metrics.increment('seagull_clicks_total', value)
+    return value
 
 def typeKeys(keys, modifiers = NO_MODIFIER, repeat = 1, region = None):
     """Types a sequence of keys.
@@ -392,10 +1455,29 @@ def typeKeys(keys, modifiers = NO_MODIFIER, repeat = 1, region = None):
     """
     if repeat < 1:
         return
+    backend = getScreenBackend()
     # click on the region only once
-    SCREEN.type(region, keys, modifiers)
-    for i in range(repeat - 1):
-        SCREEN.type(keys, modifiers)
+    try:
+        if backend is not None:
+            if region is not None:
+                _clickBackend(region, NO_MODIFIER)
+            for i in range(repeat):
+                backend.type(keys, modifiers)
+            return
+        SCREEN.type(region, keys, modifiers)
+        for i in range(repeat - 1):
+            SCREEN.type(keys, modifiers)
+    finally:
+        invalidateFrames()
+
+def openApp(path):
+    """Starts the application at the specified path, or records it on the
+       screen backend if one is set (see seagull.frame.setScreenBackend).
+    """
+    backend = getScreenBackend()
+    if backend is not None:
+        return backend.openApp(path)
+    return _openApp(path)
 
 def extendRegion(region, top = 0, right = 0, bottom = 0, left = 0):
     """Extends the given region in all four directions by the specified values.
@@ -500,6 +1582,67 @@ def sameRegion(region1, region2, minOverlap = 0.9):
     return getOverlap(region1, region2) >= minOverlap and \
             getOverlap(region2, region1) >= minOverlap
 
+def _prefilterImages(images, region):
+    """Returns the indexes of the images that can possibly match the element
+       in the center of the region, according to the hash prefilter.
+    """
+    frame = None
+    candidates = []
+    for i, image in enumerate(images):
+        # the size is known without decoding images from Sikuli projects
+        w, h = templateSize(getTemplate(image)[0])
+        if w > region.getW() or h > region.getH():
+            # image cannot be found in the region
+            continue
+        if region.getW() * region.getH() > 4 * w * h:
+            # region is not a neighbourhood of a single element
+            candidates.append(i)
+            continue
+        if frame is None:
+            frame = captureFrame(region)
+        patch = frame.crop(frame.getX() + (frame.getW() - w) / 2,
+                frame.getY() + (frame.getH() - h) / 2, w, h)
+        if hammingDistance(templateHashes(image)[0],
+                dHash(patch.getImage())) <= _hash_prefilter:
+            candidates.append(i)
+    return candidates
+
+def _getCandidateMatches(images, region):
+    """Searches the images in the region without waiting and returns a list
+       of matches (elements are None for images that are not found).
+       If the hash prefilter is enabled, images that cannot match the region
+       are not searched.
+    """
+    if _hash_prefilter is None:
+        return getAllMatches(images, **{ 'region' : region, 'timeout' : 0 })
+    candidates = _prefilterImages(images, region)
+    if len(candidates) == 0:
+        candidates = range(len(images))
+    elif _LOGGER.isEnabledFor(logging.DEBUG) and \
+            len(candidates) < len(images):
+        _LOGGER.debug('hash prefilter skipped %d of %d images',
+                len(images) - len(candidates), len(images))
+    found = getAllMatches([images[i] for i in candidates],
+            **{ 'region' : region, 'timeout' : 0 })
+    matches = [None] * len(images)
+    for i, match in zip(candidates, found):
+        matches[i] = match
+    return matches
+
+def _getInstrumentedMatches(function, images, region):
+    """Calls _getCandidateMatches and records the call as a call of the named
+       function if instrumentation is enabled.
+    """
+    call = instrumentation.begin(function, region)
+    start = metrics.now()
+    matches = None
+    try:
+        matches = _getCandidateMatches(images, region)
+    finally:
+        instrumentation.end(call, images, matches or [None] * len(images))
+        _observeSearch(function, start)
+    return matches
+
 def bestMatch(images, region = SCREEN, minOverlap = 0.9):
     """Finds each image in the specified region and returns the index of the
        image with the highest match score, and the match.
@@ -514,10 +1657,25 @@ def bestMatch(images, region = SCREEN, minOverlap = 0.9):
     """
     if len(images) == 0:
         return None
-    matches = getAllMatches(images, **{ 'region' : region, 'timeout' : 0 })
+    matches = _getInstrumentedMatches('bestMatch', images, region)
+    return selectBestMatch(matches, minOverlap, region.getThrowException())
+
+def selectBestMatch(matches, minOverlap = 0.9, exception = True):
+    """Returns the index of the match with the highest score in the specified
+       list of matches (where elements can be None), and the match.
+       This is the selection that bestMatch makes after searching the images.
+       All matches must have approximately the same region.
+       If exception is True and all elements are None, throws FindFailed.
+       If exception is False and all elements are None, returns None.
+       If the list of matches is empty, returns None.
+       Raises Exception if not all matches have the same region.
+    """
+    if len(matches) == 0:
+        return None
     if matches[0] is not None:
         best_match = 0
         best_score = matches[0].getScore()
+        best_rect = regionRect(matches[0])
     else:
         best_match = None
         best_score = 0
@@ -529,15 +1687,17 @@ def bestMatch(images, region = SCREEN, minOverlap = 0.9):
         if best_match is None:
             best_match = m
             best_score = score
+            best_rect = regionRect(match)
         else:
-            if not sameRegion(matches[best_match], match, minOverlap):
+            if not sameRect(best_rect, regionRect(match), minOverlap):
                 raise Exception('images %d, %d found in different regions' %
                         (best_match, m))
             if score > best_score:
                 best_match = m
                 best_score = score
+                best_rect = regionRect(match)
     if best_match is None:
-        if region.getThrowException():
+        if exception:
             raise FindFailed('none of the images was found')
         else:
             return None
@@ -561,8 +1721,20 @@ def bestMatches(images, region = SCREEN, minOverlap = 0.9):
     """
     if len(images) == 0:
         return None
-    matches = getAllMatches(images, **{ 'region' : region, 'timeout' : 0 })
+    matches = _getInstrumentedMatches('bestMatches', images, region)
+    return selectBestMatches(matches, minOverlap, region.getThrowException())
+
+def selectBestMatches(matches, minOverlap = 0.9, exception = True):
+    """Returns a list of tuples (i, match) of the best matches in the
+       specified list of matches (where elements can be None), one for each
+       region. This is the selection that bestMatches makes after searching
+       the images.
+       If exception is True and all elements are None, throws FindFailed.
+       If exception is False and all elements are None, returns None.
+    """
     best_match_regions = []
+    # index of the regions in best_match_regions, ids are list indexes
+    index = RegionIndex()
     for i_match, match in enumerate(matches):
         if match is None:
             continue
@@ -570,18 +1742,17 @@ def bestMatches(images, region = SCREEN, minOverlap = 0.9):
         # if this match has a higher score, replace the match in
         # best_match_regions
         # if no match with the same region is found, add this match
-        i_best = None
-        for i, bm in enumerate(best_match_regions):
-            if sameRegion(bm[1], match, minOverlap):
-                i_best = i
-                break
+        rect = regionRect(match)
+        i_best = index.findSame(rect, minOverlap)
         if i_best is not None:
             if match.getScore() > best_match_regions[i_best][1].getScore():
                 best_match_regions[i_best] = (i_match, match)
+                index.replace(i_best, rect)
         else:
+            index.add(rect)
             best_match_regions.append((i_match, match))
     if len(best_match_regions) == 0:
-        if region.getThrowException():
+        if exception:
             raise FindFailed('none of the images was found')
         else:
             return None
@@ -648,8 +1819,19 @@ class AnchoredRegion(Region):
         if isinstance(self.parentregion, AnchoredRegion):
             if self.parentregion.findcount < self.findcount:
                 self.parentregion.anchor(timeout)
-        self.anchormatch = find(self.anchorimage, region = self.parentregion,
-                timeout = timeout, exception = True)
+        call = instrumentation.begin('anchor', self.parentregion)
+        span = tracing.begin('anchor %s' % self.name, 'search',
+                {'findcount' : self.findcount})
+        start = metrics.now()
+        self.anchormatch = None
+        try:
+            self.anchormatch = find(self.anchorimage,
+                    region = self.parentregion, timeout = timeout,
+                    exception = True)
+        finally:
+            instrumentation.end(call, [self.anchorimage], [self.anchormatch])
+            _observeSearch('anchor', start)
+            tracing.end(span)
         _LOGGER.debug('%s anchor=%s count=%d',
                 self.name, str(self.anchormatch), self.findcount)
         if _show_regions:
@@ -666,7 +1848,8 @@ class AnchoredRegion(Region):
         """Returns True if the anchor image is displayed in the parent region
            of this region (which may be the entire screen).
         """
-        return self.parentregion.exists(self.anchorimage, 0) is not None
+        return find(self.anchorimage, region = self.parentregion, timeout = 0,
+                exception = False) is not None
 
     def wait_until_displayed(self, timeout, is_displayed = True):
         """Waits no longer than the specified timeout (in seconds) until the
@@ -677,14 +1860,29 @@ class AnchoredRegion(Region):
            anchor image is no longer displayed, and raises Exception if the
            anchor image is still displayed after the specified time.
         """
-        if is_displayed:
-            e = setException(self.parentregion, True)
-            try:
-                self.parentregion.wait(self.anchorimage, timeout)
-            except FindFailed:
-                raise Exception("anchor image of region '%s' not found after %f seconds" % (self.name, timeout))
-            finally:
-                setException(self.parentregion, e)
-        else:
-            if not self.parentregion.waitVanish(self.anchorimage, timeout):
-                raise Exception("anchor image of region '%s' still displayed after %f seconds" % (self.name, timeout))
+        start = metrics.now()
+        span = tracing.begin('wait_until_displayed %s' % self.name, 'wait',
+                {'is_displayed' : is_displayed})
+        try:
+            if is_displayed:
+                try:
+                    find(self.anchorimage, region = self.parentregion,
+                            timeout = timeout, exception = True)
+                except FindFailed:
+                    raise Exception("anchor image of region '%s' not found after %f seconds" % (self.name, timeout))
+            elif not _findsInFrames():
+                # Sikuli waits at its own scan rate
+                if not self.parentregion.waitVanish(self.anchorimage,
+                        timeout):
+                    countFailure('TimeoutExceeded', 'wait_until_displayed')
+                    raise Exception("anchor image of region '%s' still displayed after %f seconds" % (self.name, timeout))
+            else:
+                try:
+                    waitWhileFound(self.anchorimage,
+                            region = self.parentregion, timeout = timeout,
+                            interval = getFrameScanInterval())
+                except TimeoutExceeded:
+                    raise Exception("anchor image of region '%s' still displayed after %f seconds" % (self.name, timeout))
+        finally:
+            observeWait('wait_until_displayed', start)
+            tracing.end(span)
@@ -23,7 +23,7 @@ THE SOFTWARE.
 import logging
 from sikuli.Sikuli import Location, SCREEN, closeApp
 from sikuli.Region import Region
-from seagull.util import AnchoredRegion
+from seagull.util import AnchoredRegion, click
 import seagull.windowflavor as windowflavor
 
 _LOGGER = logging.getLogger(__name__)
@@ -64,22 +64,22 @@ class Window:
     def setFocus(self):
         """Clicks on the center of this window's title bar."""
         _LOGGER.debug('setFocus: %s', self.title)
-        SCREEN.click(self.titlebar_region)
+        click(self.titlebar_region)
 
     def minimize(self):
         """Clicks on the minimize button in this window's title bar."""
         _LOGGER.debug('minimize window: %s', self.title)
-        SCREEN.click(self.minimize_button)
+        click(self.minimize_button)
 
     def maximize(self):
         """Clicks on the maximize button in this window's title bar."""
         _LOGGER.debug('maximize window: %s', self.title)
-        SCREEN.click(self.maximize_button)
+        click(self.maximize_button)
 
     def close(self):
         """Clicks on the close button in this window's title bar."""
         _LOGGER.debug('close window: %s', self.title)
-        SCREEN.click(self.close_button)
+        click(self.close_button)
 
     def kill(self):
         """Attempts to kill the process that owns this window, using the window
@@ -23,3 +23,7 @@ THE SOFTWARE.
 # full directory paths of sikuli projects that should be imported
 # SIKULI_PROJECT_DIRS = ['/home/username/sikuliprojects/projectname.sikuli']
 SIKULI_PROJECT_DIRS = []
+
+# if True, the symbols of each Sikuli project are stored in a manifest file in
+# the project directory and read from there until the project script changes
+SIKULI_PROJECT_MANIFESTS = True
@@ -0,0 +1,130 @@
+"""
+Copyright (c) 2010 Karl-Michael Schneider
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import logging
+try:
+    import _ast
+except ImportError:
+    _ast = None
+
+_LOGGER = logging.getLogger(__name__)
+
+_CONSTANTS = { 'None' : None, 'True' : True, 'False' : False }
+
+class NotLiteral(Exception):
+    """Raised when a statement or expression is not a literal assignment or
+       value.
+    """
+    pass
+
+def literal_value(node):
+    """Returns the value of an expression node that is a string, number,
+       list, dictionary or tuple of literal values, None, True or False, or
+       a call of set() or frozenset() with a literal argument.
+       Raises NotLiteral if the expression is something else.
+    """
+    if isinstance(node, _ast.Str):
+        return node.s
+    if isinstance(node, _ast.Num):
+        return node.n
+    if isinstance(node, _ast.Name) and node.id in _CONSTANTS:
+        return _CONSTANTS[node.id]
+    if isinstance(node, _ast.UnaryOp) and isinstance(node.op, _ast.USub) \
+            and isinstance(node.operand, _ast.Num):
+        return -node.operand.n
+    if isinstance(node, _ast.List):
+        return [literal_value(element) for element in node.elts]
+    if isinstance(node, _ast.Tuple):
+        return tuple([literal_value(element) for element in node.elts])
+    if isinstance(node, _ast.Dict):
+        return dict([(literal_value(key), literal_value(value))
+                for key, value in zip(node.keys, node.values)])
+    if hasattr(_ast, 'Set') and isinstance(node, _ast.Set):
+        return set([literal_value(element) for element in node.elts])
+    if isinstance(node, _ast.Call) and isinstance(node.func, _ast.Name) \
+            and node.func.id in ('set', 'frozenset') \
+            and len(node.args) <= 1 and not node.keywords \
+            and node.starargs is None and node.kwargs is None:
+        if node.func.id == 'set':
+            constructor = set
+        else:
+            constructor = frozenset
+        if len(node.args) == 0:
+            return constructor()
+        value = literal_value(node.args[0])
+        if not isinstance(value, (list, tuple)):
+            raise NotLiteral('%s() of a non-sequence' % node.func.id)
+        return constructor(value)
+    raise NotLiteral(node.__class__.__name__)
+
+def parse_literal(source, filename = '<string>'):
+    """Returns the value of source, which must be a single literal
+       expression (see literal_value), without evaluating it.
+       Raises SyntaxError if the source cannot be parsed, and NotLiteral if
+       it is not a literal or the _ast module is not available.
+    """
+    if _ast is None:
+        raise NotLiteral('the _ast module is not available')
+    expression = compile(source, filename, 'eval', _ast.PyCF_ONLY_AST)
+    return literal_value(expression.body)
+
+def _assign(target, value, symbols):
+    if isinstance(target, _ast.Name):
+        symbols[target.id] = value
+    elif isinstance(target, (_ast.Tuple, _ast.List)) and \
+            isinstance(value, (list, tuple)) and \
+            len(target.elts) == len(value):
+        for element, elementvalue in zip(target.elts, value):
+            _assign(element, elementvalue, symbols)
+    else:
+        raise NotLiteral('assignment to %s' % target.__class__.__name__)
+
+def extract_literal_symbols(source, filename = '<string>'):
+    """Returns a dictionary of the symbols that are assigned in the
+       specified module source, without running it, or None if the module
+       does anything else than assign literal values (see literal_value) to
+       names, apart from docstrings and pass statements. In that case the
+       module must be run to get its symbols.
+       Raises SyntaxError if the source cannot be parsed.
+    """
+    if _ast is None:
+        return None
+    module = compile(source, filename, 'exec', _ast.PyCF_ONLY_AST)
+    symbols = {}
+    try:
+        for statement in module.body:
+            if isinstance(statement, _ast.Assign):
+                value = literal_value(statement.value)
+                for target in statement.targets:
+                    _assign(target, value, symbols)
+            elif isinstance(statement, _ast.Expr) and \
+                    isinstance(statement.value, _ast.Str):
+                continue
+            elif isinstance(statement, _ast.Pass):
+                continue
+            else:
+                raise NotLiteral(statement.__class__.__name__)
+    except NotLiteral, e:
+        _LOGGER.debug('%s must be run: line %d is not a literal assignment (%s)',
+                filename, statement.lineno, e)
+        return None
+    return symbols
@@ -0,0 +1,199 @@
+"""
+Copyright (c) 2010 Karl-Michael Schneider
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os, os.path, struct, logging
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+from sikuliimport.literals import parse_literal
+
+_LOGGER = logging.getLogger(__name__)
+
+# name of the manifest file in a Sikuli project directory
+MANIFEST_FILENAME = '.sikuliimport-manifest'
+# changed whenever the format of the manifest changes
+MANIFEST_VERSION = 2
+
+_PNG_SIGNATURE = '\x89PNG\r\n\x1a\n'
+_PLAIN_TYPES = (basestring, bool, int, long, float, type(None))
+
+def is_plain_value(value):
+    """Returns True if value is a string, number, boolean or None, or a
+       list, dictionary, tuple, set or frozenset of such values, which can be
+       stored in a manifest.
+    """
+    if isinstance(value, _PLAIN_TYPES):
+        return True
+    if isinstance(value, dict):
+        for key, element in value.iteritems():
+            if not is_plain_value(key) or not is_plain_value(element):
+                return False
+        return True
+    if isinstance(value, (list, tuple, set, frozenset)):
+        for element in value:
+            if not is_plain_value(element):
+                return False
+        return True
+    return False
+
+def image_filenames(value, projectdir):
+    """Returns a list of the filenames of the images in projectdir that
+       occur in value, which may be a list, dictionary, tuple, set or
+       frozenset.
+    """
+    if isinstance(value, basestring):
+        if os.path.dirname(value) == projectdir and \
+                value.lower().endswith('.png'):
+            return [value]
+        return []
+    if isinstance(value, dict):
+        value = value.values()
+    if isinstance(value, (list, tuple, set, frozenset)):
+        filenames = []
+        for element in value:
+            filenames.extend(image_filenames(element, projectdir))
+        return filenames
+    return []
+
+def read_image_info(filename):
+    """Returns a tuple (mtime, size, width, height, sha1) of the specified
+       PNG image, where mtime and size are the modification time and size of
+       the file and sha1 is the hex digest of its contents. Width and height
+       are read from the PNG header, without decoding the image.
+    """
+    st = os.stat(filename)
+    f = open(filename, 'rb')
+    try:
+        data = f.read()
+    finally:
+        f.close()
+    if data[:8] != _PNG_SIGNATURE or data[12:16] != 'IHDR':
+        raise IOError('not a PNG image: %s' % filename)
+    width, height = struct.unpack('>II', data[16:24])
+    return st.st_mtime, st.st_size, width, height, sha1(data).hexdigest()
+
+def _script_stat(scriptfilename):
+    st = os.stat(scriptfilename)
+    return st.st_mtime, st.st_size
+
+def image_info(manifest, filename):
+    """Returns a tuple (width, height, sha1) of the specified image from the
+       manifest, or None if the image is not in the manifest or cannot be
+       read. If the image file has been modified since the manifest was
+       written (e.g. because the image was captured again), the image is read
+       again and its entry in the manifest is updated.
+    """
+    info = manifest['images'].get(filename)
+    if info is None:
+        return None
+    try:
+        st = os.stat(filename)
+        if (st.st_mtime, st.st_size) != info[:2]:
+            _LOGGER.debug('image %s has changed since the manifest was written',
+                    filename)
+            info = read_image_info(filename)
+            manifest['images'][filename] = info
+    except (IOError, OSError), e:
+        _LOGGER.debug('cannot read image %s: %s', filename, e)
+        return None
+    return info[2:]
+
+def load_manifest(projectdir, scriptfilename):
+    """Returns the manifest of the specified Sikuli project directory, or
+       None if there is no manifest or it is not fresh, i.e. the project
+       script has been modified or the project has moved since the manifest
+       was written. The manifest is a dictionary with the keys 'symbols' (a
+       dictionary of the symbols of the project, with absolute image
+       pathnames) and 'images' (a dictionary that maps the pathname of each
+       image to a tuple as returned by read_image_info; use image_info to
+       look up an image).
+       The manifest file contains the dictionary as a Python literal. It is
+       parsed, not run (see sikuliimport.literals), so a manifest cannot
+       execute code.
+    """
+    filename = os.path.join(projectdir, MANIFEST_FILENAME)
+    try:
+        stat = _script_stat(scriptfilename)
+        f = open(filename, 'r')
+        try:
+            manifest = parse_literal(f.read(), filename)
+        finally:
+            f.close()
+    except (IOError, OSError):
+        return None
+    except Exception, e:
+        _LOGGER.warn('cannot read manifest %s: %s', filename, e)
+        return None
+    if not isinstance(manifest, dict) or \
+            manifest.get('version') != MANIFEST_VERSION or \
+            manifest.get('projectdir') != projectdir or \
+            manifest.get('script') != stat:
+        _LOGGER.debug('manifest %s is stale', filename)
+        return None
+    return manifest
+
+def save_manifest(projectdir, scriptfilename, symbols):
+    """Writes the manifest of the specified Sikuli project directory, with
+       the specified symbols and the size and hash of each image they refer
+       to. Returns the manifest, or None if some symbol is not a plain value
+       (see is_plain_value) or an image cannot be read. Nothing is written
+       in that case, or if the manifest file cannot be written (e.g. because
+       the project directory is read-only).
+    """
+    for name, value in symbols.iteritems():
+        if not is_plain_value(value):
+            _LOGGER.debug('no manifest for %s: %s is not a plain value',
+                    projectdir, name)
+            return None
+    filename = os.path.join(projectdir, MANIFEST_FILENAME)
+    tmpfilename = filename + '.tmp'
+    try:
+        stat = _script_stat(scriptfilename)
+        images = {}
+        for value in symbols.itervalues():
+            for imagefilename in image_filenames(value, projectdir):
+                if imagefilename not in images:
+                    images[imagefilename] = read_image_info(imagefilename)
+        manifest = {
+            'version' : MANIFEST_VERSION,
+            'projectdir' : projectdir,
+            'script' : stat,
+            'symbols' : symbols,
+            'images' : images,
+        }
+        f = open(tmpfilename, 'w')
+        try:
+            f.write(repr(manifest))
+            f.write('\n')
+        finally:
+            f.close()
+        try:
+            os.rename(tmpfilename, filename)
+        except OSError:
+            # os.rename does not replace existing files on Windows
+            os.remove(filename)
+            os.rename(tmpfilename, filename)
+    except (IOError, OSError), e:
+        _LOGGER.debug('cannot write manifest %s: %s', filename, e)
+        return None
+    return manifest
@@ -20,9 +20,14 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-import os.path, re, logging
+import os.path, re, sys, threading, logging
+from sikuliimport.literals import extract_literal_symbols
+from sikuliimport.manifest import image_info as manifest_image_info, \
+        load_manifest, save_manifest
 
 _SIKULI_IMAGE_FILENAME_PATTERN = re.compile(r'^\d{10,15}\.png$')
+# names that are assigned at the top level of a Sikuli project script
+_SYMBOL_PATTERN = re.compile(r'^([A-Za-z]\w*)\s*=(?!=)', re.MULTILINE)
 
 logging.basicConfig()
 _LOGGER = logging.getLogger(__name__)
@@ -56,28 +61,196 @@ def make_abs_sikuli_image_path(value, projectdir):
     else:
         return value
 
-def import_sikuli_project(projectdir):
-    """Imports symbols from the specified Sikuli project directory.
+def sikuli_project_script(projectdir):
+    """Returns the filename of the script of the specified Sikuli project
+       directory.
     """
     if not projectdir.endswith('.sikuli'):
         raise ImportError('Sikuli directory must end with .sikuli')
     modulename = os.path.basename(projectdir[0:-7])
-    modulefilename = os.path.join(projectdir, modulename + '.py')
-    symbols = dict()
+    return os.path.join(projectdir, modulename + '.py')
+
+def _read_sikuli_project_script(modulefilename):
     try:
-        execfile(modulefilename, symbols)
+        f = open(modulefilename)
+        try:
+            return f.read()
+        finally:
+            f.close()
     except IOError, error:
         raise ImportError('cannot import images from %s: %s' %
                 (modulefilename, error.args[1]))
-    glob = globals()
-    for name, value in symbols.iteritems():
+
+def import_sikuli_project(projectdir):
+    """Imports symbols from the specified Sikuli project directory and
+       returns them as a dictionary, with all Sikuli image filenames replaced
+       with their absolute pathnames.
+       If the project script only assigns literal values to names (see
+       sikuliimport.literals), the symbols are extracted from its syntax
+       tree without running it. Otherwise the script is run.
+    """
+    modulefilename = sikuli_project_script(projectdir)
+    source = _read_sikuli_project_script(modulefilename)
+    try:
+        symbols = extract_literal_symbols(source, modulefilename)
+    except SyntaxError:
+        # let execfile report the error
+        symbols = None
+    if symbols is None:
+        symbols = dict()
+        try:
+            execfile(modulefilename, symbols)
+        except IOError, error:
+            raise ImportError('cannot import images from %s: %s' %
+                    (modulefilename, error.args[1]))
+    return dict([(name, make_abs_sikuli_image_path(value, projectdir))
+            for name, value in symbols.iteritems()
+            if not name.startswith('_')])
+
+def scan_sikuli_project(projectdir):
+    """Returns the names that are assigned at the top level of the script
+       of the specified Sikuli project directory, without running it.
+    """
+    modulefilename = sikuli_project_script(projectdir)
+    source = _read_sikuli_project_script(modulefilename)
+    return _SYMBOL_PATTERN.findall(source)
+
+class LazyProjects:
+    """Replaces this module in sys.modules, so that the symbols of a Sikuli
+       project are imported only when one of them is first accessed. The
+       scripts are scanned for the names they define when this module is
+       imported, so that each name is looked up in the project that defines
+       it first. Names that the scan does not find are looked up in all
+       projects. Imported symbols are kept as attributes.
+       A symbol from an earlier project in SIKULI_PROJECT_DIRS takes
+       precedence over the same symbol from a later project, and a warning
+       is logged when the later project is imported.
+       If manifests are enabled, the symbols of a project are read from its
+       manifest (see sikuliimport.manifest) instead of running its script,
+       as long as the script has not been modified. The manifest is written
+       when the project is first imported.
+    """
+
+    def __init__(self, module, projectdirs, manifests = True):
+        """Creates an instance that looks up names in module (this module)
+           first, and then in the Sikuli project directories.
+        """
+        self.__dict__['_module'] = module
+        self.__dict__['_projectdirs'] = projectdirs
+        self.__dict__['_use_manifests'] = manifests
+        # maps project directory to its symbols, once it is imported
+        self.__dict__['_projects'] = {}
+        # maps project directory to its fresh manifest
+        self.__dict__['_manifests'] = {}
+        # maps name to the list of projects whose scripts assign it
+        self.__dict__['_index'] = {}
+        self.__dict__['_lock'] = threading.RLock()
+        for projectdir in projectdirs:
+            manifest = None
+            if manifests:
+                manifest = load_manifest(projectdir,
+                        sikuli_project_script(projectdir))
+            if manifest is not None:
+                self._manifests[projectdir] = manifest
+                names = manifest['symbols'].keys()
+            else:
+                names = scan_sikuli_project(projectdir)
+            for name in names:
+                if name.startswith('_'):
+                    continue
+                projects = self._index.setdefault(name, [])
+                if projectdir not in projects:
+                    projects.append(projectdir)
+
+    def __getattr__(self, name):
+        if name == '__all__':
+            return self.symbols()
+        try:
+            return getattr(self._module, name)
+        except AttributeError:
+            pass
         if name.startswith('_'):
-            continue
-        if name in glob:
-            _LOGGER.warn('symbol %s="%s" redefined as "%s"',
-                    name, glob[name], value)
-            continue
-        glob[name] = make_abs_sikuli_image_path(value, projectdir)
+            raise AttributeError(name)
+        self._lock.acquire()
+        try:
+            if name in self.__dict__:
+                return self.__dict__[name]
+            projectdirs = self._index.get(name, []) + self._projectdirs
+            for projectdir in projectdirs:
+                symbols = self._import_project(projectdir)
+                if name in symbols:
+                    self.__dict__[name] = symbols[name]
+                    return symbols[name]
+        finally:
+            self._lock.release()
+        raise AttributeError("no symbol '%s' in Sikuli projects %s" %
+                (name, ', '.join(self._projectdirs)))
+
+    def __setattr__(self, name, value):
+        setattr(self._module, name, value)
+
+    def _import_project(self, projectdir):
+        """Imports the symbols of a project, unless it has been imported
+           already, and returns them.
+        """
+        symbols = self._projects.get(projectdir)
+        if symbols is not None:
+            return symbols
+        if projectdir in self._manifests:
+            symbols = self._manifests[projectdir]['symbols']
+        else:
+            symbols = import_sikuli_project(projectdir)
+            if self._use_manifests:
+                manifest = save_manifest(projectdir,
+                        sikuli_project_script(projectdir), symbols)
+                if manifest is not None:
+                    self._manifests[projectdir] = manifest
+        self._projects[projectdir] = symbols
+        position = self._projectdirs.index(projectdir)
+        for name, value in symbols.iteritems():
+            if hasattr(self._module, name):
+                _LOGGER.warn('symbol %s="%s" redefined as "%s"',
+                        name, getattr(self._module, name), value)
+                continue
+            for earlierdir in self._index.get(name, []):
+                if self._projectdirs.index(earlierdir) >= position:
+                    break
+                earlier = self._import_project(earlierdir)
+                if name in earlier:
+                    _LOGGER.warn('symbol %s="%s" redefined as "%s"',
+                            name, earlier[name], value)
+                    break
+        return symbols
+
+    def image_info(self, filename):
+        """Returns a tuple (width, height, sha1) of the specified image
+           (an absolute pathname in a Sikuli project), where sha1 is the hex
+           digest of the file contents, or None if the image is not in a
+           project manifest.
+        """
+        self._lock.acquire()
+        try:
+            for manifest in self._manifests.values():
+                if filename in manifest['images']:
+                    return manifest_image_info(manifest, filename)
+        finally:
+            self._lock.release()
+        return None
+
+    def symbols(self):
+        """Returns a sorted list of the symbols found by scanning the Sikuli
+           projects, and of the symbols of imported projects.
+        """
+        self._lock.acquire()
+        try:
+            names = dict.fromkeys(self._index.keys())
+            for symbols in self._projects.values():
+                names.update(dict.fromkeys(symbols.keys()))
+        finally:
+            self._lock.release()
+        names = [name for name in names if not hasattr(self._module, name)]
+        names.sort()
+        return names
 
 __IMPORTED_PROJECTS = []
 
@@ -105,4 +278,10 @@ for sikulidir in SIKULI_DIRS:
     if sikulidir in __IMPORTED_PROJECTS:
         _LOGGER.warn('images from %s already imported', sikulidir)
         continue
-    import_sikuli_project(sikulidir)
+    __IMPORTED_PROJECTS.append(sikulidir)
+
+# the module stays referenced by the LazyProjects instance, so that its
+# globals are not cleared
+sys.modules[__name__] = LazyProjects(sys.modules[__name__],
+        __IMPORTED_PROJECTS,
+        getattr(settings, 'SIKULI_PROJECT_MANIFESTS', True))